@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Benchmark batched estimation requests
+
+Compares one language tool request per page against requests shared
+by batches of pages for n_pages pages taken from OCR fixtures,
+checked by a local stub service which delays each request by
+latency_ms to resemble service overhead. Both must yield the very
+same statistics.
+
+    python -m benchmarks.bench_estimate_batch [n_pages] [batch_size] [latency_ms]
+"""
+
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from lib.ocr_step import (
+    StepEstimateOCR
+)
+from tests.langtool_stub import (
+    LangToolStub
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(PROJECT_DIR, 'tests', 'resources')
+FIXTURES = ['16331001.xml', '16331011.xml', '288652.xml',
+            'OCR-RESULT_0001.xml', 'ram110.xml', '1667524704_J_0173_0173.xml']
+
+
+def _estimate(step, paths):
+    results = []
+    for path in paths:
+        step.reset()
+        step.path_in = path
+        step.execute()
+        results.append(step.statistics)
+    return results
+
+
+def _run(stub, params, paths, batch_size):
+    step = StepEstimateOCR(dict(params, service_url=stub.url))
+    n_requests = stub.n_requests
+    start = time.perf_counter()
+    results = []
+    for i in range(0, len(paths), batch_size):
+        batch = paths[i:i + batch_size]
+        step.prepare_batch(batch)
+        results += _estimate(step, batch)
+    return (results, time.perf_counter() - start, stub.n_requests - n_requests)
+
+
+def main(n_pages=120, batch_size=16, latency_ms=20):
+    """Estimate pages both ways and print throughput"""
+
+    fixtures = itertools.islice(itertools.cycle(FIXTURES), n_pages)
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            LangToolStub(latency=latency_ms / 1000) as stub:
+        # results of batches are kept by path, which differ for pages
+        paths = [shutil.copy(os.path.join(RESOURCES, fixture),
+                             os.path.join(tmp_dir, f"{i:04d}.xml"))
+                 for (i, fixture) in enumerate(fixtures)]
+        (single, t_single, n_single) = _run(stub, {}, paths, 1)
+        (batched, t_batched, n_batched) = _run(
+            stub, {'batch_size': batch_size}, paths, batch_size)
+    assert single == batched
+    print(f"{n_pages} pages, {latency_ms} ms per request")
+    print(f"  per page : {n_pages / t_single:8.1f} pages/s {n_single:6d} requests")
+    print(f"  batched  : {n_pages / t_batched:8.1f} pages/s {n_batched:6d} requests")
+    print(f"  speedup  : {t_single / t_batched:8.2f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
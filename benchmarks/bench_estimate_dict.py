@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Benchmark offline estimation with word list
+
+Compares a set of words each worker builds from a plain text word
+list against the compiled, memory-mapped WordList, which workers
+share, with n_words generated words besides all words of fixture
+pages. Both must count the very same misses per page.
+
+    python -m benchmarks.bench_estimate_dict [n_words] [n_runs]
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import lxml.etree as ET
+
+from lib.ocr_step import (
+    get_lines,
+    textlines2data
+)
+from lib.ocr_words import (
+    TOKEN_EDGES,
+    WordList
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(PROJECT_DIR, 'tests', 'resources')
+FIXTURES = ['500_gray00003.xml', '1667522809_J_0073_0512.xml', '16331001.xml']
+LETTERS = 'abcdefghijklmnopqrstuvwxyzäöüß'
+
+
+def _set_misses(known, tokens):
+    words = [TOKEN_EDGES.sub('', t) for t in tokens]
+    words = [w for w in words if any(c.isalpha() for c in w)]
+    return sum(1 for w in words
+               if w not in known
+               and not (w[0].isupper() and w.lower() in known)
+               and not (w.isupper() and w.capitalize() in known))
+
+
+def _word_list(path, pages, n_words):
+    rnd = random.Random(42)
+    words = {TOKEN_EDGES.sub('', t) for p in pages for t in p.split()}
+    # drop some page words, so there are misses to count
+    words = {w for w in sorted(words) if rnd.random() > 0.1}
+    while len(words) < n_words:
+        words.add(''.join(rnd.choices(LETTERS, k=rnd.randint(3, 14))))
+    with open(path, 'w', encoding='utf-8') as the_file:
+        the_file.write('\n'.join(w for w in words if '/' not in w))
+
+
+def main(n_words=1000000, n_runs=20):
+    """Load word list both ways, estimate pages and print costs"""
+
+    pages = [textlines2data(get_lines(ET.parse(os.path.join(RESOURCES, f))))[0]
+             for f in FIXTURES]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'words.txt')
+        _word_list(path, pages, n_words)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(path, encoding='utf-8') as the_file:
+            known = set(the_file.read().split('\n'))
+        t_set_load = time.perf_counter() - start
+        mb_set = tracemalloc.get_traced_memory()[0] / 2**20
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        path_compiled = WordList(path, tmp_dir).path_compiled
+        t_compile = time.perf_counter() - start
+        start = time.perf_counter()
+        words = WordList(path_compiled)
+        len(words)
+        t_map = time.perf_counter() - start
+        mb_file = os.path.getsize(path_compiled) / 2**20
+
+        print(f"{n_words} words")
+        print(f"  set per worker : load {t_set_load:6.2f} s, {mb_set:6.1f} MiB private")
+        print(f"  compiled once  : {t_compile:6.2f} s, {mb_file:6.1f} MiB shared")
+        print(f"  mapped         : open {t_map * 1e3:6.2f} ms")
+        for (fixture, page) in zip(FIXTURES, pages):
+            tokens = page.split()
+            assert _set_misses(known, tokens) == words.count_misses(tokens)
+            start = time.perf_counter()
+            for _ in range(n_runs):
+                _set_misses(known, tokens)
+            t_set = (time.perf_counter() - start) / n_runs
+            start = time.perf_counter()
+            for _ in range(n_runs):
+                words.count_misses(tokens)
+            t_words = (time.perf_counter() - start) / n_runs
+            print(f"{fixture} ({len(tokens)} words, "
+                  f"{words.count_misses(tokens)} misses)")
+            print(f"  set    : {t_set * 1e3:8.2f} ms")
+            print(f"  mapped : {t_words * 1e3:8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
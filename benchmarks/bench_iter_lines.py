@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Benchmark text line extraction from huge OCR files
+
+Compares get_lines on a fully parsed tree against streaming
+iter_lines for ALTO and PAGE fixtures blown up by n_copies of their
+text blocks or regions. Each variant runs in a fresh process to
+measure its peak memory, which includes the interpreter itself.
+
+    python -m benchmarks.bench_iter_lines [n_copies]
+"""
+
+import copy
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import lxml.etree as ET
+
+from lib.ocr_model import (
+    get_lines,
+    iter_lines
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(PROJECT_DIR, 'tests', 'resources')
+FIXTURES = [('1667522809_J_0073_0512.xml', 'TextBlock'),
+            ('OCR-RESULT_0001.xml', 'TextRegion')]
+
+
+def _blow_up(fixture, block_name, n_copies, path):
+    tree = ET.parse(os.path.join(RESOURCES, fixture))
+    blocks = tree.xpath(f"//*[local-name()='{block_name}']")
+    parent = blocks[0].getparent()
+    for _ in range(n_copies - 1):
+        for block in blocks:
+            parent.append(copy.deepcopy(block))
+    tree.write(path, encoding='UTF-8')
+
+
+def _full_tree(path):
+    return len(get_lines(ET.parse(path)))
+
+
+def _streamed(path):
+    return sum(1 for _ in iter_lines(path))
+
+
+def _measure(func, path):
+    start = time.perf_counter()
+    n_lines = func(path)
+    duration = time.perf_counter() - start
+    rss_peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (n_lines, duration, rss_peak / 1024)
+
+
+def _run_fresh(func, *args):
+    # peak memory is inherited by child processes, therefore
+    # even blowing up fixtures takes a process of its own
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def main(n_copies=40):
+    """Extract lines of blown up fixtures both ways and print costs"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for (fixture, block_name) in FIXTURES:
+            path = os.path.join(tmp_dir, fixture)
+            _run_fresh(_blow_up, fixture, block_name, n_copies, path)
+            (n_full, t_full, mb_full) = _run_fresh(_measure, _full_tree, path)
+            (n_streamed, t_streamed, mb_streamed) = _run_fresh(_measure, _streamed, path)
+            assert n_full == n_streamed
+            print(f"{fixture} x{n_copies} "
+                  f"({os.path.getsize(path) // 2**20} MiB, {n_full} lines)")
+            print(f"  full tree : {t_full:8.2f} s {mb_full:8.1f} MiB peak")
+            print(f"  streamed  : {t_streamed:8.2f} s {mb_streamed:8.1f} MiB peak")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
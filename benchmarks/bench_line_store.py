@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Benchmark keeping text lines of many pages
+
+Compares lists of TextLine objects from get_lines against compact
+LineStore collections for n_pages pages, as batch analysis would
+keep them. Counts Python objects and memory allocated by Python,
+which doesn't even include lxml trees kept alive by the TextLine
+objects, and times textlines2data over all pages.
+
+    python -m benchmarks.bench_line_store [n_pages]
+"""
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import lxml.etree as ET
+
+from lib.ocr_model import (
+    get_lines
+)
+from lib.ocr_step import (
+    textlines2data
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALTO = os.path.join(PROJECT_DIR, 'tests', 'resources', '1667522809_J_0073_0512.xml')
+
+
+def _collect(n_pages, compact):
+    gc.collect()
+    n_objects = len(gc.get_objects())
+    tracemalloc.start()
+    pages = [get_lines(ET.parse(ALTO), compact=compact) for _ in range(n_pages)]
+    gc.collect()
+    (allocated, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    n_objects = len(gc.get_objects()) - n_objects
+    start = time.perf_counter()
+    results = [textlines2data(lines) for lines in pages]
+    duration = time.perf_counter() - start
+    return (pages, results, n_objects, allocated / 2**20, duration)
+
+
+def main(n_pages=200):
+    """Keep lines of n_pages pages both ways and print costs"""
+
+    (pages, results, n_objects, mbytes, duration) = _collect(n_pages, False)
+    del pages
+    print(f"{n_pages} pages of {os.path.basename(ALTO)}")
+    print(f"TextLine lists: {n_objects:9d} objects {mbytes:8.1f} MiB"
+          f" {duration:6.2f} s textlines2data")
+    (pages, results_compact, n_objects, mbytes, duration) = _collect(n_pages, True)
+    assert results_compact == results
+    print(f"LineStore     : {n_objects:9d} objects {mbytes:8.1f} MiB"
+          f" {duration:6.2f} s textlines2data")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Benchmark PAGE coordinate handling
+
+Compares the former per word parsing of Coords, which parsed each
+points string twice, to validate it and to compute its reading order
+sort key, against parsing all points of a line at once into one array,
+for PAGE fixtures with Word level coordinates. Both must yield the
+very same lines.
+
+    python -m benchmarks.bench_page_coords [n_runs]
+"""
+
+import os
+import sys
+import timeit
+
+import lxml.etree as ET
+import numpy as np
+
+from lib.ocr_model import (
+    CLEAR_MARKS,
+    XML_NS,
+    PageLine,
+    _determine_namespace,
+    get_lines,
+    to_center_coords
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(PROJECT_DIR, 'tests', 'resources')
+FIXTURES = ['288652.xml', 'OCR-RESULT_0001.xml']
+
+
+class _FormerPageLine(PageLine):
+    """PageLine as implemented before vectorized coordinates"""
+
+    def set_text(self):
+        texts = []
+        text_els = self.element.findall(f'{self.namespace}:Word', XML_NS)
+        for text_el in text_els:
+            top_left = to_center_coords(text_el, self.namespace, self.vertical)
+            if not top_left:
+                raise RuntimeError(f"Invalid Coords of Word in '{self.element_id}'!")
+            texts.append(text_el)
+        if not text_els:
+            top_left = to_center_coords(self.element, self.namespace, self.vertical)
+            if not top_left:
+                self.valid = False
+                return
+            texts.append(self.element)
+        sorted_els = sorted(
+            texts,
+            key=lambda w: int(to_center_coords(w, self.namespace, self.vertical)))
+        unicodes = [w.find(f'.//{self.namespace}:Unicode', XML_NS)
+                    for w in sorted_els]
+        self.text_words = [u.text.strip() for u in unicodes if u.text]
+        for i, strip in enumerate(self.text_words):
+            for mark in CLEAR_MARKS:
+                if mark in strip:
+                    self.text_words[i] = strip.replace(mark, '')
+
+    def get_shape(self, element):
+        p_attr = element.find(
+            f'{self.namespace}:Coords',
+            XML_NS).attrib['points']
+        numbers = [int(n) for pair in p_attr.split() for n in pair.split(',')]
+        points = list(zip(*[iter(numbers)] * 2))
+        return np.array((points), dtype=np.uint32)
+
+
+def _build(line_class, elements, ns_prefix):
+    return [line_class(element, ns_prefix, False) for element in elements]
+
+
+def _same(lines, others):
+    return len(lines) == len(others) and all(
+        a.element_id == b.element_id
+        and a.get_textline_content() == b.get_textline_content()
+        and np.array_equal(a.shape, b.shape)
+        for (a, b) in zip(lines, others))
+
+
+def main(n_runs=50):
+    """Extract lines of each fixture n_runs times both ways and print costs"""
+
+    for fixture in FIXTURES:
+        tree = ET.parse(os.path.join(RESOURCES, fixture))
+        ns_prefix = _determine_namespace(tree)
+        # both variants build lines from the very same elements
+        elements = [line.element for line in get_lines(tree)]
+        assert _same(_build(_FormerPageLine, elements, ns_prefix),
+                     _build(PageLine, elements, ns_prefix))
+        t_former = timeit.timeit(
+            lambda: _build(_FormerPageLine, elements, ns_prefix), number=n_runs)
+        t_vector = timeit.timeit(
+            lambda: _build(PageLine, elements, ns_prefix), number=n_runs)
+        print(f"{fixture} ({len(elements)} lines)")
+        print(f"  per word   : {t_former / n_runs * 1e3:8.2f} ms")
+        print(f"  vectorized : {t_vector / n_runs * 1e3:8.2f} ms")
+        print(f"  speedup    : {t_former / t_vector:8.2f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the postprocessing chain of a single page
+
+Compares StepPostReplaceChars, StepPostprocessALTO and
+StepEstimateOCR each reading and writing the ALTO file on their
+own against all three sharing a single OCRDocument. Estimation
+runs without language tool, which answers with no matches.
+
+    python -m benchmarks.bench_post_chain [n_pages] [alto_file]
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from lib.ocr_step import (
+    OCRDocument,
+    StepEstimateOCR,
+    StepPostprocessALTO,
+    StepPostReplaceChars
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALTO = os.path.join(PROJECT_DIR, 'tests', 'resources', '16331011.xml')
+
+
+class _OfflineEstimation(StepEstimateOCR):
+
+    def enabled(self):
+        return True
+
+    def request_data(self, params):
+        return {'matches': []}
+
+
+def _chain():
+    return [StepPostReplaceChars({'dict_chars': "{'ſ': 's', 'ic)': 'ich'}"}),
+            StepPostprocessALTO(),
+            _OfflineEstimation({})]
+
+
+def _run(steps, path, template, shared):
+    shutil.copyfile(template, path)
+    document = OCRDocument(path) if shared else None
+    for step in steps:
+        step.reset()
+        step.path_in = path
+        step.document = document
+        step.execute()
+    if document is not None:
+        document.save()
+
+
+def main(n_pages=200, alto=ALTO):
+    """Run both variants n_pages times and print per-page costs"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, os.path.basename(alto))
+        steps = _chain()
+        t_alone = timeit.timeit(lambda: _run(steps, path, alto, False),
+                                number=n_pages)
+        with open(path, 'rb') as alone:
+            result_alone = alone.read()
+        t_shared = timeit.timeit(lambda: _run(steps, path, alto, True),
+                                 number=n_pages)
+        with open(path, 'rb') as shared:
+            assert shared.read() == result_alone
+
+    print(f"steps read/write each: {t_alone / n_pages * 1e3:8.2f} ms")
+    print(f"shared OCRDocument   : {t_shared / n_pages * 1e3:8.2f} ms")
+    print(f"speedup              : {t_alone / t_shared:8.2f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:2]], *sys.argv[2:3])
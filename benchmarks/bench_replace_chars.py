@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Benchmark StepPostReplaceChars with large rule tables
+
+Compares the former loop over all lines and keys of the raw XML
+against one trie-shaped regular expression applied to String/@CONTENT
+only, for n_rules generated historic typography fixes besides the
+usual ones.
+
+    python -m benchmarks.bench_replace_chars [n_rules] [n_pages]
+"""
+
+import itertools
+import os
+import sys
+import timeit
+
+import lxml.etree as ET
+
+from lib.ocr_step import (
+    StepPostReplaceChars
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ALTO = os.path.join(PROJECT_DIR, 'tests', 'resources', '500_gray00003.xml')
+RULES = {'ſ': 's', 'ic)': 'ich', 's&lt;': 'sc', '&lt;': 'c'}
+LETTERS = 'abcdefghiklmnoprstuvwzäöüß'
+
+
+def _rules(n_rules):
+    rules = dict(RULES)
+    for (first, second) in itertools.product(LETTERS, repeat=2):
+        if len(rules) >= n_rules:
+            break
+        rules[f"{first}ſ{second}"] = f"{first}s{second}"
+    return rules
+
+
+def _replace_lines(dict_chars, lines):
+    lines_new = []
+    for line in lines:
+        for (k, val) in dict_chars.items():
+            if k in line:
+                line = line.replace(k, val)
+        lines_new.append(line)
+    return lines_new
+
+
+def main(n_rules=400, n_pages=20):
+    """Run both variants n_pages times and print per-page costs"""
+
+    rules = _rules(n_rules)
+    with open(ALTO, encoding='utf-8') as alto:
+        lines = alto.readlines()
+    tree = ET.parse(ALTO)
+    step = StepPostReplaceChars({'dict_chars': rules})
+
+    t_lines = timeit.timeit(lambda: _replace_lines(rules, lines),
+                            number=n_pages)
+    t_content = timeit.timeit(lambda: (step.reset(), step._replace(tree)),
+                              number=n_pages)
+
+    print(f"{len(rules)} rules")
+    print(f"lines x keys      : {t_lines / n_pages * 1e3:8.2f} ms")
+    print(f"single pattern    : {t_content / n_pages * 1e3:8.2f} ms")
+    print(f"speedup           : {t_lines / t_content:8.2f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
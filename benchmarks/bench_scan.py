@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Benchmark collecting and locking inputs of a synthetic scandata tree
+
+Compares the former os.walk with a directory listing per matching
+file, followed by a listing per file for locking, against the
+single-pass scanner with inputs grouped by directory.
+
+    python -m benchmarks.bench_scan [n_files] [files_per_dir]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from ocr_pipeline import (
+    OCRPipeline
+)
+
+MARK_OPEN = 'ocr_pipeline_open'
+
+
+def _create_tree(root, n_files, per_dir):
+    for i_dir in range(n_files // per_dir):
+        the_dir = os.path.join(root, f"issue{i_dir // 10:04d}", f"scans{i_dir:06d}")
+        os.makedirs(the_dir)
+        # every other dir is open for processing
+        if i_dir % 2 == 0:
+            open(os.path.join(the_dir, MARK_OPEN), 'w', encoding='UTF-8').close()
+        for i_file in range(per_dir):
+            open(os.path.join(the_dir, f"{i_file:05d}.jpg"), 'wb').close()
+
+
+def _legacy(root):
+    paths = sorted(os.path.join(curr, f)
+                   for curr, _, files in os.walk(root)
+                   for f in files
+                   if f.endswith('jpg') and MARK_OPEN in os.listdir(curr))
+    for path in paths:
+        _ = [f.name for f in os.scandir(os.path.dirname(path))]
+    return paths
+
+
+def _scanner(pipeline):
+    paths = pipeline.input_sorted(recursive=True)
+    for dir_name in pipeline.paths_by_dir():
+        _ = os.listdir(dir_name)
+    return paths
+
+
+def main(n_files=100000, per_dir=500):
+    """Run both variants once on tree with n_files and print timings"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = os.path.join(tmp_dir, 'scans')
+        _create_tree(root, n_files, per_dir)
+        pipeline = OCRPipeline(root, log_dir=os.path.join(tmp_dir, 'log'))
+        pipeline.cfg['pipeline']['file_ext'] = 'jpg'
+        pipeline.cfg['pipeline']['mark_open'] = MARK_OPEN
+
+        t_start = time.perf_counter()
+        legacy_paths = _legacy(root)
+        t_legacy = time.perf_counter() - t_start
+        t_start = time.perf_counter()
+        scanned_paths = _scanner(pipeline)
+        t_scanner = time.perf_counter() - t_start
+
+    assert legacy_paths == scanned_paths
+    print(f"files / inputs         : {n_files} / {len(scanned_paths)}")
+    print(f"walk + listdir per file: {t_legacy:8.3f} s")
+    print(f"single-pass scanner    : {t_scanner:8.3f} s")
+    print(f"speedup                : {t_legacy / t_scanner:8.1f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
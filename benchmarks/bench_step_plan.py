@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""Benchmark per-page orchestration overhead of step creation
+
+Compares creating all configured steps again for each page
+against resetting a compiled StepPlan re-used by the worker.
+
+    python -m benchmarks.bench_step_plan [n_pages]
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+
+from ocr_pipeline import (
+    OCRPipeline
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = os.path.join(PROJECT_DIR, 'tests', 'resources', 'ocr_config_full.ini')
+
+
+def _prepare(the_steps, path_in):
+    the_steps[0].path_in = path_in
+    return the_steps[0].cmd
+
+
+def main(n_pages=10000):
+    """Run both variants n_pages times and print per-page costs"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_in = os.path.join(tmp_dir, '0001.tif')
+        with open(path_in, 'wb') as img:
+            img.write(b'II*\x00')
+        pipeline = OCRPipeline(tmp_dir, conf_file=CONFIG,
+                               log_dir=os.path.join(tmp_dir, 'log'))
+        plan = pipeline.get_step_plan()
+
+        t_steps = timeit.timeit(lambda: _prepare(pipeline.get_steps(), path_in),
+                                number=n_pages)
+        t_plan = timeit.timeit(lambda: _prepare(plan.reset(), path_in),
+                               number=n_pages)
+
+    print(f"get_steps() per page : {t_steps / n_pages * 1e6:8.1f} µs")
+    print(f"StepPlan.reset()     : {t_plan / n_pages * 1e6:8.1f} µs")
+    print(f"speedup              : {t_steps / t_plan:8.1f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
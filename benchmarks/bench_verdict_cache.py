@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Benchmark verdict cache of estimation
+
+Compares sending each page's text to the language tool against
+sending only tokens without cached verdict for n_pages pages taken
+from OCR fixtures in turn, checked by a local stub service which
+delays each request by latency_ms. Statistics of both must be the
+very same. Since fixtures repeat after each round, numbers of first
+round, with all pages distinct, are printed too.
+
+    python -m benchmarks.bench_verdict_cache [n_pages] [latency_ms]
+"""
+
+import itertools
+import os
+import sys
+import time
+
+from lib.ocr_step import (
+    StepEstimateOCR
+)
+from tests.langtool_stub import (
+    LangToolStub
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(PROJECT_DIR, 'tests', 'resources')
+FIXTURES = ['500_gray00003.xml', '1667522809_J_0073_0512.xml',
+            '16331001.xml', '16331011.xml', '288652.xml',
+            'OCR-RESULT_0001.xml', 'ram110.xml']
+
+
+def _run(stub, params, paths):
+    step = StepEstimateOCR(dict(params, service_url=stub.url))
+    (n_requests, n_chars) = (stub.n_requests, stub.n_chars)
+    start = time.perf_counter()
+    results = []
+    for path in paths:
+        step.reset()
+        step.path_in = path
+        step.execute()
+        results.append(step.statistics)
+    return (results, time.perf_counter() - start,
+            stub.n_requests - n_requests, stub.n_chars - n_chars, step.counters)
+
+
+def _report(label, n_pages, duration, n_requests, n_chars):
+    print(f"  {label:9}: {n_pages / duration:8.1f} pages/s "
+          f"{n_requests:6d} requests {n_chars:9d} chars")
+
+
+def main(n_pages=70, latency_ms=20):
+    """Estimate pages with and without verdict cache and print costs"""
+
+    fixtures = [os.path.join(RESOURCES, f) for f in FIXTURES]
+    paths = list(itertools.islice(itertools.cycle(fixtures), n_pages))
+    with LangToolStub(latency=latency_ms / 1000) as stub:
+        for (label, pages) in [('first round', paths[:len(fixtures)]),
+                               (f"{n_pages} pages", paths)]:
+            (plain, t_plain, n_plain, c_plain, _) = _run(stub, {}, pages)
+            (cached, t_cached, n_cached, c_cached, counters) = _run(
+                stub, {'verdict_cache_size': 100000}, pages)
+            assert plain == cached
+            n_hits = counters['verdict_hit']
+            rate = n_hits / (n_hits + counters['verdict_miss']) * 100
+            print(f"{label}, {latency_ms} ms per request, hit rate {rate:.1f}%")
+            _report('pages', len(pages), t_plain, n_plain, c_plain)
+            _report('verdicts', len(pages), t_cached, n_cached, c_cached)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
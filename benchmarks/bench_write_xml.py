@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Benchmark writing ALTO files
+
+Compares the former serialize, reparse and serialize round trip
+against write_xml_file, which drops blank text in place and
+serializes only once, on the largest ALTO fixtures. Both must
+produce the very same bytes.
+
+    python -m benchmarks.bench_write_xml [n_writes]
+"""
+
+import copy
+import os
+import sys
+import tempfile
+import timeit
+
+import lxml.etree as ET
+
+from lib.ocr_step import (
+    _format_xml_reparsed,
+    write_xml_file
+)
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(PROJECT_DIR, 'tests', 'resources')
+FIXTURES = ['500_gray00003.xml',
+            '1667522809_J_0073_0512.xml',
+            '16331001.xml']
+
+
+def _write_reparsed(xml_root, outfile):
+    formatted_file_content = _format_xml_reparsed(xml_root).replace(b'\n', b'\r\n')
+    with open(outfile, 'wb') as file_handler:
+        file_handler.write(formatted_file_content)
+
+
+def _measure(write, tree, path, n_writes):
+    # fresh copy each time, since write_xml_file alters its tree
+    trees = [copy.deepcopy(tree) for _ in range(n_writes)]
+    return timeit.timeit(lambda: write(trees.pop(), path), number=n_writes)
+
+
+def main(n_writes=50):
+    """Write each fixture n_writes times both ways and print costs"""
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'out.xml')
+        for fixture in FIXTURES:
+            tree = ET.parse(os.path.join(RESOURCES, fixture))
+            t_reparsed = _measure(_write_reparsed, tree, path, n_writes)
+            with open(path, 'rb') as reparsed:
+                result_reparsed = reparsed.read()
+            t_single = _measure(write_xml_file, tree, path, n_writes)
+            with open(path, 'rb') as single:
+                assert single.read() == result_reparsed
+            print(f"{fixture} ({len(result_reparsed) // 1024} KiB)")
+            print(f"  round trip  : {t_reparsed / n_writes * 1e3:8.2f} ms")
+            print(f"  single pass : {t_single / n_writes * 1e3:8.2f} ms")
+            print(f"  speedup     : {t_reparsed / t_single:8.2f}x")
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
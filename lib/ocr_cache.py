@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Content addressed Cache for OCR Results and Cache for Verdicts
+of language tool on single tokens"""
+
+import collections
+import hashlib
+import os
+import shutil
+import sqlite3
+import sys
+
+# bytes read at once when hashing images
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# verdicts kept in memory of each worker
+DEFAULT_VERDICT_ENTRIES = 100000
+# seconds to wait for database locked by other workers
+VERDICT_DB_TIMEOUT = 30
+# tokens looked up with single query, below limit of older SQLite
+VERDICT_DB_CHUNK = 900
+
+
+def hash_file(path):
+    """SHA-256 hex digest of file contents"""
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as the_file:
+        for block in iter(lambda: the_file.read(HASH_BLOCK_SIZE), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class OCRResultCache():
+    """Cache OCR results by image contents and engine fingerprint
+
+    Entries are copied rather than hard-linked in both directions,
+    since later steps rewrite their input files in place and would
+    otherwise alter cached entries, too. Last access is tracked by
+    modification time, which gets refreshed with each hit, so the
+    least recently used entries are evicted first.
+    """
+
+    def __init__(self, cache_dir, max_mb=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = int(float(max_mb) * 1024 * 1024) if max_mb else None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, path_image, fingerprint):
+        """Cache key from image contents and engine fingerprint"""
+
+        sha = hashlib.sha256(hash_file(path_image).encode('ascii'))
+        sha.update(fingerprint.encode('utf-8'))
+        return sha.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.xml')
+
+    def fetch(self, key, path_target):
+        """Copy cached entry to path_target, if present
+
+        Returns:
+            bool: cache hit or not
+        """
+
+        path_entry = self._entry(key)
+        try:
+            copy_atomic(path_entry, path_target)
+            os.utime(path_entry)
+        except OSError:
+            # missing or evicted meanwhile
+            return False
+        return True
+
+    def store(self, key, path_source):
+        """Put copy of path_source into cache"""
+
+        path_entry = self._entry(key)
+        os.makedirs(os.path.dirname(path_entry), exist_ok=True)
+        copy_atomic(path_source, path_entry)
+
+    def evict(self):
+        """Drop least recently used entries until cache fits
+        into configured size
+
+        Returns:
+            int: number of dropped entries
+        """
+
+        if not self.max_bytes:
+            return 0
+        entries = []
+        total = 0
+        for sub_dir in os.scandir(self.cache_dir):
+            if not sub_dir.is_dir():
+                continue
+            for entry in os.scandir(sub_dir.path):
+                if entry.name.endswith('.xml'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        n_dropped = 0
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            n_dropped += 1
+        return n_dropped
+
+
+def copy_atomic(path_source, path_target):
+    """Copy into temporary file next to target first, so
+    readers never see partially written files"""
+
+    path_tmp = f"{path_target}.{os.getpid()}.tmp"
+    try:
+        shutil.copyfile(path_source, path_tmp)
+        os.replace(path_tmp, path_target)
+    except OSError:
+        if os.path.exists(path_tmp):
+            os.unlink(path_tmp)
+        raise
+
+
+class VerdictCache():
+    """Keep verdicts of language tool for single tokens, that is
+    their number of matches, least recently used evicted first in
+    memory of each worker and, optionally, in SQLite database shared
+    by all workers
+
+    Verdicts depend on language and enabled rules, which therefore
+    make up scope of entries.
+    """
+
+    def __init__(self, scope, max_entries=None, path_db=None):
+        self.scope = scope
+        self.max_entries = int(max_entries) if max_entries else DEFAULT_VERDICT_ENTRIES
+        self.path_db = path_db
+        self._entries = collections.OrderedDict()
+        self._db = None
+
+    def __getstate__(self):
+        # connections are bound to the process that opened them
+        state = self.__dict__.copy()
+        state['_db'] = None
+        return state
+
+    def __len__(self):
+        return len(self._entries)
+
+    def fetch(self, tokens):
+        """Verdicts of tokens known so far
+
+        Returns:
+            dict(str, int): number of matches for each known token
+        """
+
+        found = {}
+        missing = []
+        for token in tokens:
+            if token in self._entries:
+                self._entries.move_to_end(token)
+                found[token] = self._entries[token]
+            else:
+                missing.append(token)
+        if missing and self.path_db:
+            try:
+                from_db = self._select(missing)
+            except sqlite3.Error as exc:
+                self._drop_db(exc)
+                from_db = {}
+            self._remember(from_db)
+            found.update(from_db)
+        return found
+
+    def store(self, verdicts):
+        """Keep verdicts, a dict of tokens and their matches"""
+
+        self._remember(verdicts)
+        if verdicts and self.path_db:
+            try:
+                with self._connect() as the_db:
+                    the_db.executemany(
+                        'INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?)',
+                        [(self.scope, t, n) for (t, n) in verdicts.items()])
+            except sqlite3.Error as exc:
+                self._drop_db(exc)
+
+    def _remember(self, verdicts):
+        self._entries.update(verdicts)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _connect(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path_db, timeout=VERDICT_DB_TIMEOUT)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS verdicts ('
+                             'scope TEXT, token TEXT, n_matches INTEGER, '
+                             'PRIMARY KEY (scope, token)) WITHOUT ROWID')
+        return self._db
+
+    def _select(self, tokens):
+        the_db = self._connect()
+        found = {}
+        for i in range(0, len(tokens), VERDICT_DB_CHUNK):
+            chunk = tokens[i:i + VERDICT_DB_CHUNK]
+            marks = ','.join('?' * len(chunk))
+            found.update(the_db.execute(
+                'SELECT token, n_matches FROM verdicts '
+                f'WHERE scope = ? AND token IN ({marks})', [self.scope] + chunk))
+        return found
+
+    def _drop_db(self, exc):
+        # keep going with verdicts in memory only
+        print(f"[WARN ] verdict cache '{self.path_db}' disabled: {exc}",
+              file=sys.stderr)
+        if self._db is not None:
+            self._db.close()
+        self._db = None
+        self.path_db = None
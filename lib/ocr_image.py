@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Image Header Inspection without decoding Image Data"""
+
+import struct
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SOI = b'\xff\xd8'
+TIFF_HEADERS = {b'II*\x00': '<', b'MM\x00*': '>'}
+# JPEG start of frame markers, excluding DHT, JPG and DAC
+JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+            0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+TIFF_WIDTH = 256
+TIFF_HEIGHT = 257
+
+
+def image_size(path):
+    """Read (width, height) from PNG, JPEG or TIFF header
+
+    Returns:
+        tuple(int, int): width and height or None, if header
+                         is unknown or can't be read
+    """
+
+    try:
+        with open(path, 'rb') as img:
+            head = img.read(8)
+            if head == PNG_SIGNATURE:
+                return _png_size(img)
+            if head[:2] == JPEG_SOI:
+                img.seek(2)
+                return _jpeg_size(img)
+            if head[:4] in TIFF_HEADERS:
+                order = TIFF_HEADERS[head[:4]]
+                (ifd_offset,) = struct.unpack(order + 'I', head[4:])
+                return _tiff_size(img, order, ifd_offset)
+    except (OSError, struct.error):
+        return None
+    return None
+
+
+def image_pixels(path):
+    """Number of pixels, if header can be read, otherwise None"""
+
+    size = image_size(path)
+    if size:
+        return size[0] * size[1]
+    return None
+
+
+def _png_size(img):
+    # IHDR must be first chunk: length, type, width, height
+    (_, chunk_type, width, height) = struct.unpack('>I4sII', img.read(16))
+    if chunk_type != b'IHDR':
+        return None
+    return (width, height)
+
+
+def _jpeg_size(img):
+    while True:
+        byte = img.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = img.read(1)
+        # skip fill bytes
+        while marker == b'\xff':
+            marker = img.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        # standalone markers without length
+        if code == 0x01 or 0xD0 <= code <= 0xD9:
+            continue
+        (length,) = struct.unpack('>H', img.read(2))
+        if code in JPEG_SOF:
+            (_, height, width) = struct.unpack('>BHH', img.read(5))
+            return (width, height)
+        img.seek(length - 2, 1)
+
+
+def _tiff_size(img, order, ifd_offset):
+    # first IFD only, which holds the main image
+    img.seek(ifd_offset)
+    (n_entries,) = struct.unpack(order + 'H', img.read(2))
+    dims = {}
+    for _ in range(n_entries):
+        (tag, tag_type, _, value) = struct.unpack(order + 'HHI4s', img.read(12))
+        if tag in (TIFF_WIDTH, TIFF_HEIGHT):
+            if tag_type == 3:
+                dims[tag] = struct.unpack(order + 'H', value[:2])[0]
+            else:
+                dims[tag] = struct.unpack(order + 'I', value)[0]
+    if TIFF_WIDTH in dims and TIFF_HEIGHT in dims:
+        return (dims[TIFF_WIDTH], dims[TIFF_HEIGHT])
+    return None
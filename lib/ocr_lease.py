@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""Crash-safe Leases for Directories shared between Hosts"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+
+DEFAULT_LEASE_NAME = 'ocr_pipeline_lease'
+DEFAULT_LEASE_TTL = 600
+
+
+class DirectoryLease():
+    """Exclusive lease of a directory
+
+    A lease is a small file created with O_EXCL, which is atomic even
+    on NFS (v3+), so only one worker on any host can create it. It
+    records host, pid and a heartbeat, which the holder must refresh
+    before ttl seconds pass. If the holder crashed, the lease expires
+    and any other worker may take it over.
+
+    Heartbeats are judged by the clocks of the involved hosts,
+    therefore they should be synchronized.
+    """
+
+    def __init__(self, dir_path, name=DEFAULT_LEASE_NAME, ttl=DEFAULT_LEASE_TTL):
+        self.dir_path = dir_path
+        self.path = os.path.join(dir_path, name)
+        self.ttl = float(ttl)
+        self.token = uuid.uuid4().hex
+        self.held = False
+        # taken over by others while held
+        self.lost = False
+
+    def _record(self):
+        return {'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'token': self.token,
+                'heartbeat': time.time()}
+
+    def read(self, path=None):
+        """Current lease record, None if missing or unreadable"""
+
+        try:
+            with open(path or self.path, 'r', encoding='UTF-8') as l_file:
+                return json.loads(l_file.read())
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self, record=None):
+        """Is lease expired, since heartbeat wasn't refreshed?"""
+
+        if record is None:
+            record = self.read()
+        if record is None:
+            # vanished or not yet completely written
+            return False
+        return record.get('heartbeat', 0) + self.ttl < time.time()
+
+    def acquire(self):
+        """Create lease or take over expired one
+
+        Returns:
+            bool: lease held now
+        """
+
+        try:
+            fd_lease = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            if self._take_over():
+                return self.acquire()
+            return False
+        with os.fdopen(fd_lease, 'w', encoding='UTF-8') as l_file:
+            l_file.write(json.dumps(self._record()))
+        self.held = True
+        return True
+
+    def _take_over(self):
+        """Move expired lease aside, which only one contender
+        can do, since rename of same source is atomic"""
+
+        if not self.is_stale():
+            return False
+        path_stale = f"{self.path}.{self.token}"
+        try:
+            os.rename(self.path, path_stale)
+        except FileNotFoundError:
+            return False
+        # someone else took over in between and moved
+        # a fresh lease aside, so put it back
+        if not self.is_stale(self.read(path_stale)):
+            try:
+                os.link(path_stale, self.path)
+            except FileExistsError:
+                pass
+            os.unlink(path_stale)
+            return False
+        os.unlink(path_stale)
+        return True
+
+    def refresh(self):
+        """Renew heartbeat of held lease
+
+        Errors reading the lease other than it's absence are
+        raised, since they don't tell anything about the holder.
+
+        Returns:
+            bool: lease still held
+        """
+
+        if not self.held:
+            return False
+        try:
+            with open(self.path, 'r', encoding='UTF-8') as l_file:
+                record = json.loads(l_file.read())
+        except (FileNotFoundError, ValueError):
+            # moved aside or just created by someone else
+            record = None
+        if record is None or record.get('token') != self.token:
+            # taken over, since heartbeat came too late
+            self.held = False
+            self.lost = True
+            return False
+        path_tmp = f"{self.path}.{self.token}.tmp"
+        with open(path_tmp, 'w', encoding='UTF-8') as l_file:
+            l_file.write(json.dumps(self._record()))
+        os.replace(path_tmp, self.path)
+        return True
+
+    def release(self):
+        """Drop lease, if still held"""
+
+        if self.held:
+            record = self.read()
+            if record is not None and record.get('token') == self.token:
+                os.unlink(self.path)
+            self.held = False
+
+
+class LeaseKeeper(threading.Thread):
+    """Refresh heartbeats of all given leases in background
+
+    Failed refreshes and lost leases are reported to logger,
+    if given, otherwise to stderr.
+    """
+
+    def __init__(self, leases, interval, logger=None):
+        super().__init__(name='lease-keeper', daemon=True)
+        self.leases = leases
+        self.interval = interval
+        self.logger = logger
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            for lease in list(self.leases):
+                self._refresh(lease)
+
+    def _refresh(self, lease):
+        """Refresh single lease, failed ones are tried again next time"""
+
+        was_held = lease.held
+        try:
+            lease.refresh()
+        except OSError as exc:
+            self._warn(f"refresh lease '{lease.path}' failed, retry: {exc}")
+            return
+        if was_held and lease.lost:
+            self._warn(f"lease '{lease.path}' lost to {lease.read()}")
+
+    def _warn(self, msg):
+        if self.logger is not None:
+            self.logger.warning(msg)
+        else:
+            print(f"[WARN ] {msg}", file=sys.stderr)
+
+    def stop(self):
+        """Stop refreshing"""
+
+        self._stopped.set()
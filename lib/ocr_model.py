@@ -6,10 +6,13 @@ from functools import (
     reduce
 )
 from typing import (
+    Iterator,
     List,
+    NamedTuple,
     Tuple
 )
 
+import lxml.etree as ET
 import numpy as np
 
 # namespaces of different OCR-Formats
@@ -57,6 +60,11 @@ class TextLine(abc.ABC):
         """Return TextLine shape
         """
 
+    @property
+    def bbox(self) -> Tuple[int, int, int, int]:
+        """Left, top, right and bottom of shape"""
+        return _shape_bbox(self.shape)
+
     def get_textline_content(self) -> str:
         """
         Set TextLine contents from it's included word tokens
@@ -103,6 +111,8 @@ class PageLine(TextLine):
 
     def __init__(self, element, namespace, reorder):
         super().__init__(element, namespace)
+        # points of line coords, if already parsed
+        self._points = None
         self.set_id()
         self.set_text()
         if self.valid:
@@ -119,30 +129,28 @@ class PageLine(TextLine):
         * print lines without coords
         """
 
-        texts = []
         text_els = self.element.findall(f'{self.namespace}:Word', XML_NS)
-        for text_el in text_els:
-            top_left = to_center_coords(text_el, self.namespace, self.vertical)
-            if not top_left:
-                elem_id = text_el.attrib['id']
+        # if no Word assume at least TextLine exists
+        texts = text_els if text_els else [self.element]
+        (points, offsets) = parse_points(
+            [_points_attr(t, self.namespace) for t in texts])
+        n_points = np.diff(offsets)
+        if not n_points.all():
+            elem_id = texts[int(np.flatnonzero(n_points == 0)[0])].attrib['id']
+            if text_els:
                 msg = f"Invalid Coords of Word '{elem_id}' in '{self.element_id}'!"
                 raise RuntimeError(msg)
-            texts.append(text_el)
-
-        # if no Word assume at least TextLine exists
+            print("[ERROR  ] skip '{}': invalid coords!".format(
+                elem_id), file=sys.stderr)
+            self.valid = False
+            return
         if not text_els:
-            top_left = to_center_coords(self.element, self.namespace, self.vertical)
-            if not top_left:
-                elem_id = self.element.attrib['id']
-                print("[ERROR  ] skip '{}': invalid coords!".format(
-                    elem_id), file=sys.stderr)
-                self.valid = False
-                return
-            texts.append(self.element)
-
-        sorted_els = sorted(
-            texts,
-            key=lambda w: int(to_center_coords(w, self.namespace, self.vertical)))
+            self._points = points
+
+        # sort keys computed at once from centers of all texts
+        centers = np.add.reduceat(points, offsets[:-1], axis=0) / n_points[:, None]
+        keys = centers[:, 1 if self.vertical else 0].astype(np.int64)
+        sorted_els = [texts[i] for i in np.argsort(keys, kind='stable')]
         unicodes = [
             w.find(
                 f'.//{self.namespace}:Unicode',
@@ -160,17 +168,37 @@ class PageLine(TextLine):
     def get_shape(self, element):
         """
         Coordinate data from current OCR-D-Workflows can contain
-        lots of points, therefore additional calculations are required
+        lots of points, therefore parsed vectorized, if not already
+        done for determining reading order
         """
 
-        p_attr = element.find(
-            f'{self.namespace}:Coords',
-            XML_NS).attrib['points']
-        numbers = [int(n) for pair in p_attr.split() for n in pair.split(',')]
+        points = self._points if element is self.element else None
+        if points is None:
+            (points, _) = parse_points([_points_attr(element, self.namespace)])
+        return points.astype(np.uint32)
+
 
-        # group clustering idiom
-        points = list(zip(*[iter(numbers)] * 2))
-        return np.array((points), dtype=np.uint32)
+def _points_attr(elem, namespace:str) -> str:
+    return elem.find(f'{namespace}:Coords', XML_NS).attrib['points']
+
+
+def parse_points(points_attrs:List[str]) -> Tuple:
+    """Parse textual represented coordinates 'x1,y1 x2,y2 ...' of
+    many elements at once into one array
+
+    Returns:
+        tuple(np.ndarray, np.ndarray): all points as (n, 2) array
+        and offsets of each element's points plus end offset
+    """
+
+    n_numbers = [len(p.replace(',', ' ').split()) for p in points_attrs]
+    numbers = np.fromstring(' '.join(points_attrs).replace(',', ' '),
+                            dtype=np.int64, sep=' ')
+    if numbers.size != sum(n_numbers) or any(n % 2 for n in n_numbers):
+        raise ValueError(f"invalid points in {points_attrs}")
+    offsets = np.zeros(len(points_attrs) + 1, dtype=np.int64)
+    np.cumsum(n_numbers, out=offsets[1:])
+    return (numbers.reshape(-1, 2), offsets // 2)
 
 
 def _determine_namespace(xml_data) -> List[str]:
@@ -180,11 +208,8 @@ def _determine_namespace(xml_data) -> List[str]:
 
 def coords_center(coord_tokens) -> Tuple:
     """Get Point-Pairs from textual represented coordinates"""
-    vals = [int(b)
-            for a in map(lambda e: e.split(','), coord_tokens)
-            for b in a]
-    point_pairs = list(zip(*[iter(vals)]*2))
-    return tuple(map(lambda c: sum(c) / len(c), zip(*point_pairs)))
+    (points, _) = parse_points([' '.join(coord_tokens)])
+    return tuple(float(c) for c in points.mean(axis=0))
 
 
 def to_center_coords(elem, namespace:str, vertical:bool=False):
@@ -200,8 +225,8 @@ def to_center_coords(elem, namespace:str, vertical:bool=False):
     return None
 
 
-def get_lines(xml_data, min_len:int=2, reorder:bool=False) -> List[TextLine]:
-    """Create text_lines from OCR-Data"""
+def get_lines(xml_data, min_len:int=2, reorder:bool=False, compact:bool=False):
+    """Create text_lines from OCR-Data, as LineStore if compact"""
 
     _text_lines = []
     ns_prefix = _determine_namespace(xml_data)
@@ -211,7 +236,10 @@ def get_lines(xml_data, min_len:int=2, reorder:bool=False) -> List[TextLine]:
         _text_lines = get_page_lines(xml_data, ns_prefix, min_len, reorder)
 
     # proceed only valid lines
-    return [t for t in _text_lines if t.valid]
+    valid_lines = [t for t in _text_lines if t.valid]
+    if compact:
+        return LineStore.from_lines(valid_lines)
+    return valid_lines
 
 
 def get_alto_lines(xml_data, ns_prefix:str, min_len:int) -> List[ALTOLine]:
@@ -243,3 +271,191 @@ def get_page_lines(xml_data, ns_prefix:str, min_len:int, reorder:bool) -> List[P
                 msg = f"{base_path}: just words for line '{textline.attrib['id']}'"
                 raise RuntimeError(msg)
     return [PageLine(line, ns_prefix, reorder) for line in matchings]
+
+
+class StreamedLine(NamedTuple):
+    """Line data kept from a streamed OCR file, without any element"""
+
+    element_id: str
+    text: str
+    # left, top, right, bottom
+    bbox: Tuple[int, int, int, int]
+
+    def get_textline_content(self) -> str:
+        """Line contents like TextLine.get_textline_content"""
+        return self.text
+
+
+def iter_lines(source, min_len:int=2, reorder:bool=False) -> Iterator[StreamedLine]:
+    """Stream valid text lines from OCR file or file object
+
+    Yields the same lines as get_lines, but parses incrementally and
+    drops each line's element and everything before it as soon as
+    its data is taken, so memory stays flat even for huge files.
+    Format is determined by namespace of TextLine elements.
+    """
+
+    line_tags = [f'{{{uri}}}TextLine' for uri in XML_NS.values()]
+    ns_prefixes = {tag: prefix for (tag, prefix) in zip(line_tags, XML_NS)}
+    for (_, element) in ET.iterparse(source, events=('end',), tag=line_tags):
+        ns_prefix = ns_prefixes[element.tag]
+        if 'alto' in ns_prefix:
+            line = _stream_alto_line(element, min_len)
+        else:
+            line = _stream_page_line(element, ns_prefix, min_len, reorder, source)
+        _drop_parsed(element)
+        if line is not None:
+            yield line
+
+
+def _stream_alto_line(element, min_len):
+    words = [s.attrib['CONTENT'] for s in element.iterchildren(
+        element.tag[:-len('TextLine')] + 'String')]
+    text = ' '.join(words)
+    if len(text) < min_len:
+        return None
+    x_1 = int(element.attrib['HPOS'])
+    y_1 = int(element.attrib['VPOS'])
+    bbox = (x_1, y_1, x_1 + int(element.attrib['WIDTH']),
+            y_1 + int(element.attrib['HEIGHT']))
+    return StreamedLine(element.attrib['ID'], text, bbox)
+
+
+def _stream_page_line(element, ns_prefix, min_len, reorder, source):
+    text_equiv = element.find(f'{ns_prefix}:TextEquiv/{ns_prefix}:Unicode', XML_NS)
+    if text_equiv is not None and text_equiv.text:
+        stripped = text_equiv.text.strip()
+        if not stripped or len(stripped) < min_len:
+            return None
+    else:
+        words = element.findall(
+            f'{ns_prefix}:Word/{ns_prefix}:TextEquiv/{ns_prefix}:Unicode', XML_NS)
+        if words:
+            base_path = source if isinstance(source, str) else getattr(source, 'name', 'n.a.')
+            msg = f"{base_path}: just words for line '{element.attrib['id']}'"
+            raise RuntimeError(msg)
+        return None
+    page_line = PageLine(element, ns_prefix, reorder)
+    if not page_line.valid:
+        return None
+    return StreamedLine(page_line.element_id,
+                        page_line.get_textline_content(),
+                        page_line.bbox)
+
+
+def _drop_parsed(element):
+    """Clear element and remove all completely parsed elements
+    before it, so only its ancestors are kept"""
+
+    element.clear()
+    node = element
+    while node is not None:
+        parent = node.getparent()
+        if parent is not None:
+            while node.getprevious() is not None:
+                del parent[0]
+        node = parent
+
+
+class LineStore():
+    """Compact collection of text lines
+
+    Instead of an object per line, all ids and texts are held in one
+    string buffer each, delimited by an offsets array, and all
+    bounding boxes in one (n, 4) array of left, top, right, bottom.
+    Items are LineView objects created on access, which offer the
+    TextLine reading API.
+    """
+
+    __slots__ = ('_ids', '_id_offsets', '_texts', '_text_offsets', 'bboxes')
+
+    def __init__(self, ids:List[str], texts:List[str], bboxes):
+        self._ids = ''.join(ids)
+        self._id_offsets = _offsets(ids)
+        self._texts = ''.join(texts)
+        self._text_offsets = _offsets(texts)
+        self.bboxes = np.array(bboxes, dtype=np.int32).reshape(-1, 4)
+
+    @classmethod
+    def from_lines(cls, lines) -> 'LineStore':
+        """Collect TextLine objects or StreamedLine records"""
+
+        ids = []
+        texts = []
+        bboxes = []
+        for line in lines:
+            ids.append(line.element_id)
+            texts.append(line.get_textline_content())
+            bboxes.append(line.bbox)
+        return cls(ids, texts, bboxes)
+
+    def element_id(self, index:int) -> str:
+        """Identifier of line at index"""
+        return self._ids[self._id_offsets[index]:self._id_offsets[index + 1]]
+
+    def text(self, index:int) -> str:
+        """Contents of line at index"""
+        return self._texts[self._text_offsets[index]:self._text_offsets[index + 1]]
+
+    def texts(self) -> List[str]:
+        """Contents of all lines"""
+        offsets = self._text_offsets.tolist()
+        return [self._texts[start:end] for (start, end) in zip(offsets, offsets[1:])]
+
+    def __len__(self):
+        return len(self._text_offsets) - 1
+
+    def __getitem__(self, index:int) -> 'LineView':
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return LineView(self, index)
+
+    def __iter__(self) -> Iterator['LineView']:
+        return (LineView(self, index) for index in range(len(self)))
+
+
+class LineView():
+    """Single line of LineStore"""
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store:LineStore, index:int):
+        self.store = store
+        self.index = index
+
+    @property
+    def element_id(self) -> str:
+        """Identifier of line"""
+        return self.store.element_id(self.index)
+
+    @property
+    def text(self) -> str:
+        """Contents of line"""
+        return self.store.text(self.index)
+
+    @property
+    def bbox(self) -> Tuple[int, int, int, int]:
+        """Left, top, right and bottom of line"""
+        return tuple(self.store.bboxes[self.index].tolist())
+
+    def get_textline_content(self) -> str:
+        """Line contents like TextLine.get_textline_content"""
+        return self.text
+
+    def __repr__(self):
+        return 'LineView[{}]:{}'.format(self.element_id, self.text)
+
+
+def _offsets(strings:List[str]):
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    return offsets
+
+
+def _shape_bbox(shape) -> Tuple[int, int, int, int]:
+    points = np.asarray(shape)
+    (left, top) = points.min(axis=0)
+    (right, bottom) = points.max(axis=0)
+    return (int(left), int(top), int(right), int(bottom))
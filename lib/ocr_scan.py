@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Single-pass Scanner of Scandata Directories"""
+
+import os
+
+
+class ScanDir():
+    """Images and names of all files within a directory,
+    collected with a single os.scandir call"""
+
+    def __init__(self, path):
+        self.path = path
+        self.images = []
+        self.names = set()
+
+    def image_paths(self):
+        """Sorted paths of all images"""
+
+        return [os.path.join(self.path, name) for name in sorted(self.images)]
+
+
+def scan_dir(path, exts):
+    """Inspect directory once, collecting file names, images
+    by given file extensions and sub directories to descend
+
+    Returns:
+        tuple(ScanDir, list(str)): directory and sub directory paths
+    """
+
+    the_dir = ScanDir(path)
+    sub_dirs = []
+    exts = tuple(exts)
+    with os.scandir(path) as entries:
+        for entry in entries:
+            the_dir.names.add(entry.name)
+            if entry.is_dir():
+                # like os.walk, don't follow linked dirs
+                if not entry.is_symlink():
+                    sub_dirs.append(entry.path)
+            elif entry.name.endswith(exts):
+                the_dir.images.append(entry.name)
+    return (the_dir, sub_dirs)
+
+
+def scan_tree(root, exts):
+    """Yield ScanDir for root and all directories below top-down"""
+
+    pending = [root]
+    while pending:
+        (the_dir, sub_dirs) = scan_dir(pending.pop(), exts)
+        yield the_dir
+        pending.extend(sorted(sub_dirs, reverse=True))
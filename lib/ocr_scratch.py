@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""Staging of Inputs and Outputs on local Scratch Space"""
+
+import collections
+import concurrent.futures
+import os
+import shutil
+
+from lib.ocr_cache import (
+    copy_atomic
+)
+
+# inputs copied ahead of processing
+DEFAULT_PREFETCH = 4
+
+
+def scratch_path(scratch_dir, number, path):
+    """Local path of numbered input within scratch_dir
+
+    Each input gets a directory of its own, so all intermediate
+    files of a page can be dropped at once afterwards
+    """
+
+    return os.path.join(scratch_dir, f"{number:06d}", os.path.basename(path))
+
+
+def stage_in(scratch_dir, number, path):
+    """Copy input into scratch_dir, unless prefetched before
+
+    Copies take over size and modification time of input,
+    so a leftover of another input with same number and
+    name is never mistaken for a prefetched one.
+    """
+
+    path_local = scratch_path(scratch_dir, number, path)
+    stat = os.stat(path)
+    try:
+        stat_local = os.stat(path_local)
+        if (stat_local.st_size, stat_local.st_mtime_ns) == (stat.st_size,
+                                                            stat.st_mtime_ns):
+            return path_local
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path_local), exist_ok=True)
+    copy_atomic(path, path_local)
+    os.utime(path_local, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    return path_local
+
+
+def stage_out(path_local, path_target):
+    """Move result from scratch space to target, which becomes
+    visible only when completely written"""
+
+    copy_atomic(path_local, path_target)
+    os.unlink(path_local)
+
+
+def release(scratch_dir, number):
+    """Drop all files of numbered input from scratch_dir"""
+
+    shutil.rmtree(os.path.join(scratch_dir, f"{number:06d}"),
+                  ignore_errors=True)
+
+
+def clear(scratch_dir):
+    """Drop files of all inputs from scratch_dir"""
+
+    for entry in os.listdir(scratch_dir):
+        shutil.rmtree(os.path.join(scratch_dir, entry), ignore_errors=True)
+
+
+def prefetch(chunks, scratch_dir, depth, executor):
+    """Yield chunks of numbered inputs while copying up to
+    depth inputs ahead into scratch_dir
+
+    Failed copies are ignored here, since workers
+    stage missing inputs themselves and report errors.
+    """
+
+    pending = collections.deque()
+    n_ahead = 0
+    for chunk in chunks:
+        copies = [executor.submit(stage_in, scratch_dir, number, path)
+                  for (number, path) in chunk]
+        pending.append((chunk, copies))
+        n_ahead += len(chunk)
+        while pending and n_ahead - len(pending[0][0]) >= depth:
+            (ready, copies) = pending.popleft()
+            n_ahead -= len(ready)
+            concurrent.futures.wait(copies)
+            yield ready
+    while pending:
+        (ready, copies) = pending.popleft()
+        concurrent.futures.wait(copies)
+        yield ready
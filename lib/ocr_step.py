@@ -1,11 +1,20 @@
 # -*- coding: utf-8 -*-
 """ULB OCR Pipeline Steps API"""
 
+import bisect
+import contextlib
+import json
 import os
 import re
+import resource
+import shlex
 import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import time
+import xml.sax.saxutils
 
 from abc import (
     ABC, abstractmethod
@@ -23,19 +32,92 @@ from typing import (
 import lxml.etree as ET
 import requests
 
+# optional in-process tesseract engine
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
 # custom imports
+from lib.ocr_cache import (
+    OCRResultCache,
+    VerdictCache
+)
 from lib.ocr_model import (
     get_lines,
+    iter_lines,
+    LineStore,
     TextLine
 )
+from lib.ocr_words import (
+    WordList
+)
 
 
 NAMESPACES = {'alto': 'http://www.loc.gov/standards/alto/ns-v3#'}
 
+# whether any element sets whitespace handling by xml:space
+XML_SPACE_USED = ET.XPath('boolean(descendant-or-self::*/@xml:space)')
+
 # defaults language tool
 DEFAULT_LANGTOOL_URL = 'http://localhost:8010'
 DEFAULT_LANGTOOL_LANG = 'de-DE'
 DEFAULT_LANGTOOL_RULE = 'GERMAN_SPELLER_RULE'
+# seconds to wait for connection and response
+DEFAULT_LANGTOOL_TIMEOUT_CONNECT = 3.05
+DEFAULT_LANGTOOL_TIMEOUT_READ = 60.0
+# seconds a service state is trusted, pause after failures
+# doubles with each further failure up to max
+DEFAULT_LANGTOOL_HEALTH_TTL = 60.0
+DEFAULT_LANGTOOL_HEALTH_MAX = 600.0
+# characters packed into one request of batched pages, which
+# is the limit of the public service, and their separator
+DEFAULT_LANGTOOL_BATCH_CHARS = 20000
+LANGTOOL_BATCH_SEPARATOR = '\n\n'
+# separator of single tokens checked for verdict cache
+LANGTOOL_TOKEN_SEPARATOR = ' '
+
+# estimation backends: language tool service or word list
+BACKEND_LANGTOOL = 'languagetool'
+BACKEND_DICTIONARY = 'dictionary'
+
+# tesseract engines
+ENGINE_CLI = 'cli'
+ENGINE_API = 'api'
+
+# stages of staged execution: CPU-bound recognition,
+# light XML postprocessing and network-bound estimation
+STAGE_OCR = 'ocr'
+STAGE_POST = 'post'
+STAGE_QA = 'qa'
+STAGES = [STAGE_OCR, STAGE_POST, STAGE_QA]
+
+# ALTO document frame as written by tesseract's ALTO renderer
+# around each page, which differs between major releases
+ALTO_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n' \
+    '<alto xmlns="http://www.loc.gov/standards/alto/ns-v3#" ' \
+    'xmlns:xlink="http://www.w3.org/1999/xlink" ' \
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ' \
+    'xsi:schemaLocation="http://www.loc.gov/standards/alto/ns-v3# ' \
+    'http://www.loc.gov/alto/v3/alto-3-0.xsd">\n' \
+    '\t<Description>\n' \
+    '\t\t<MeasurementUnit>pixel</MeasurementUnit>\n' \
+    '\t\t<sourceImageInformation>\n' \
+    '\t\t\t<fileName>{file_name}</fileName>\n' \
+    '\t\t</sourceImageInformation>\n' \
+    '\t\t<OCRProcessing ID="OCR_0">\n' \
+    '\t\t\t<ocrProcessingStep>\n' \
+    '\t\t\t\t<processingSoftware>\n' \
+    '{software}' \
+    '\t\t\t\t</processingSoftware>\n' \
+    '\t\t\t</ocrProcessingStep>\n' \
+    '\t\t</OCRProcessing>\n' \
+    '\t</Description>\n' \
+    '\t<Layout>\n'
+ALTO_SOFTWARE_V4 = '\t\t\t\t\t<softwareName>tesseract {version}</softwareName>\n'
+ALTO_SOFTWARE_V5 = '\t\t\t\t\t<softwareName>Tesseract</softwareName>\n' \
+    '\t\t\t\t\t<softwareVersion>{version}</softwareVersion>\n'
+ALTO_TAIL = '\t</Layout>\n</alto>\n'
 
 
 def split_path(path_in):
@@ -62,10 +144,33 @@ class StepException(Exception):
 class StepI(ABC):
     """step that handles input data"""
 
+    # executor stage, if steps are run staged
+    stage = STAGE_OCR
+    # works on contents of OCRDocument, which may be shared
+    uses_document = False
+    document = None
+
     @abstractmethod
     def execute(self):
         """Step Action to execute"""
 
+    def reset(self):
+        """Drop per-page state before step gets re-used for next input"""
+
+        self.document = None
+
+    @contextlib.contextmanager
+    def _document(self):
+        """Document shared with other steps of page, otherwise
+        document of its own, which is saved afterwards"""
+
+        if self.document is not None and self.document.path == self.path_in:
+            yield self.document
+        else:
+            document = OCRDocument(self.path_in)
+            yield document
+            document.save()
+
     @property
     def path_in(self):
         """Input data path"""
@@ -115,9 +220,62 @@ class StepIOExtern(StepIO):
         except ValueError as exc:
             msg = f'Invalid Dictionary for arguments provided: "{exc.args[0]}" !'
             raise StepException(msg) from exc
+        # wall-clock seconds, cpu seconds and address space MB
+        # per call, which kill any runaway call if exceeded
+        self.timeout = self._pop_number('timeout')
+        self.limit_cpu = self._pop_number('limit_cpu')
+        self.limit_mem = self._pop_number('limit_mem')
+
+    def _pop_number(self, key):
+        val = self._params.pop(key, None)
+        if val is None or str(val).strip() == '':
+            return None
+        return float(val)
 
     def execute(self):
-        subprocess.run(self.cmd, shell=True, check=True)
+        self._run(self.args)
+
+    def _run(self, args, timeout=None, limit_cpu=None):
+        """Execute args without shell and turn any failure,
+        timeout or exceeded resource limit into StepException"""
+
+        if timeout is None:
+            timeout = self.timeout
+        if limit_cpu is None:
+            limit_cpu = self.limit_cpu
+        limits = None
+        if limit_cpu or self.limit_mem:
+            def limits():
+                self._limit_resources(limit_cpu)
+        try:
+            subprocess.run(args, check=True, timeout=timeout,
+                           preexec_fn=limits)
+        except subprocess.TimeoutExpired as exc:
+            raise StepException(
+                f"'{args[0]}' killed after {timeout:g}s timeout") from exc
+        except subprocess.CalledProcessError as exc:
+            reason = f"exit code {exc.returncode}"
+            if exc.returncode < 0:
+                reason = f"signal {signal.Signals(-exc.returncode).name}"
+            raise StepException(f"'{args[0]}' failed with {reason}") from exc
+
+    def _limit_resources(self, limit_cpu=None):
+        """Runs in child process right before exec"""
+
+        if limit_cpu is None:
+            limit_cpu = self.limit_cpu
+        if limit_cpu:
+            cpu_secs = int(limit_cpu)
+            # soft limit signals SIGXCPU, hard limit kills
+            resource.setrlimit(resource.RLIMIT_CPU, (cpu_secs, cpu_secs + 1))
+        if self.limit_mem:
+            mem_bytes = int(self.limit_mem * 1024 * 1024)
+            resource.setrlimit(resource.RLIMIT_AS, (mem_bytes, mem_bytes))
+
+    @property
+    def args(self):
+        """return cmdline as argument list for execution"""
+        return shlex.split(self.cmd)
 
     @property
     def cmd(self):
@@ -140,6 +298,26 @@ class StepTesseract(StepIOExtern):
             del self._params['tesseract_bin']
         if 'path_out_dir' in self._params:
             self._path_out_dir = self._params['path_out_dir']
+        # number of pages recognized with single tesseract call
+        self.batch_size = int(self._params.pop('batch_size', 1))
+        self._batch_done = set()
+        # in-process engine keeps models loaded between pages
+        self.engine = self._params.pop('engine', ENGINE_CLI)
+        if self.engine == ENGINE_API and tesserocr is None:
+            print("[WARN ] tesserocr not available, use tesseract cli",
+                  file=sys.stderr)
+            self.engine = ENGINE_CLI
+        self._api = None
+        self._api_init = None
+        # content addressed cache of results
+        self._cache = None
+        self._cache_keys = {}
+        self._engine_version = None
+        self.counters = {}
+        cache_dir = self._params.pop('cache_dir', None)
+        cache_size = self._params.pop('cache_size', None)
+        if cache_dir:
+            self._cache = OCRResultCache(cache_dir, cache_size)
 
         # common process params
         # where to store alto data, dpi and language
@@ -169,6 +347,199 @@ class StepTesseract(StepIOExtern):
         final = ' '.join(sorted(set(output_configs + outputs)))
         self._params.update({final: None})
         self._params.move_to_end(final)
+        # only ALTO can be split into pages afterwards
+        # or be created with in-process engine
+        if final != 'alto':
+            self.batch_size = 1
+            self.engine = ENGINE_CLI
+            self._cache = None
+        if self.engine == ENGINE_API:
+            # check params once rather than failing each page
+            try:
+                self._api_init = self._api_args()
+                self.batch_size = 1
+            except StepException as exc:
+                print(f"[WARN ] {exc.args[0]}, use tesseract cli",
+                      file=sys.stderr)
+                self.engine = ENGINE_CLI
+
+    def __getstate__(self):
+        # engine handles are bound to the process that created them
+        state = self.__dict__.copy()
+        state['_api'] = None
+        return state
+
+    def execute(self):
+        # already recognized with previous batch
+        if self.path_in in self._batch_done:
+            self._batch_done.remove(self.path_in)
+            return
+        cache_key = self._cache_keys.pop(self.path_in, None)
+        if self._cache and cache_key is None:
+            cache_key = self._cache.key(self.path_in, self.engine_fingerprint)
+            if self._from_cache(cache_key):
+                return
+        if self.engine == ENGINE_API:
+            self._execute_api()
+        else:
+            super().execute()
+        if cache_key:
+            self._cache.store(cache_key, self.path_next)
+
+    @property
+    def cache(self):
+        """Result cache, if configured"""
+        return self._cache
+
+    @property
+    def engine_fingerprint(self):
+        """Engine version and params, which determine results"""
+
+        if self._engine_version is None:
+            self._engine_version = self._get_engine_version()
+        return f"{self._engine_version}|{self.engine}|{dict2line(self._params, ' ')}"
+
+    def _get_engine_version(self):
+        if self.engine == ENGINE_API:
+            return tesserocr.tesseract_version().splitlines()[0]
+        try:
+            result = subprocess.run([self._bin, '--version'], capture_output=True,
+                                    check=True, text=True, timeout=60)
+        except (OSError, subprocess.SubprocessError) as exc:
+            raise StepException(f"'{self._bin}' version unknown: {exc}") from exc
+        # older releases print version to stderr
+        return (result.stdout or result.stderr).strip().splitlines()[0]
+
+    def _from_cache(self, cache_key):
+        """Try to fetch result for current path_in from cache"""
+
+        if self._cache.fetch(cache_key, self.path_next):
+            try:
+                # entry names image it was first created from
+                set_alto_file_name(self.path_next, self.path_in)
+            except (OSError, ET.XMLSyntaxError):
+                self._count('cache_miss')
+                return False
+            self._count('cache_hit')
+            return True
+        self._count('cache_miss')
+        return False
+
+    def _count(self, name):
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    def _execute_api(self):
+        """Recognize with warm tesseract API of current process
+        and frame page like tesseract cli does"""
+
+        api = self._get_api()
+        try:
+            api.SetImageFile(self.path_in)
+            page = api.GetAltoText(0)
+        except RuntimeError as exc:
+            raise StepException(f"{self.path_in}: {exc}") from exc
+        if page is None:
+            raise StepException(f"{self.path_in}: no ALTO result")
+        version = api.Version()
+        software = ALTO_SOFTWARE_V4 if version.startswith('4.') else ALTO_SOFTWARE_V5
+        alto = ALTO_HEAD.format(file_name=self.path_in,
+                                software=software.format(version=version))
+        with open(self.path_next, 'w', encoding='utf-8') as alto_file:
+            alto_file.write(alto + page + ALTO_TAIL)
+
+    def _get_api(self):
+        """Create tesseract API with models on first use only"""
+
+        if self._api is None:
+            kwargs, variables = self._api_init
+            self._api = tesserocr.PyTessBaseAPI(**kwargs)
+            for name, val in variables.items():
+                self._api.SetVariable(name, val)
+        return self._api
+
+    def _api_args(self):
+        """Translate tesseract cli params into API init args
+        and variables"""
+
+        params = OrderedDict(self._params)
+        params.popitem()
+        tokens = shlex.split(dict2line(params, ' '))
+        kwargs = {}
+        variables = {}
+        while tokens:
+            token = tokens.pop(0)
+            try:
+                if token == '-l':
+                    kwargs['lang'] = tokens.pop(0)
+                elif token == '--tessdata-dir':
+                    kwargs['path'] = tokens.pop(0)
+                elif token == '--psm':
+                    kwargs['psm'] = int(tokens.pop(0))
+                elif token == '--oem':
+                    kwargs['oem'] = int(tokens.pop(0))
+                elif token == '--dpi':
+                    variables['user_defined_dpi'] = tokens.pop(0)
+                elif token == '-c':
+                    (name, val) = tokens.pop(0).split('=', 1)
+                    variables[name] = val
+                else:
+                    raise StepException(f"param '{token}' not supported by engine {ENGINE_API}")
+            except (IndexError, ValueError) as exc:
+                raise StepException(f"param '{token}' invalid for engine {ENGINE_API}") from exc
+        return (kwargs, variables)
+
+    def prepare_batch(self, paths):
+        """Recognize all paths with single tesseract call, thus
+        loading models only once, and split result into ALTO
+        files for each page at their path_next
+
+        If the batch call fails, only pages taken from cache are
+        marked as done, so each other page will be recognized on
+        it's own afterwards and a single bad page can't spoil all
+        other pages
+
+        Returns:
+            list(str): paths recognized within batch or from cache
+        """
+
+        self._batch_done = set()
+        self._cache_keys = {}
+        paths = [str(p) for p in paths]
+        if self.batch_size < 2 or len(paths) < 2:
+            return []
+        todos = []
+        for path in paths:
+            self.path_in = path
+            if self._cache:
+                cache_key = self._cache.key(path, self.engine_fingerprint)
+                if self._from_cache(cache_key):
+                    self._batch_done.add(path)
+                    continue
+                self._cache_keys[path] = cache_key
+            todos.append((path, self.path_next))
+        if len(todos) > 1:
+            self._recognize_batch([t[0] for t in todos], [t[1] for t in todos])
+            for (path, path_next) in todos:
+                self._batch_done.add(path)
+                if path in self._cache_keys:
+                    self._cache.store(self._cache_keys.pop(path), path_next)
+        return [p for p in paths if p in self._batch_done]
+
+    def _recognize_batch(self, paths, paths_next):
+        with tempfile.TemporaryDirectory(prefix='ocr-batch-') as tmp_dir:
+            path_list = os.path.join(tmp_dir, 'batch.txt')
+            with open(path_list, 'w', encoding='utf-8') as list_file:
+                list_file.write('\n'.join(paths) + '\n')
+            out_file = os.path.join(tmp_dir, 'batch')
+            args = [self._bin, path_list, out_file] + self._param_args()
+            # limits apply to whole batch
+            timeout = self.timeout * len(paths) if self.timeout else None
+            limit_cpu = self.limit_cpu * len(paths) if self.limit_cpu else None
+            try:
+                self._run(args, timeout, limit_cpu)
+                split_alto_pages(out_file + '.xml', paths, paths_next)
+            except (OSError, ET.XMLSyntaxError) as exc:
+                raise StepException(f"batch of {len(paths)} failed: {exc}") from exc
 
     @property
     def path_next(self):
@@ -184,16 +555,60 @@ class StepTesseract(StepIOExtern):
             self._path_next = os.path.join(self._path_in_dir, _filename)
         return self._path_next
 
+    def _param_args(self):
+        return shlex.split(dict2line(self._params, ' '))
+
+    @property
+    def args(self):
+        """
+        Update Arguments with specific in/output paths
+        """
+        out_file = os.path.splitext(self.path_next)[0]
+        return [self._bin, self.path_in, out_file] + self._param_args()
+
     @property
     def cmd(self):
         """
         Update Command with specific in/output paths
         """
-        out_file = os.path.splitext(self.path_next)[0]
-        self._cmd = f"{self._bin} {self.path_in} {out_file} {dict2line(self._params, ' ')}"
+        self._cmd = shlex.join(self.args)
         return self._cmd
 
 
+def split_alto_pages(path_alto, paths_in, paths_out):
+    """Split multi-page ALTO from tesseract batch into single page
+    files with same Page attributes and sourceImageInformation
+    like single image tesseract calls create them"""
+
+    xml_root = ET.parse(path_alto)
+    layout = xml_root.find('.//{*}Layout')
+    pages = layout.findall('{*}Page') if layout is not None else []
+    if len(pages) != len(paths_out):
+        raise StepException(
+            f"expect {len(paths_out)} pages in '{path_alto}', got {len(pages)}")
+    for page in pages:
+        layout.remove(page)
+    file_name = xml_root.find('.//{*}sourceImageInformation/{*}fileName')
+    for page, path_in, path_out in zip(pages, paths_in, paths_out):
+        page.attrib['PHYSICAL_IMG_NR'] = '0'
+        page.attrib['ID'] = 'page_0'
+        if file_name is not None:
+            file_name.text = str(path_in)
+        layout.append(page)
+        write_xml_file(xml_root, path_out)
+        layout.remove(page)
+
+
+def set_alto_file_name(path_alto, path_in):
+    """Let sourceImageInformation of ALTO name path_in"""
+
+    xml_root = ET.parse(path_alto)
+    file_name = xml_root.find('.//{*}sourceImageInformation/{*}fileName')
+    if file_name is not None and file_name.text != str(path_in):
+        file_name.text = str(path_in)
+        write_xml_file(xml_root, path_alto)
+
+
 def parse_dict(the_dict):
     """parse dictionary from string without worrying about proper json syntax"""
     if isinstance(the_dict, str):
@@ -207,33 +622,85 @@ def parse_dict(the_dict):
     return {}
 
 
+def literal_pattern(literals):
+    """Compile literals into a single regular expression, which
+    matches the longest literal at each position
+
+    Literals are arranged as trie, so common prefixes are tested
+    only once, which keeps matching fast for hundreds of literals.
+    """
+
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return re.compile(_trie_pattern(trie))
+
+
+def _trie_pattern(node):
+    alternatives = [re.escape(char) + _trie_pattern(sub)
+                    for (char, sub) in node.items() if char]
+    if not alternatives:
+        return ''
+    if '' in node:
+        # literal may end here, but prefer longer ones
+        return '(?:' + '|'.join(alternatives) + ')?'
+    if len(alternatives) == 1:
+        return alternatives[0]
+    return '(?:' + '|'.join(alternatives) + ')'
+
+
+def _unescape_xml(text):
+    return xml.sax.saxutils.unescape(text, {'&quot;': '"', '&apos;': "'"})
+
+
 class StepPostReplaceChars(StepIO):
-    """Postprocess: Replace suspicious character sequences"""
+    """Postprocess: Replace suspicious character sequences
+
+    Replacements are applied to the text of String/@CONTENT only,
+    all at once with the longest matching sequence winning.
+    Sequences may be given escaped as in raw XML, like '&lt;'.
+    """
+
+    stage = STAGE_POST
+    uses_document = True
 
     def __init__(self, params: Dict):
         super().__init__()
         dict_chars = params.get('dict_chars', '{}')
         self.dict_chars = parse_dict(dict_chars)
-        self.lines_new = []
         self._replacements = {}
         self._must_backup = params.get('must_backup', False)
+        # unescaped sequence => (configured key, replacement)
+        self._rules = {_unescape_xml(k): (k, _unescape_xml(v))
+                       for (k, v) in self.dict_chars.items() if k}
+        self._pattern = literal_pattern(self._rules) if self._rules else None
+        # count keys in configured order
+        self._ranks = {seq: rank for (rank, seq) in enumerate(self._rules)}
+
+    def reset(self):
+        super().reset()
+        self._replacements = {}
 
     def must_backup(self):
         """Determine if Backup file must be written"""
         return str(self._must_backup).upper() == 'TRUE'
 
     def execute(self):
-        file_handle = open(self.path_in, 'r', encoding='utf-8')
-        lines = file_handle.readlines()
-        file_handle.close()
-        self._replace(lines)
-
-        # if replacements are done, backup original file
-        if self._replacements and self.must_backup():
-            self._backup()
-        fhandle = open(self.path_in, 'w', encoding='utf-8')
-        _ = [fhandle.write(line) for line in self.lines_new]
-        fhandle.close()
+        with self._document() as document:
+            changes = self._replace(document.tree())
+            if not changes:
+                return
+
+            # if replacements are done, backup original file
+            if self.must_backup():
+                document.save()
+                self._backup()
+            for (element, content) in changes:
+                element.set('CONTENT', content)
+            document.mark_changed()
 
     def _backup(self):
         dir_name = os.path.dirname(self.path_in)
@@ -242,13 +709,31 @@ class StepPostReplaceChars(StepIO):
         out_path = os.path.join(dir_name, label + '_before_' + clazz + '.xml')
         shutil.copyfile(self.path_in, out_path)
 
-    def _replace(self, lines):
-        for line in lines:
-            for (k, val) in self.dict_chars.items():
-                if k in line:
-                    line = line.replace(k, val)
-                    self._update_replacements(k)
-            self.lines_new.append(line)
+    def _replace(self, xml_root):
+        """Determine new contents of String elements and count
+        each replaced key once per element
+
+        Returns:
+            list: (element, new content) pairs
+        """
+
+        changes = []
+        if self._pattern is None:
+            return changes
+        for element in xml_root.iter('{*}String'):
+            content = element.get('CONTENT')
+            if not content:
+                continue
+            found = self._pattern.findall(content)
+            if not found:
+                continue
+            changes.append((element, self._pattern.sub(self._substitute, content)))
+            for seq in sorted(set(found), key=self._ranks.get):
+                self._update_replacements(self._rules[seq][0])
+        return changes
+
+    def _substitute(self, match):
+        return self._rules[match.group()][1]
 
     def _set_path_out(self):
         return self.path_in
@@ -270,31 +755,96 @@ class StepPostReplaceChars(StepIO):
         return []
 
 
+class RegexRule():
+    """Replace old by new inside each match of pattern, restricted
+    to its first group, if pattern has any"""
+
+    def __init__(self, pattern, old, new):
+        self.regex = re.compile(pattern)
+        self.old = old
+        self.new = new
+        self._group = 1 if self.regex.groups else 0
+        # 'match=>replacement' => number of replacements
+        self.counts = {}
+
+    def apply(self, text):
+        """Text with all matches replaced"""
+
+        return self.regex.sub(self._substitute, text)
+
+    def _substitute(self, match):
+        found = match.group(self._group)
+        if found is None:
+            # optional group not part of match
+            return match.group()
+        replacement = found.replace(self.old, self.new)
+        if replacement == found:
+            return match.group()
+        key = found + '=>' + replacement
+        self.counts[key] = self.counts.get(key, 0) + 1
+        (start, end) = match.span(self._group)
+        offset = match.start()
+        whole = match.group()
+        return whole[:start - offset] + replacement + whole[end - offset:]
+
+
+def parse_rules(the_rules):
+    """parse table of [pattern, old, new] rules from JSON string"""
+    if isinstance(the_rules, str):
+        the_rules = json.loads(the_rules)
+    return [tuple(rule) for rule in the_rules]
+
+
 class StepPostReplaceCharsRegex(StepPostReplaceChars):
-    """Postprocess: Replace via regular expressions"""
+    """Postprocess: Replace via regular expressions
+
+    Takes either a single pattern, old and new or a table of such
+    rules, which are compiled once and applied one after another
+    to every match within String/@CONTENT.
+    """
 
     def __init__(self, params: Dict):
         super().__init__({})
-        self.pattern = params['pattern']
-        self.old = params['old']
-        self.new = params['new']
-        self.lines_new = []
-
-    def _replace(self, lines):
-        for line in lines:
-            # for string_element in self.regex_replacements:
-            matcher = re.search(self.pattern, line)
-            if matcher:
-                match = matcher.group(1)
-                replacement = match.replace(self.old, self.new)
-                line = line.replace(match, replacement)
-                self._update_replacements(match + '=>' + replacement)
-            self.lines_new.append(line)
+        self.pattern = params.get('pattern')
+        self.old = params.get('old')
+        self.new = params.get('new')
+        rules = parse_rules(params.get('rules', []))
+        if self.pattern is not None:
+            rules.insert(0, (self.pattern, self.old, self.new))
+        if not rules:
+            raise StepException("no 'pattern' or 'rules' provided!")
+        self.rules = [RegexRule(*rule) for rule in rules]
+
+    def reset(self):
+        super().reset()
+        for rule in self.rules:
+            rule.counts = {}
+
+    def _replace(self, xml_root):
+        changes = []
+        for element in xml_root.iter('{*}String'):
+            content = element.get('CONTENT')
+            if not content:
+                continue
+            replaced = content
+            for rule in self.rules:
+                replaced = rule.apply(replaced)
+            if replaced != content:
+                changes.append((element, replaced))
+        return changes
+
+    @property
+    def statistics(self):
+        """Replacements per rule"""
+        return [':'.join([k, str(v)])
+                for rule in self.rules for k, v in rule.counts.items()]
 
 
 class StepPostMoveAlto(StepIO):
     """Postprocess: move Alto file to original scandata folder"""
 
+    stage = STAGE_POST
+
     def __init__(self, params: Dict):
         super().__init__()
         if 'path_target' in params:
@@ -317,6 +867,8 @@ class StepPostMoveAlto(StepIO):
 class StepPostRemoveFile(StepI):
     """Cleanup and remove temporal TIF-Files before they flood the Discs"""
 
+    stage = STAGE_POST
+
     def __init__(self, params: Dict):
         super().__init__()
         self._file_removed = False
@@ -328,6 +880,10 @@ class StepPostRemoveFile(StepI):
             os.remove(self.path_in)
             self._file_removed = True
 
+    def reset(self):
+        super().reset()
+        self._file_removed = False
+
     def is_removed(self):
         """Was File Removed?"""
 
@@ -335,13 +891,61 @@ class StepPostRemoveFile(StepI):
 
 
 class StepEstimateOCR(StepI):
-    """Estimate OCR-Quality of current run by using Web-Service language-tool"""
+    """Estimate OCR-Quality of current run by using Web-Service language-tool
+    or, offline and in-process, by looking up words in word list"""
+
+    stage = STAGE_QA
+    uses_document = True
 
     def __init__(self, params: Dict):
         super().__init__()
+        self.backend = params.get('backend', BACKEND_LANGTOOL)
+        self.words = None
+        if self.backend == BACKEND_DICTIONARY:
+            if 'dictionary' not in params:
+                raise StepException(f"backend '{self.backend}' requires 'dictionary'")
+            try:
+                self.words = WordList(params['dictionary'],
+                                      params.get('dictionary_cache'))
+            except OSError as exc:
+                raise StepException(f"invalid dictionary: {exc}") from exc
+        elif self.backend != BACKEND_LANGTOOL:
+            raise StepException(f"unknown backend '{self.backend}'")
         self.service_url = params.get('service_url', DEFAULT_LANGTOOL_URL)
         self.lang = params.get('language', DEFAULT_LANGTOOL_LANG)
         self.rules = params.get('enabled_rules', DEFAULT_LANGTOOL_RULE)
+        self.timeout = (
+            float(params.get('timeout_connect', DEFAULT_LANGTOOL_TIMEOUT_CONNECT)),
+            float(params.get('timeout_read', DEFAULT_LANGTOOL_TIMEOUT_READ)))
+        self.health_ttl = float(params.get('health_ttl', DEFAULT_LANGTOOL_HEALTH_TTL))
+        # number of pages checked with shared requests
+        self.batch_size = int(params.get('batch_size', 1))
+        self.batch_chars = int(params.get('batch_chars', DEFAULT_LANGTOOL_BATCH_CHARS))
+        self._batch_done = {}
+        # verdicts of single tokens, if cached
+        self.verdicts = None
+        cache_size = params.get('verdict_cache_size')
+        cache_db = params.get('verdict_cache_db')
+        if self.words is None and (cache_size or cache_db):
+            self.verdicts = VerdictCache(f"{self.lang}|{self.rules}",
+                                         cache_size, cache_db)
+        self.counters = {}
+        # keep-alive connections of this worker
+        self._session = None
+        # service state kept across pages until _health_until
+        self._healthy = False
+        self._health_until = 0.0
+        self._n_failures = 0
+        self.reset()
+
+    def __getstate__(self):
+        # connections are bound to the process that opened them
+        state = self.__dict__.copy()
+        state['_session'] = None
+        return state
+
+    def reset(self):
+        super().reset()
         self.lines = []
         self.hit_ratio = -1.0
         self.n_words = 0
@@ -352,43 +956,164 @@ class StepEstimateOCR(StepI):
         self.n_lines_out = 0
 
     def enabled(self):
-        """Connection established ?"""
+        """Connection established ?
+
+        Probes service only if last state expired, therefore an
+        outage costs one probe per pause rather than one per page
+        """
+
+        if self.words is not None:
+            return True
+        if time.monotonic() < self._health_until:
+            return self._healthy
         try:
-            requests.head(self.service_url)
-        except requests.ConnectionError:
+            self._get_session().head(self.service_url, timeout=self.timeout)
+        except requests.RequestException:
+            self._mark_failed()
             return False
+        self._mark_healthy()
         return True
 
+    def _get_session(self):
+        if self._session is None:
+            self._session = requests.Session()
+        return self._session
+
+    def _mark_healthy(self):
+        self._healthy = True
+        self._n_failures = 0
+        self._health_until = time.monotonic() + self.health_ttl
+
+    def _mark_failed(self):
+        # open circuit, pause longer with each failure in a row
+        self._healthy = False
+        self._n_failures += 1
+        pause = min(self.health_ttl * 2 ** (self._n_failures - 1),
+                    max(self.health_ttl, DEFAULT_LANGTOOL_HEALTH_MAX))
+        self._health_until = time.monotonic() + pause
+
     def execute(self):
+        # already checked with previous batch
+        if self._batch_done and self.path_in in self._batch_done:
+            batched = self._batch_done.pop(self.path_in)
+            self._set_counts(batched[0])
+            self._set_errors(batched[1])
+            return
         if not self.enabled():
             return
-        xml_data = ET.parse(self.path_in)
-        self.lines = get_lines(xml_data)
+        with self._document() as document:
+            self.lines = document.text_lines()
         if len(self.lines) > 0:
             try:
-                (word_string, n_lines, n_normed, n_sparse,
-                n_dense) = textlines2data(self.lines)
-                if word_string:
-                    self.n_lines_in = n_lines
-                    self.n_shorts = n_sparse
-                    self.n_wraps = n_normed
-                    self.n_lines_out = n_dense
-                    self.n_words = len(word_string.split())
-                    params = {'language': self.lang,
-                            'text': word_string,
-                            'enabledRules': self.rules,
-                            'enabledOnly': 'true'}
-                    response_data = self.request_data(params)
-                    self.postprocess_response(response_data)
+                data = textlines2data(self.lines)
+                if data[0]:
+                    self._set_counts(data)
+                    if self.words is not None:
+                        self._set_errors(self.words.count_misses(data[0].split()))
+                    elif self.verdicts is not None:
+                        self._set_errors(self._check_tokens([data[0].split()])[0])
+                    else:
+                        response_data = self.request_data(self._params(data[0]))
+                        self.postprocess_response(response_data)
             except ConnectionError as exc:
                 raise OSError(exc.args[0]) from exc
             except RuntimeError as exc:
                 raise StepException(exc.args[0]) from exc
 
+    def prepare_batch(self, paths):
+        """Check texts of all paths with as few requests as
+        batch_chars permits and map matches back to their pages,
+        so each page gets the very same statistics as if it was
+        checked on it's own
+
+        If a request fails, pages of previous requests are marked
+        as done, each other page will be checked on it's own
+
+        Returns:
+            list(str): paths checked within batch
+        """
+
+        self._batch_done = {}
+        paths = [str(p) for p in paths]
+        if (self.batch_size < 2 or len(paths) < 2 or self.words is not None
+                or not self.enabled()):
+            return []
+        pages = []
+        for path in paths:
+            try:
+                data = textlines2data(OCRDocument(path).text_lines())
+            except RuntimeError:
+                # page will fail on it's own
+                continue
+            if data[0]:
+                pages.append((path, data))
+        if self.verdicts is not None:
+            n_matches = self._check_tokens([data[0].split() for (_, data) in pages])
+            for ((path, data), n_page_matches) in zip(pages, n_matches):
+                self._batch_done[path] = (data, n_page_matches)
+            return [p for p in paths if p in self._batch_done]
+        for group in pack_texts([data[0] for (_, data) in pages], self.batch_chars):
+            texts = [pages[i][1][0] for i in group]
+            response_data = self.request_data(
+                self._params(LANGTOOL_BATCH_SEPARATOR.join(texts)))
+            n_matches = count_matches(response_data.get('matches', []),
+                                      texts, LANGTOOL_BATCH_SEPARATOR)
+            for (i, n_page_matches) in zip(group, n_matches):
+                (path, data) = pages[i]
+                self._batch_done[path] = (data, n_page_matches)
+        return [p for p in paths if p in self._batch_done]
+
+    def _check_tokens(self, pages_tokens):
+        """Check only distinct tokens of pages without cached verdict
+        and sum up matches of all tokens of each page
+
+        Returns:
+            list(int): number of matches of each page
+        """
+
+        distinct = list(dict.fromkeys(t for tokens in pages_tokens for t in tokens))
+        verdicts = self.verdicts.fetch(distinct)
+        fresh = [t for t in distinct if t not in verdicts]
+        self._count('verdict_hit', len(verdicts))
+        self._count('verdict_miss', len(fresh))
+        for group in pack_texts(fresh, self.batch_chars, LANGTOOL_TOKEN_SEPARATOR):
+            tokens = [fresh[i] for i in group]
+            response_data = self.request_data(
+                self._params(LANGTOOL_TOKEN_SEPARATOR.join(tokens)))
+            n_matches = count_matches(response_data.get('matches', []),
+                                      tokens, LANGTOOL_TOKEN_SEPARATOR)
+            fresh_verdicts = dict(zip(tokens, n_matches))
+            self.verdicts.store(fresh_verdicts)
+            verdicts.update(fresh_verdicts)
+        return [sum(verdicts[t] for t in tokens) for tokens in pages_tokens]
+
+    def _count(self, name, number=1):
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def _params(self, word_string):
+        return {'language': self.lang,
+                'text': word_string,
+                'enabledRules': self.rules,
+                'enabledOnly': 'true'}
+
+    def _set_counts(self, data):
+        (word_string, n_lines, n_normed, n_sparse, n_dense) = data
+        self.n_lines_in = n_lines
+        self.n_shorts = n_sparse
+        self.n_wraps = n_normed
+        self.n_lines_out = n_dense
+        self.n_words = len(word_string.split())
+
     def request_data(self, params):
         """Get word errors for text from webservice"""
 
-        response = requests.post(self.service_url, params)
+        try:
+            response = self._get_session().post(self.service_url, params,
+                                                timeout=self.timeout)
+        except requests.RequestException as exc:
+            self._mark_failed()
+            raise StepException(f"'{self.service_url}' unavailable: {exc}") from exc
+        self._mark_healthy()
         if not response.ok:
             raise StepException(
                 f"'{self.service_url}' returned invalid '{response}!'")
@@ -400,7 +1125,9 @@ class StepEstimateOCR(StepI):
         if 'matches' in response_data:
             total_matches = response_data['matches']
 
-        typo_errors = len(total_matches)
+        self._set_errors(len(total_matches))
+
+    def _set_errors(self, typo_errors):
         if typo_errors > self.n_words:
             typo_errors = self.n_words
 
@@ -446,12 +1173,57 @@ class StepEstimateOCR(StepI):
             return (mean, bin_counts)
 
 
+def pack_texts(texts:List[str], budget:int,
+               separator:str=LANGTOOL_BATCH_SEPARATOR) -> List[List[int]]:
+    """Group consecutive texts into batches of at most budget
+    characters including separators, each text exceeding budget
+    forms a batch of it's own
+
+    Returns:
+        list(list(int)): indices of texts for each batch
+    """
+
+    batches = []
+    size = 0
+    for (i, text) in enumerate(texts):
+        size += len(separator) + len(text)
+        if not batches or size > budget:
+            batches.append([])
+            size = len(text)
+        batches[-1].append(i)
+    return batches
+
+
+def count_matches(matches:List[Dict], texts:List[str], separator:str) -> List[int]:
+    """Count matches of text joined by separator for each text
+
+    Offsets of language tool count UTF-16 code units, which
+    differ from python characters outside Basic Multilingual Plane
+    """
+
+    starts = []
+    offset = 0
+    for text in texts:
+        starts.append(offset)
+        offset += _utf16_len(text) + _utf16_len(separator)
+    counts = [0] * len(texts)
+    for match in matches:
+        counts[bisect.bisect_right(starts, match['offset']) - 1] += 1
+    return counts
+
+
+def _utf16_len(text):
+    return len(text.encode('utf-16-le')) // 2
+
+
 def textlines2data(lines: List[TextLine], minlen:int=2) -> Tuple:
     """Transform text lines after preprocessing into data set"""
 
-    non_empty_lines = [l.get_textline_content()
-                       for l in lines
-                       if len(l.get_textline_content()) > 0]
+    if isinstance(lines, LineStore):
+        contents = lines.texts()
+    else:
+        contents = [l.get_textline_content() for l in lines]
+    non_empty_lines = [c for c in contents if len(c) > 0]
 
     (normalized_lines, n_normalized) = _sanitize_wraps(non_empty_lines)
     filtered_lines = _sanitize_chars(normalized_lines)
@@ -521,6 +1293,9 @@ class StepPostprocessALTO(StepIO):
       if not set, use 'p'
     """
 
+    stage = STAGE_POST
+    uses_document = True
+
     def __init__(self, params=None):
         super().__init__()
         self.params = params
@@ -533,7 +1308,11 @@ class StepPostprocessALTO(StepIO):
         * Layout/Page
         """
 
-        xml_root = ET.parse(self.path_in)
+        with self._document() as document:
+            self._enrich(document.tree())
+            document.mark_changed()
+
+    def _enrich(self, xml_root):
         the_ns = re.match(r'^\{(.*)\}\w+', xml_root.getroot().tag)[1]
 
         # enrich sourceImageInformation/fileIdentifier
@@ -557,8 +1336,6 @@ class StepPostprocessALTO(StepIO):
         # remove empty sections
         drop_empty_contents(xml_root)
 
-        write_xml_file(xml_root, self.path_in)
-
     @staticmethod
     def _append_source_infos(descr_tree, file_name, namespace):
         # fileIdentifier required
@@ -602,9 +1379,55 @@ def drop_empty_contents(xml_root):
                     printspace.remove(parent_super)
 
 
-def write_xml_file(xml_root, outfile):
-    """ write xml pretty printed to outfile """
+def format_xml(xml_root):
+    """ xml pretty printed as it is written to files, but
+    with plain line feeds
 
+    Blank text gets dropped from xml_root in place, the same way a
+    parser with remove_blank_text would, so the tree needs to be
+    serialized only once. Since libxml2 keeps first pass indentation
+    in elements with xml:space, such trees still take the round trip.
+    """
+
+    if hasattr(xml_root, 'getroot'):
+        xml_root = xml_root.getroot()
+    if XML_SPACE_USED(xml_root):
+        return _format_xml_reparsed(xml_root)
+    _strip_blank_text(xml_root)
+    return ET.tostring(xml_root, pretty_print=True,
+                       encoding='UTF-8', with_tail=False)
+
+
+def _strip_blank_text(xml_root):
+    """Drop text made of blanks only, unless it is the single content
+    of an element or follows non-blank text of its parent, which is
+    what libxml2 considers ignorable whitespace"""
+
+    for elem in xml_root.iter(ET.Element):
+        if not len(elem):
+            if elem.text == '':
+                elem.text = None
+            continue
+        text_seen = bool(elem.text) and not _is_blank(elem.text)
+        if not text_seen:
+            elem.text = None
+        for child in elem:
+            tail = child.tail
+            if not tail:
+                if tail is not None:
+                    child.tail = None
+            elif not text_seen:
+                if _is_blank(tail):
+                    child.tail = None
+                else:
+                    text_seen = True
+
+
+def _is_blank(text):
+    return not text.strip(' \t\n')
+
+
+def _format_xml_reparsed(xml_root):
     xml_string = ET.tostring(xml_root, pretty_print=True, encoding='UTF-8')
     pretty_parser = ET.XMLParser(
         resolve_entities=False, strip_cdata=False, remove_blank_text=True)
@@ -613,7 +1436,55 @@ def write_xml_file(xml_root, outfile):
                                 pretty_print=True,
                                 encoding='UTF-8').decode('UTF-8')
     formatted_file_content = '{}'.format(xml_formatted)
-    formatted_file_content = formatted_file_content.encode(
-        'UTF-8').replace(b'\n', b'\r\n')
+    return formatted_file_content.encode('UTF-8')
+
+
+def write_xml_file(xml_root, outfile):
+    """ write xml pretty printed to outfile """
+
+    formatted_file_content = format_xml(xml_root).replace(b'\n', b'\r\n')
     with open(outfile, 'wb') as file_handler:
         file_handler.write(formatted_file_content)
+
+
+class OCRDocument():
+    """Contents of an OCR file shared by consecutive steps of a page
+
+    Contents are held as parsed lxml tree. The file gets read once
+    when contents are first requested and written once by save(),
+    if contents changed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._tree = None
+        self.changed = False
+
+    def tree(self):
+        """Contents as lxml ElementTree, which steps may alter
+        in place, but need to mark_changed() afterwards"""
+
+        if self._tree is None:
+            self._tree = ET.parse(self.path)
+        return self._tree
+
+    def text_lines(self):
+        """Text lines of contents as compact LineStore, which get
+        streamed from file, unless contents are already parsed"""
+
+        if self._tree is not None:
+            return get_lines(self._tree, compact=True)
+        return LineStore.from_lines(iter_lines(self.path))
+
+    def mark_changed(self):
+        """Note contents have been altered"""
+
+        self.changed = True
+
+    def save(self):
+        """Write contents, if changed"""
+
+        if not self.changed:
+            return
+        write_xml_file(self._tree, self.path)
+        self.changed = False
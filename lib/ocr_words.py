@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Word List for offline Estimation of OCR Quality"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+import numpy as np
+
+# punctuation and alike around word tokens
+TOKEN_EDGES = re.compile(r'^[\W_]+|[\W_]+$')
+
+
+def compile_words(path_words, compiled_dir=None):
+    """Compile plain text word list, one word per line, into sorted
+    array of UTF-8 encoded words, which is stored as NumPy file and
+    re-used as long as the word list remains unchanged
+
+    Lines starting with '#' are skipped, as are Hunspell-like
+    affix flags after '/'.
+
+    Returns:
+        str: path of compiled word list
+    """
+
+    stat = os.stat(path_words)
+    sha = hashlib.sha1(repr((os.path.abspath(path_words), stat.st_size,
+                             stat.st_mtime_ns)).encode('utf-8'))
+    path_compiled = os.path.join(compiled_dir or tempfile.gettempdir(),
+                                 f"ocr-words-{sha.hexdigest()[:16]}.npy")
+    if os.path.exists(path_compiled):
+        return path_compiled
+    words = set()
+    with open(path_words, encoding='utf-8') as the_file:
+        for line in the_file:
+            word = line.split('/', 1)[0].strip()
+            if word and not word.startswith('#'):
+                words.add(word.encode('utf-8'))
+    table = np.array(sorted(words), dtype=bytes)
+    # readers never see partially written files
+    path_tmp = f"{path_compiled}.{os.getpid()}.tmp"
+    try:
+        with open(path_tmp, 'wb') as the_file:
+            np.save(the_file, table)
+        os.replace(path_tmp, path_compiled)
+    except OSError:
+        if os.path.exists(path_tmp):
+            os.unlink(path_tmp)
+        raise
+    return path_compiled
+
+
+class WordList():
+    """Look up words in sorted array, which is memory-mapped from
+    compiled file, so all workers share the same pages rather than
+    each holding a set of it's own
+
+    Plain text word lists get compiled first, files ending with
+    '.npy' are expected to be compiled already.
+    """
+
+    def __init__(self, path_words, compiled_dir=None):
+        self.path = path_words
+        if path_words.endswith('.npy'):
+            self.path_compiled = path_words
+        else:
+            self.path_compiled = compile_words(path_words, compiled_dir)
+        self._words = None
+
+    def __getstate__(self):
+        # mapping is bound to the process that opened it
+        state = self.__dict__.copy()
+        state['_words'] = None
+        return state
+
+    @property
+    def words(self):
+        """Sorted array of encoded words"""
+
+        if self._words is None:
+            self._words = np.load(self.path_compiled, mmap_mode='r')
+        return self._words
+
+    def __len__(self):
+        return len(self.words)
+
+    def contains(self, words):
+        """Look up all words at once by binary search
+
+        Returns:
+            np.ndarray: bool for each word
+        """
+
+        table = self.words
+        encoded = [w.encode('utf-8') for w in words]
+        if not len(table) or not encoded:
+            return np.zeros(len(encoded), dtype=bool)
+        keys = np.array(encoded, dtype=table.dtype)
+        positions = np.searchsorted(table, keys)
+        positions[positions == len(table)] = 0
+        # words wider than table got truncated by conversion
+        fits = np.fromiter((len(e) <= table.dtype.itemsize for e in encoded),
+                           dtype=bool, count=len(encoded))
+        return (table[positions] == keys) & fits
+
+    def count_misses(self, tokens):
+        """Count tokens with letters, which are neither known as
+        they are nor in lower case, if capitalized at sentence
+        start, nor capitalized, if written in capitals"""
+
+        words = [TOKEN_EDGES.sub('', t) for t in tokens]
+        words = [w for w in words if any(c.isalpha() for c in w)]
+        lowered = [w.lower() if w[0].isupper() else w for w in words]
+        capitalized = [w.capitalize() if w.isupper() else l
+                       for (w, l) in zip(words, lowered)]
+        # look up each distinct candidate only once
+        candidates = sorted(set(words) | set(lowered) | set(capitalized))
+        known = {c for (c, hit) in zip(candidates, self.contains(candidates)) if hit}
+        return sum(1 for (w, l, c) in zip(words, lowered, capitalized)
+                   if w not in known and l not in known and c not in known)
@@ -2,17 +2,40 @@
 """ULB DD/IT OCR Pipeline Workflow"""
 
 import argparse
+import asyncio
+import collections
 import concurrent.futures
 import configparser
+import copy
+import functools
+import hashlib
 import logging
 import logging.config
 import math
 import os
-import pathlib
+import queue
+import shutil
+import signal
 import sys
 import tempfile
+import threading
 import time
 
+from lib.ocr_image import (
+    image_pixels
+)
+from lib.ocr_lease import (
+    DEFAULT_LEASE_NAME,
+    DEFAULT_LEASE_TTL,
+    DirectoryLease,
+    LeaseKeeper
+)
+from lib import ocr_scratch
+from lib.ocr_scan import (
+    scan_dir,
+    scan_tree
+)
+
 # pylint: disable=unused-import
 # import statement *is_REALLY* necessary
 # for global clazz loading
@@ -25,7 +48,13 @@ from lib.ocr_step import (
     StepPostReplaceCharsRegex,
     StepPostMoveAlto,
     StepEstimateOCR,
-    StepPostprocessALTO
+    StepPostprocessALTO,
+    OCRDocument,
+    STAGE_OCR,
+    STAGE_POST,
+    STAGE_QA,
+    STAGES,
+    split_path
 )
 
 
@@ -37,6 +66,178 @@ DEFAULT_MARK_BUSY = 'ocr_busy'
 DEFAULT_MARK_FAIL = 'ocr_fail'
 DEFAULT_MARK_DONE = 'ocr_done'
 DEFAULT_PATH_CONFIG = 'conf/ocr_config.ini'
+DEFAULT_RESUME_LEDGER = 'ocr_pipeline_ledger'
+# seconds to wait in daemon mode if no directory is open
+DEFAULT_DAEMON_INTERVAL = 60
+# concurrency of postprocessing and estimation if run staged
+DEFAULT_POST_EXECUTORS = 2
+DEFAULT_QA_TASKS = 8
+
+# step options without impact on results
+FINGERPRINT_IGNORE = ['timeout', 'limit_cpu', 'limit_mem', 'batch_size',
+                      'stage']
+
+# order to process inputs
+SCHEDULE_NAME = 'name'
+SCHEDULE_SIZE = 'size'
+SCHEDULE_PIXELS = 'pixels'
+
+
+class PipelineHalt(OSError):
+    """Severe error of worker, like non-existing resources or
+    connections, that will harm all inputs in pipeline"""
+
+
+class StepPlan():
+    """Compiled sequence of configured steps
+
+    Built once from the configuration in the parent process
+    and handed to each worker process at start-up, so workers
+    only need to reset per-page state between two inputs
+    rather than creating all steps again and again
+    """
+
+    def __init__(self, steps, fingerprint=None):
+        self.steps = steps
+        self.fingerprint = fingerprint
+        # local scratch space to run steps in, if staging
+        self.scratch_dir = None
+        self.prefetch = ocr_scratch.DEFAULT_PREFETCH
+
+    def __len__(self):
+        return len(self.steps)
+
+    @staticmethod
+    def output_path(path_in):
+        """Path of ALTO output created for path_in"""
+
+        (folder, file_name) = split_path(path_in)
+        return os.path.join(folder, file_name + '.xml')
+
+    def use_scratch(self, scratch_dir, prefetch=ocr_scratch.DEFAULT_PREFETCH):
+        """Run steps with local copies of inputs in scratch_dir"""
+
+        self.scratch_dir = scratch_dir
+        self.prefetch = prefetch
+
+    def drop_scratch(self):
+        """Remove scratch_dir with all its leftovers"""
+
+        if self.scratch_dir:
+            shutil.rmtree(self.scratch_dir, ignore_errors=True)
+
+    def clear_scratch(self):
+        """Remove leftovers of all inputs, but keep scratch_dir"""
+
+        if self.scratch_dir:
+            ocr_scratch.clear(self.scratch_dir)
+
+    def stage_in(self, number, path):
+        """Local copy of input, if staging
+
+        Returns:
+            str: path for first step
+        """
+
+        if not self.scratch_dir:
+            return path
+        try:
+            return ocr_scratch.stage_in(self.scratch_dir, number, path)
+        except OSError as exc:
+            raise StepException(f"staging failed: {exc}") from exc
+
+    def stage_out(self, number, path_in, path_result):
+        """Move final result of input from scratch space next to input
+
+        Returns:
+            str: path of result
+        """
+
+        if not self.scratch_dir:
+            return path_result
+        page_dir = os.path.dirname(
+            ocr_scratch.scratch_path(self.scratch_dir, number, path_in))
+        if os.path.dirname(path_result) != page_dir:
+            # result was placed elsewhere by steps
+            return path_result
+        path_target = self.output_path(path_in)
+        ocr_scratch.stage_out(path_result, path_target)
+        return path_target
+
+    def release(self, number):
+        """Drop scratch files of input"""
+
+        if self.scratch_dir:
+            ocr_scratch.release(self.scratch_dir, number)
+
+    def reset(self):
+        """Reset per-page state of all steps and return them"""
+
+        for step in self.steps:
+            step.reset()
+        return self.steps
+
+    def stages(self):
+        """Group consecutive steps of same stage
+
+        Returns:
+            list(tuple(str, int, int)): stage with index of first
+                                        step and end index
+        """
+
+        runs = []
+        for (i, step) in enumerate(self.steps):
+            if runs and runs[-1][0] == step.stage:
+                runs[-1] = (step.stage, runs[-1][1], i + 1)
+            else:
+                runs.append((step.stage, i, i + 1))
+        return runs
+
+    @property
+    def batch_size(self):
+        """Number of pages the leading step can handle at once"""
+
+        if self.steps:
+            return self.stage_batch_size(0)
+        return 1
+
+    def prepare(self, paths, first=0):
+        """Let leading step, or leading step first of a stage,
+        process several input paths at once
+
+        Returns:
+            list(str): paths already processed by leading step
+        """
+
+        if self.stage_batch_size(first) > 1 and len(paths) > 1:
+            return self.steps[first].prepare_batch(paths)
+        return []
+
+    def stage_batch_size(self, first):
+        """Number of pages step first can handle at once"""
+
+        return max(1, getattr(self.steps[first], 'batch_size', 1))
+
+    def take_counters(self):
+        """Collect and clear counters of all steps"""
+
+        counters = collections.Counter()
+        for step in self.steps:
+            step_counters = getattr(step, 'counters', None)
+            if step_counters:
+                counters.update(step_counters)
+                step_counters.clear()
+        return counters
+
+    def evict_caches(self):
+        """Shrink result caches of steps to their configured size
+
+        Returns:
+            int: number of evicted entries
+        """
+
+        return sum(step.cache.evict() for step in self.steps
+                   if getattr(step, 'cache', None))
 
 
 class OCRPipeline():
@@ -61,6 +262,8 @@ class OCRPipeline():
         self.data_path = _path
         self.pipeline_file_paths = []
         self.tesseract_args = {}
+        self.leases = []
+        self._lease_keeper = None
         if conf_file is None:
             project_dir = os.path.dirname(__file__)
             conf_file = os.path.join(project_dir, DEFAULT_PATH_CONFIG)
@@ -106,17 +309,40 @@ class OCRPipeline():
         """
 
         steps = []
-        step_configs = [
-            s for s in self.cfg.sections() if s.startswith('step_')]
-        sorted_steps = sorted(step_configs, key=lambda s: int(s.split('_')[1]))
-        for step in sorted_steps:
+        for step in self._get_step_sections():
             the_type = self.cfg.get(step, 'type')
             the_keys = self.cfg[step].keys()
             the_kwargs = {k: self.cfg[step][k] for k in the_keys}
+            the_stage = the_kwargs.pop('stage', None)
             the_step = globals()[the_type](the_kwargs)
+            if the_stage:
+                if the_stage not in STAGES:
+                    raise ValueError(f"{step}: invalid stage '{the_stage}'")
+                the_step.stage = the_stage
             steps.append(the_step)
         return steps
 
+    def _get_step_sections(self):
+        step_configs = [
+            s for s in self.cfg.sections() if s.startswith('step_')]
+        return sorted(step_configs, key=lambda s: int(s.split('_')[1]))
+
+    def get_step_plan(self):
+        """Compile configured steps into re-usable StepPlan"""
+
+        return StepPlan(self.get_steps(), self.get_fingerprint())
+
+    def get_fingerprint(self):
+        """Fingerprint of configured steps, i.e. models, extra args
+        and postprocessing, that determine the pipeline's results"""
+
+        sha = hashlib.sha1()
+        for step in self._get_step_sections():
+            options = sorted((k, v) for k, v in self.cfg[step].items()
+                             if k not in FINGERPRINT_IGNORE)
+            sha.update(repr((step, options)).encode('utf-8'))
+        return sha.hexdigest()[:16]
+
     def _init_logger(self, log_dir=None):
         if log_dir:
             if not os.path.exists(log_dir):
@@ -185,18 +411,64 @@ class OCRPipeline():
         os.rename(old_marker, os.path.join(path_dir, mark))
 
     def mark_fail(self):
-        """mark state pipeline failed"""
+        """mark state pipeline failed for all directories
+        of inputs which aren't done yet"""
 
         file_fail = self.cfg.get('pipeline', 'mark_fail',
                                  fallback=DEFAULT_MARK_FAIL)
-        self._set_mark(file_fail)
+        lock_marker = self.cfg.get('pipeline', 'mark_lock',
+                                   fallback=DEFAULT_MARK_BUSY)
+        lost = self._lost_dirs()
+        for dir_name in self.paths_by_dir():
+            if dir_name in lost:
+                continue
+            if os.path.exists(os.path.join(dir_name, lock_marker)):
+                self._set_mark(file_fail, dir_name, lock_marker)
 
     def mark_done(self):
-        """Mark state pipeline succeded"""
+        """Mark state pipeline succeded for data_path, even
+        without any inputs, unless it is done already or
+        leased by others
+
+        Without a lease of it's own, data_path is leased
+        for marking, so a busy directory of another worker
+        is never touched.
+        """
 
         file_done = self.cfg.get('pipeline', 'mark_done',
                                  fallback=DEFAULT_MARK_DONE)
-        self._set_mark(file_done)
+        if not isinstance(self.data_path, str):
+            return
+        data_dir = os.path.normpath(self.data_path)
+        if os.path.exists(os.path.join(data_dir, file_done)):
+            return
+        own = [lease for lease in self.leases
+               if os.path.normpath(lease.dir_path) == data_dir]
+        if any(lease.lost for lease in own):
+            return
+        if own:
+            self._mark_done(data_dir, file_done)
+            return
+        lease = self._new_lease(data_dir)
+        if not lease.acquire():
+            self.logger.warning("skip marking '%s' done, leased by %s",
+                                data_dir, lease.read())
+            return
+        try:
+            self._mark_done(data_dir, file_done)
+        finally:
+            lease.release()
+
+    def _mark_done(self, dir_name, file_done):
+        # directory without inputs was never locked
+        file_names = os.listdir(dir_name)
+        lock_marker = self.cfg.get('pipeline', 'mark_lock',
+                                   fallback=DEFAULT_MARK_BUSY)
+        open_marker = self.cfg.get('pipeline', 'mark_open', fallback=None)
+        if lock_marker not in file_names and open_marker in file_names:
+            self._set_mark(file_done, dir_name, open_marker)
+        else:
+            self._set_mark(file_done, dir_name, lock_marker)
 
     def prepare_workdir(self, workdir=None):
         """prepare workdir: create or clear if necessary"""
@@ -230,22 +502,55 @@ class OCRPipeline():
             if os.path.isfile(fpath):
                 os.unlink(fpath)
 
-    def store_estimations(self, estms):
-        """Postprocessing of OCR-Quality Estimation Data"""
+    def complete_dir(self, dir_name, estms):
+        """Store estimations of directory with all inputs
+        finished, mark it done and release it's lease
+
+        Directories with lease lost meanwhile are left to the
+        worker which took them over.
+        """
+
+        if dir_name in self._lost_dirs():
+            self.logger.warning("lost lease of '%s', leave it to other worker",
+                                dir_name)
+            return
+        if estms:
+            self.store_estimations(estms, dir_name)
+        lock_marker = self.cfg.get('pipeline', 'mark_lock',
+                                   fallback=DEFAULT_MARK_BUSY)
+        if os.path.exists(os.path.join(dir_name, lock_marker)):
+            self.logger.info("directory '%s' done", dir_name)
+            self._set_mark(self.cfg.get('pipeline', 'mark_done',
+                                        fallback=DEFAULT_MARK_DONE),
+                           dir_name, lock_marker)
+        for lease in [held for held in self.leases if held.dir_path == dir_name]:
+            lease.release()
+            self.leases.remove(lease)
+
+    def store_estimations(self, estms, dir_name=None):
+        """Postprocessing of OCR-Quality Estimation Data
+
+        Args:
+            estms (list(tuple)): Estimations of inputs
+            dir_name (str, optional): Directory to store into.
+                Defaults to data_path.
+        """
 
         valids = [r for r in estms if r[1] != -1]
         invalids = [r for r in estms if r[1] == -1]
         sorteds = sorted(valids, key=lambda r: r[1])
         aggregations = StepEstimateOCR.analyze(sorteds)
         end_time = time.strftime('%Y-%m-%d_%H-%M', time.localtime())
-        if not isinstance(self.data_path, str):
+        if dir_name is None:
+            dir_name = self.data_path
+        if not isinstance(dir_name, str):
             self.logger.warning('unable to choose store for estm data: %s',
-                                str(self.data_path))
+                                str(dir_name))
             return
 
-        file_name = os.path.basename(self.data_path)
+        file_name = os.path.basename(dir_name)
         file_path = os.path.join(
-            self.data_path, f"{file_name}_{end_time}.wtr")
+            dir_name, f"{file_name}_{end_time}.wtr")
         self.logger.info("store mean '%.3f' in '%s'",
                          aggregations[0], file_path)
         if aggregations:
@@ -285,64 +590,138 @@ class OCRPipeline():
         if "," in exts[0]:
             exts = exts[0].split(",")
 
-        def _file_ext_matches(path):
-            for file_ext in exts:
-                if str(path).endswith(file_ext):
-                    return True
-            return False
-
-        def _marked(path, mark=None):
-            """Determine if given mark exists in path
-
-            Args:
-                path (str): Path to inspect
-                mark (str, optional): Mark to filter.
-                    Defaults to None.
-
-            Returns:
-                bool: Mark contained or not set?
-            """
+        mark_open = self.cfg.get('pipeline', 'mark_open', fallback=None)
 
-            if not mark:
+        def _marked(scan_dir):
+            if not mark_open:
                 return True
-            return mark in os.listdir(path)
+            return (mark_open in scan_dir.names
+                    or self._lease_expired(scan_dir.path, scan_dir.names))
 
-        paths = []
-        mark_open = self.cfg.get('pipeline', 'mark_open', fallback=None)
         if recursive and isinstance(self.data_path, str):
             self.logger.debug("recursive sub-directories having '%s'",
                               mark_open)
-            paths = [os.path.join(curr, f)
-                     for curr, _, files in os.walk(self.data_path)
-                     for f in files
-                     if _file_ext_matches(f)
-                     and _marked(curr, mark_open)]
+            scan_dirs = [d for d in scan_tree(self.data_path, exts)
+                         if d.images and _marked(d)]
+        elif isinstance(self.data_path, list):
+            self.logger.debug("inspect dirs '%s'", self.data_path)
+            scan_dirs = [d for (d, _) in (scan_dir(a_dir, exts)
+                                          for a_dir in self.data_path)
+                         if d.images and _marked(d)]
         else:
-            if isinstance(self.data_path, list):
-                dirs = self.data_path
-                self.logger.debug("inspect dirs '%s'", dirs)
-                paths = [os.path.join(a_dir, p.name)
-                         for a_dir in dirs
-                         for p in pathlib.Path(a_dir).iterdir()
-                         if _file_ext_matches(p.name)
-                         and _marked(a_dir, mark_open)]
-            if isinstance(self.data_path, str):
-                self.logger.debug("inspect single dir '%s'", self.data_path)
-                paths = [os.path.join(self.data_path, p.name)
-                         for p in pathlib.Path(self.data_path).iterdir()
-                         if _file_ext_matches(p.name)]
+            self.logger.debug("inspect single dir '%s'", self.data_path)
+            (the_dir, _) = scan_dir(self.data_path, exts)
+            scan_dirs = [the_dir]
+        paths = [path for d in scan_dirs for path in d.image_paths()]
         # sort and eliminate duplicate paths
         self.pipeline_file_paths = sorted(list(set(paths)))
         return self.pipeline_file_paths
 
+    def paths_by_dir(self):
+        """Group current inputs by their directory
+
+        Returns:
+            dict(str, list(str)): sorted inputs of each directory
+        """
+
+        groups = {}
+        for path in self.pipeline_file_paths:
+            groups.setdefault(os.path.dirname(path), []).append(path)
+        return groups
+
+    def _get_ledger_name(self):
+        return self.cfg.get('pipeline', 'resume_ledger',
+                            fallback=DEFAULT_RESUME_LEDGER)
+
+    def record_done(self, path_in, fingerprint):
+        """Note in ledger of input's directory that input has been
+        processed with plan of given fingerprint"""
+
+        ledger = self._get_ledger_name()
+        if not ledger or not fingerprint:
+            return
+        (dir_name, file_name) = os.path.split(path_in)
+        with open(os.path.join(dir_name, ledger), 'a', encoding='UTF-8') as l_file:
+            l_file.write(f"{file_name} {fingerprint}\n")
+
+    def _read_ledger(self, dir_name):
+        """Map file names to fingerprints, latest entry wins"""
+
+        entries = {}
+        ledger = self._get_ledger_name()
+        path_ledger = os.path.join(dir_name, ledger)
+        if ledger and os.path.isfile(path_ledger):
+            with open(path_ledger, 'r', encoding='UTF-8') as l_file:
+                for line in l_file:
+                    tokens = line.rsplit(' ', 1)
+                    if len(tokens) == 2:
+                        entries[tokens[0]] = tokens[1].strip()
+        return entries
+
+    def pending_inputs(self, input_paths, plan):
+        """Drop inputs with up-to-date output, i.e. output exists,
+        is newer than input and was created with same plan
+
+        Returns:
+            list(str): inputs missing or with stale output
+        """
+
+        ledgers = {}
+        pending = []
+        for path_in in input_paths:
+            (dir_name, file_name) = os.path.split(path_in)
+            if dir_name not in ledgers:
+                ledgers[dir_name] = self._read_ledger(dir_name)
+            path_out = plan.output_path(path_in)
+            if (ledgers[dir_name].get(file_name) == plan.fingerprint
+                    and os.path.isfile(path_out)
+                    and os.path.getmtime(path_out) >= os.path.getmtime(path_in)):
+                continue
+            pending.append(path_in)
+        return pending
+
+    def _new_lease(self, dir_name):
+        return DirectoryLease(
+            dir_name,
+            self.cfg.get('pipeline', 'lease_name', fallback=DEFAULT_LEASE_NAME),
+            self.cfg.getfloat('pipeline', 'lease_ttl', fallback=DEFAULT_LEASE_TTL))
+
+    def _lease_expired(self, dir_name, file_names):
+        """Was directory locked by a worker which crashed, since
+        it's lease wasn't refreshed in time?"""
+
+        lock_marker = self.cfg.get('pipeline', 'mark_lock', fallback=DEFAULT_MARK_BUSY)
+        lease = self._new_lease(dir_name)
+        return (lock_marker in file_names
+                and os.path.basename(lease.path) in file_names
+                and lease.is_stale())
+
     def lock_paths(self):
-        """Lock *all* current directories for other ocr-workers"""
+        """Lock *all* current directories for other ocr-workers
+
+        Each directory is leased first, and only the lease holder
+        sets the lock marker. Inputs of directories leased by
+        other workers are dropped.
+
+        Returns:
+            list(str): inputs of locked directories
+        """
 
         open_marker = self.cfg.get('pipeline', 'mark_open')
         lock_marker = self.cfg.get('pipeline', 'mark_lock')
-        for file_path in self.pipeline_file_paths:
-            dir_name = os.path.dirname(file_path)
-            file_names = [f.name for f in os.scandir(dir_name)]
+        leased = {lease.dir_path for lease in self.leases}
+        for dir_name in self.paths_by_dir():
+            if dir_name in leased:
+                continue
+            lease = self._new_lease(dir_name)
+            if not lease.acquire():
+                self.logger.warning("skip path '%s', leased by %s",
+                                    dir_name, lease.read())
+                continue
+            self.leases.append(lease)
+            leased.add(dir_name)
+            # markers may have changed since scan until lease was acquired
+            file_names = os.listdir(dir_name)
             if lock_marker not in file_names:
                 self.logger.debug("lock path '%s' for processing",
                                   dir_name)
@@ -350,19 +729,169 @@ class OCRPipeline():
                     self._set_mark(lock_marker, dir_name, open_marker)
                 else:
                     self._set_mark(lock_marker, dir_name)
+        self.pipeline_file_paths = [p for p in self.pipeline_file_paths
+                                    if os.path.dirname(p) in leased]
+        self._keep_leases()
+        return self.pipeline_file_paths
+
+    def claim_next(self, roots):
+        """Lease next open directory below given roots and make
+        it the current data_path
+
+        Args:
+            roots (list(str)): Directories to inspect recursively
+
+        Returns:
+            list(str): inputs of claimed directory, empty if none open
+        """
+
+        for root in roots:
+            self.data_path = root
+            self.input_sorted(recursive=True)
+            for (dir_name, paths) in self.paths_by_dir().items():
+                self.pipeline_file_paths = paths
+                if self.lock_paths():
+                    self.data_path = dir_name
+                    return self.pipeline_file_paths
+        self.pipeline_file_paths = []
+        return []
+
+    def _keep_leases(self):
+        if self.leases and self._lease_keeper is None:
+            interval = self.leases[0].ttl / 3
+            self._lease_keeper = LeaseKeeper(self.leases, interval,
+                                             self.logger)
+            self._lease_keeper.start()
+
+    def _lost_dirs(self):
+        """Directories whose leases were taken over by others"""
+
+        return {lease.dir_path for lease in self.leases if lease.lost}
+
+    def release_leases(self):
+        """Stop heartbeat and release all held leases"""
+
+        if self._lease_keeper is not None:
+            self._lease_keeper.stop()
+            self._lease_keeper = None
+        for lease in self.leases:
+            lease.release()
+        self.leases = []
 
     def unlock_paths(self):
         """Un-Lock all before sealed directories"""
 
         lock_marker = self.cfg.get('pipeline', 'mark_lock')
         done_marker = self.cfg.get('pipeline', 'mark_done')
-        for file_path in self.pipeline_file_paths:
-            dir_name = os.path.dirname(file_path)
-            for dir_entry in os.scandir(dir_name):
-                if lock_marker in dir_entry.name:
-                    self.logger.debug("un-lock path '%s'",
-                                      dir_name)
-                    self._set_mark(done_marker, dir_name, lock_marker)
+        lost = self._lost_dirs()
+        for dir_name in self.paths_by_dir():
+            if dir_name in lost:
+                continue
+            if os.path.exists(os.path.join(dir_name, lock_marker)):
+                self.logger.debug("un-lock path '%s'",
+                                  dir_name)
+                self._set_mark(done_marker, dir_name, lock_marker)
+
+
+class RunSummary():
+    """Running aggregates of OCR-Quality estimations and step
+    counters, updated as soon as each page's outcome arrives"""
+
+    def __init__(self, bins=5, step_bin=15):
+        self.counters = collections.Counter()
+        self.estimations = []
+        self.n_outcomes = 0
+        self.total = 0.0
+        self.bins = [0] * bins
+        self.step_bin = step_bin
+
+    def add(self, outcome):
+        """Fold single page outcome into aggregates"""
+
+        self.n_outcomes += 1
+        if outcome is None or outcome[1] <= MARK_MISSING_ESTM:
+            return
+        self.estimations.append(outcome)
+        self.total += outcome[1]
+        target_bin = min(int(outcome[1] // self.step_bin), len(self.bins) - 1)
+        self.bins[target_bin] += 1
+
+    @property
+    def mean(self):
+        """Current mean of valid estimations"""
+
+        if self.estimations:
+            return round(self.total / len(self.estimations), 3)
+        return float(MARK_MISSING_ESTM)
+
+    def hit_rates(self):
+        """Hit rates of step caches, counted by pairs of counters
+        named '<cache>_hit' and '<cache>_miss'
+
+        Returns:
+            dict(str, float): percentage of hits for each cache
+        """
+
+        rates = {}
+        for (name, n_hits) in self.counters.items():
+            if name.endswith('_hit'):
+                cache = name[:-len('_hit')]
+                n_total = n_hits + self.counters[f"{cache}_miss"]
+                if n_total:
+                    rates[cache] = round(n_hits / n_total * 100, 1)
+        return rates
+
+
+def predict_cost(path, schedule=SCHEDULE_SIZE):
+    """Predict processing cost of input by pixel count from
+    image header or, as fallback, by file size"""
+
+    if schedule == SCHEDULE_PIXELS:
+        pixels = image_pixels(path)
+        if pixels:
+            return pixels
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def numbered_chunks(input_paths, chunk_size=1, schedule=SCHEDULE_NAME):
+    """Number inputs in given order starting with 1 and group them
+    into chunks of at most chunk_size inputs
+
+    Unless scheduled by name, inputs with largest predicted cost
+    come first, so they don't leave executors idle at the end
+    """
+
+    numbered = enumerate(input_paths, start=1)
+    if schedule != SCHEDULE_NAME:
+        numbered = sorted(numbered, reverse=True,
+                          key=lambda item: predict_cost(item[1], schedule))
+    chunk = []
+    for number, path in numbered:
+        chunk.append((number, path))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_results(executor, func, chunks, window):
+    """Submit chunks to executor but keep at most window of them
+    pending, and yield their results in order of completion"""
+
+    pending = set()
+    for chunk in chunks:
+        if len(pending) >= window:
+            done, pending = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(executor.submit(func, chunk))
+    for future in concurrent.futures.as_completed(pending):
+        yield future.result()
 
 
 def profile(func):
@@ -376,22 +905,173 @@ def profile(func):
     return f"{label} run {func_delta:.2f}s"
 
 
+# step plan of current worker process, set by _init_worker
+STEP_PLAN = None
+
+
+def _init_worker(step_plan):
+    """Initialize worker process with compiled step plan"""
+
+    global STEP_PLAN  # pylint: disable=global-statement
+    STEP_PLAN = step_plan
+    # inherited daemon handler would keep workers from terminating
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _get_worker_plan():
+    global STEP_PLAN  # pylint: disable=global-statement
+    if STEP_PLAN is None:
+        STEP_PLAN = pipeline.get_step_plan()
+    return STEP_PLAN
+
+
+def _execute_chunk(chunk, n_inputs):
+    """Execute pipeline for chunk of numbered inputs, which
+    is passed as a whole to the leading step if it is
+    able to process batches"""
+
+    plan = _get_worker_plan()
+    paths = [path for (_, path) in chunk]
+    try:
+        prepared = plan.prepare([plan.stage_in(number, path)
+                                 for (number, path) in chunk])
+        if prepared:
+            pipeline.logger.info("[%s] %s processed batch of %d inputs",
+                                 os.path.basename(paths[0]),
+                                 plan.steps[0].__class__.__name__,
+                                 len(prepared))
+    except StepException as exc:
+        pipeline.logger.warning("[%s] %s: %s, process inputs one by one",
+                                os.path.basename(paths[0]),
+                                plan.steps[0].__class__.__name__,
+                                exc.args[0])
+    outcomes = [_execute_pipeline(item, n_inputs) for item in chunk]
+    # timestamp to measure transfer of results back to parent
+    return (chunk, outcomes, plan.take_counters(), time.time())
+
+
+def _process_inputs(executor, plan, input_paths, window,
+                    schedule=SCHEDULE_NAME):
+    """Stream inputs through executor and fold outcomes"""
+
+    summary = RunSummary()
+    # inputs left and estimations per directory
+    pending_dirs = collections.Counter(os.path.dirname(p) for p in input_paths)
+    dir_summaries = collections.defaultdict(RunSummary)
+    n_inputs = len(input_paths)
+    log_every = max(1, n_inputs // 20)
+    ipc_total = 0.0
+    n_chunks = 0
+    chunk_size = plan.batch_size
+    chunks = numbered_chunks(input_paths, chunk_size, schedule)
+    io_pool = None
+    if plan.scratch_dir:
+        io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        chunks = ocr_scratch.prefetch(chunks, plan.scratch_dir,
+                                      plan.prefetch, io_pool)
+    if isinstance(executor, StagedExecutor):
+        results = executor.stream(chunks, n_inputs, window)
+    else:
+        # workers outlive input lists in daemon mode, so pass total along
+        execute = functools.partial(_execute_chunk, n_inputs=n_inputs)
+        results = stream_results(executor, execute, chunks, window)
+    try:
+        for (chunk, outcomes, counters, ts_done) in results:
+            ipc_total += time.time() - ts_done
+            n_chunks += 1
+            summary.counters.update(counters)
+            for ((_, path_in), outcome) in zip(chunk, outcomes):
+                if outcome is not None:
+                    pipeline.record_done(path_in, plan.fingerprint)
+                summary.add(outcome)
+                dir_name = os.path.dirname(path_in)
+                dir_summaries[dir_name].add(outcome)
+                pending_dirs[dir_name] -= 1
+                if not pending_dirs[dir_name]:
+                    pipeline.complete_dir(dir_name,
+                                          dir_summaries.pop(dir_name).estimations)
+                if summary.n_outcomes % log_every == 0:
+                    pipeline.logger.info("[%04d/%04d] outcomes, running WTE (Mean): '%.1f'",
+                                         summary.n_outcomes, n_inputs, summary.mean)
+                    plan.evict_caches()
+    finally:
+        if io_pool is not None:
+            io_pool.shutdown(cancel_futures=True)
+        # numbers start over with next input list in daemon mode,
+        # so leftovers of failed inputs must not be found again
+        plan.clear_scratch()
+    if n_chunks:
+        pipeline.logger.info("result transfer %.2fms per chunk of %d inputs",
+                             ipc_total / n_chunks * 1000, chunk_size)
+    n_evicted = plan.evict_caches()
+    if summary.counters or n_evicted:
+        pipeline.logger.info("step counters: %s, hit rates: %s, cache evictions: %d",
+                             dict(sorted(summary.counters.items())),
+                             summary.hit_rates(), n_evicted)
+    return summary
+
+
 def _execute_pipeline(*args):
     number = args[0][0]
     start_path = args[0][1]
-    batch_label = f"{number:04d}/{len(INPUT_PATHS):04d}"
-    next_in = start_path
+    batch_label = f"{number:04d}/{args[1]:04d}"
     file_name = os.path.basename(start_path)
-    outcome = (file_name, MARK_MISSING_ESTM)
 
+    plan = _get_worker_plan()
     try:
-        the_steps = pipeline.get_steps()
+        the_steps = plan.reset()
         pipeline.logger.info("[%s] [%s] start pipeline with %d steps",
                              file_name, batch_label, len(the_steps))
+        result = _run_steps(the_steps, start_path,
+                            plan.stage_in(number, start_path),
+                            (file_name, MARK_MISSING_ESTM))
+        if result is not None:
+            plan.stage_out(number, start_path, result[0])
+    except StepException as exc:
+        pipeline.logger.error("[%s] %s", start_path, exc.args[0])
+        result = None
+    # OSError means something really severe, like
+    # non-existing resources/connections that will harm
+    # all images in pipeline, therefore signal halt
+    except OSError as exc:
+        pipeline.logger.critical("[%s] halt pipeline: %s", start_path, str(exc))
+        raise PipelineHalt(f"[{start_path}] {exc}") from exc
+    finally:
+        plan.release(number)
 
-        # for step in STEPS:
-        for step in the_steps:
+    # if a single step-based images crashes, we will go on anyway
+    if result is None:
+        return None
+    pipeline.logger.info("[%s] [%s] done pipeline with %d steps",
+                         file_name, batch_label, len(the_steps))
+    return result[1]
+
+
+def _run_steps(steps, start_path, next_in, outcome):
+    """Execute steps one after another, beginning with next_in
+
+    Consecutive steps working on contents share a single
+    document, which is written once after the last of them
+
+    Returns:
+        tuple: path for next step and outcome or None, if step failed
+    """
+
+    file_name = os.path.basename(start_path)
+    step = None
+    document = None
+    try:
+        for step in steps:
             step.path_in = next_in
+            if step.uses_document:
+                if document is None or document.path != next_in:
+                    if document is not None:
+                        document.save()
+                    document = OCRDocument(next_in)
+                step.document = document
+            elif document is not None:
+                document.save()
+                document = None
             if isinstance(step, StepIOExtern):
                 pipeline.logger.debug("[%s] %s", file_name, step.cmd)
 
@@ -417,28 +1097,271 @@ def _execute_pipeline(*args):
                 pipeline.logger.debug("[%s] step.path_next: %s",
                                       file_name, step.path_next)
                 next_in = step.path_next
+        if document is not None:
+            document.save()
+        return (next_in, outcome)
 
-        pipeline.logger.info("[%s] [%s] done pipeline with %d steps",
-                             file_name, batch_label, len(the_steps))
-        return outcome
-
-    # if a single step-based images crashes, we will go on anyway
     except StepException as exc:
         pipeline.logger.error(
             "[%s] %s: %s",
             start_path,
             step,
             exc.args[0])
-    # OSError means something really severe, like
-    # non-existing resources/connections that will harm
-    # all images in pipeline, therefore signal halt
     except OSError as os_exc:
         pipeline.logger.critical(
             "[%s] %s: %s",
             start_path,
             step,
             str(os_exc))
-        sys.exit(1)
+        raise
+    return None
+
+
+def _run_stage(plan, pages, n_inputs, first, end):
+    """Execute steps first to end of plan for pages, each a tuple
+    of number, input path, path for next step and outcome"""
+
+    steps = plan.steps[first:end]
+    if first == 0:
+        pages = [_stage_in(plan, page) for page in pages]
+    paths = [next_in for (_, _, next_in, _) in pages if next_in]
+    try:
+        plan.prepare(paths, first)
+    except StepException as exc:
+        pipeline.logger.warning("[%s] %s: %s, process inputs one by one",
+                                os.path.basename(paths[0]),
+                                steps[0].__class__.__name__,
+                                exc.args[0])
+    results = []
+    for (number, start_path, next_in, outcome) in pages:
+        if next_in is None:
+            results.append((number, start_path, None, None))
+            continue
+        for step in steps:
+            step.reset()
+        pipeline.logger.info("[%s] [%04d/%04d] stage '%s' with %d steps",
+                             os.path.basename(start_path), number, n_inputs,
+                             steps[0].stage, len(steps))
+        result = _run_steps(steps, start_path, next_in, outcome)
+        if result is None:
+            plan.release(number)
+            results.append((number, start_path, None, None))
+        elif end == len(plan):
+            try:
+                plan.stage_out(number, start_path, result[0])
+            finally:
+                plan.release(number)
+            results.append((number, start_path) + result)
+        else:
+            results.append((number, start_path) + result)
+    return (results, plan.take_counters(), time.time())
+
+
+def _stage_in(plan, page):
+    (number, start_path, next_in, outcome) = page
+    try:
+        return (number, start_path, plan.stage_in(number, next_in), outcome)
+    except StepException as exc:
+        pipeline.logger.error("[%s] %s", start_path, exc.args[0])
+        plan.release(number)
+        return (number, start_path, None, None)
+
+
+def _execute_stage(pages, n_inputs, first, end):
+    """Stage of pool processes"""
+
+    return _run_stage(_get_worker_plan(), pages, n_inputs, first, end)
+
+
+# step plan of current thread, set by _init_thread
+THREAD_PLAN = threading.local()
+
+
+def _init_thread(step_plan):
+    """Initialize thread with copy of step plan, since steps
+    keep per-page state"""
+
+    THREAD_PLAN.plan = copy.deepcopy(step_plan)
+
+
+def _execute_stage_local(pages, n_inputs, first, end):
+    """Stage of threads within the parent process"""
+
+    return _run_stage(THREAD_PLAN.plan, pages, n_inputs, first, end)
+
+
+class StagedExecutor():
+    """Run consecutive steps of same stage on executors of their own,
+    which are connected by bounded queues on an asyncio loop
+
+    Recognition and postprocessing run in separate process pools,
+    while estimation, which mostly waits for the language tool,
+    runs as tasks of the loop in threads of the parent process,
+    so recognition never waits for network requests.
+    """
+
+    def __init__(self, plan, n_executors, n_post=DEFAULT_POST_EXECUTORS,
+                 n_qa=DEFAULT_QA_TASKS):
+        self.runs = plan.stages()
+        self.batch_sizes = [plan.stage_batch_size(first)
+                            for (_, first, _) in self.runs]
+        self.limits = {STAGE_OCR: n_executors,
+                       STAGE_POST: n_post,
+                       STAGE_QA: n_qa}
+        self.executors = {}
+        for (stage, _, _) in self.runs:
+            if stage in self.executors:
+                continue
+            if stage == STAGE_QA:
+                self.executors[stage] = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=n_qa, initializer=_init_thread, initargs=(plan,))
+            else:
+                self.executors[stage] = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.limits[stage], initializer=_init_worker,
+                    initargs=(plan,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """Shutdown executors of all stages"""
+
+        for executor in self.executors.values():
+            executor.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def stream(self, chunks, n_inputs, window):
+        """Yield results of single pages like stream_results as
+        soon as they passed all stages or failed"""
+
+        results = queue.Queue()
+        runner = threading.Thread(target=self._run_loop, daemon=True,
+                                  args=(chunks, n_inputs, window, results))
+        runner.start()
+        while True:
+            result = results.get()
+            if result is None:
+                break
+            if isinstance(result, BaseException):
+                raise result
+            yield result
+        runner.join()
+
+    def _run_loop(self, chunks, n_inputs, window, results):
+        try:
+            asyncio.run(self._pipe(chunks, n_inputs, window, results.put))
+        except Exception as exc:  # pylint: disable=broad-except
+            results.put(exc)
+        results.put(None)
+
+    async def _pipe(self, chunks, n_inputs, window, emit):
+        loop = asyncio.get_running_loop()
+        queues = [asyncio.Queue(maxsize=window) for _ in self.runs]
+
+        async def _work(i_run):
+            (stage, first, end) = self.runs[i_run]
+            execute = _execute_stage_local if stage == STAGE_QA else _execute_stage
+            while True:
+                pages = await queues[i_run].get()
+                n_taken = 1
+                # later stages get single pages, so take pages waiting
+                # anyway, if the leading step is able to process batches
+                while (i_run > 0 and len(pages) < self.batch_sizes[i_run]
+                       and not queues[i_run].empty()):
+                    pages = pages + queues[i_run].get_nowait()
+                    n_taken += 1
+                (pages, counters, ts_done) = await loop.run_in_executor(
+                    self.executors[stage],
+                    functools.partial(execute, pages, n_inputs, first, end))
+                for (number, start_path, next_in, outcome) in pages:
+                    if next_in is None or i_run == len(self.runs) - 1:
+                        emit(([(number, start_path)], [outcome], counters, ts_done))
+                        counters = collections.Counter()
+                    else:
+                        await queues[i_run + 1].put([(number, start_path, next_in, outcome)])
+                for _ in range(n_taken):
+                    queues[i_run].task_done()
+
+        async def _drain():
+            for chunk in chunks:
+                await queues[0].put([(number, path, path,
+                                      (os.path.basename(path), MARK_MISSING_ESTM))
+                                     for (number, path) in chunk])
+            for stage_queue in queues:
+                await stage_queue.join()
+
+        workers = [asyncio.ensure_future(_work(i_run))
+                   for (i_run, (stage, _, _)) in enumerate(self.runs)
+                   for _ in range(self.limits[stage])]
+        drain = asyncio.ensure_future(_drain())
+        (done, _) = await asyncio.wait(workers + [drain],
+                                       return_when=asyncio.FIRST_COMPLETED)
+        for task in workers + [drain]:
+            task.cancel()
+        for task in done:
+            if not task.cancelled() and task.exception():
+                raise task.exception()
+
+
+# set by SIGTERM to end daemon after current directory
+STOP_DAEMON = threading.Event()
+
+
+def _stop_daemon(signum, _frame):
+    pipeline.logger.info("received signal %d, stop after current directory",
+                         signum)
+    STOP_DAEMON.set()
+
+
+def _new_executor(plan, n_executors):
+    if pipeline.cfg.getboolean('pipeline', 'staged', fallback=False):
+        return StagedExecutor(
+            plan, n_executors,
+            pipeline.cfg.getint('pipeline', 'post_executors',
+                                fallback=DEFAULT_POST_EXECUTORS),
+            pipeline.cfg.getint('pipeline', 'qa_tasks',
+                                fallback=DEFAULT_QA_TASKS))
+    return concurrent.futures.ProcessPoolExecutor(max_workers=n_executors,
+                                                  initializer=_init_worker,
+                                                  initargs=(plan,))
+
+
+def _run_daemon(roots, plan, n_executors, window, schedule, resume=False):
+    """Process open directories below roots one after another
+    with one long-lived pool of warm workers until SIGTERM"""
+
+    interval = pipeline.cfg.getfloat('pipeline', 'daemon_interval',
+                                     fallback=DEFAULT_DAEMON_INTERVAL)
+    signal.signal(signal.SIGTERM, _stop_daemon)
+    pipeline.logger.info("daemon watches %s every %gs", roots, interval)
+    executor = _new_executor(plan, n_executors)
+    try:
+        while not STOP_DAEMON.is_set():
+            input_paths = pipeline.claim_next(roots)
+            if not input_paths:
+                STOP_DAEMON.wait(interval)
+                continue
+            if resume:
+                input_paths = pipeline.pending_inputs(input_paths, plan)
+            pipeline.logger.info("claimed '%s' with %d inputs",
+                                 pipeline.data_path, len(input_paths))
+            try:
+                _process_inputs(executor, plan, input_paths, window, schedule)
+                # without pending inputs, i.e. all up-to-date
+                pipeline.unlock_paths()
+            except (OSError, concurrent.futures.BrokenExecutor) as exc:
+                pipeline.logger.error("[%s] %s", pipeline.data_path, str(exc))
+                pipeline.mark_fail()
+                # severe errors end workers, replace pool if broken
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = _new_executor(plan, n_executors)
+            finally:
+                pipeline.release_leases()
+    finally:
+        executor.shutdown()
+    pipeline.logger.info("daemon stopped")
 
 
 # main entry point
@@ -486,6 +1409,18 @@ if __name__ == '__main__':
         Use Pairwise and repeatable
         i.e. like "--dpi <val> --psm <val>"
         ''')
+    APP_ARGUMENTS.add_argument(
+        "--resume",
+        required=False,
+        default=False,
+        action='store_true',
+        help="skip inputs with up-to-date output from same configuration")
+    APP_ARGUMENTS.add_argument(
+        "--daemon",
+        required=False,
+        default=False,
+        action='store_true',
+        help="keep watching data_path(s) for open directories")
     ARGS = vars(APP_ARGUMENTS.parse_args())
 
     DATA_PATH = ARGS["data_path"]
@@ -501,37 +1436,65 @@ if __name__ == '__main__':
     # update pipeline configuration with cli args
     pipeline.merge_args(ARGS)
     EXECUTORS = pipeline.cfg.getint('pipeline', 'executors')
-    INPUT_PATHS = pipeline.input_sorted(ARGS['recursive'])
-    pipeline.logger.info("%d inputs for pipeline", len(INPUT_PATHS))
-    INPUT_NUMBERED = [(i, img)
-                      for i, img in enumerate(INPUT_PATHS, start=1)]
+    # pending chunks, enough to keep executors busy
+    SUBMIT_WINDOW = pipeline.cfg.getint('pipeline', 'submit_window',
+                                        fallback=4 * EXECUTORS)
+    SCHEDULE = pipeline.cfg.get('pipeline', 'schedule', fallback=SCHEDULE_NAME)
+
+    # compile steps once, each worker re-uses them for all its inputs
+    PLAN = pipeline.get_step_plan()
+    if pipeline.cfg.getboolean('pipeline', 'staging', fallback=False):
+        PLAN.use_scratch(tempfile.mkdtemp(prefix='scratch-',
+                                          dir=pipeline.prepare_workdir()),
+                         pipeline.cfg.getint('pipeline', 'prefetch',
+                                             fallback=ocr_scratch.DEFAULT_PREFETCH))
+        pipeline.logger.info("stage inputs at '%s'", PLAN.scratch_dir)
+    if ARGS['daemon']:
+        try:
+            _run_daemon(DATA_PATH.split(','), PLAN, EXECUTORS,
+                        SUBMIT_WINDOW, SCHEDULE, ARGS['resume'])
+        finally:
+            PLAN.drop_scratch()
+        sys.exit(0)
+    pipeline.input_sorted(ARGS['recursive'])
 
     # set start time
     START_TS = time.time()
 
     try:
-        # lock directories for concurrent ocr-workers
-        pipeline.lock_paths()
+        # lease and lock directories for concurrent ocr-workers
+        INPUT_PATHS = pipeline.lock_paths()
+        if ARGS['resume']:
+            N_ALL = len(INPUT_PATHS)
+            INPUT_PATHS = pipeline.pending_inputs(INPUT_PATHS, PLAN)
+            pipeline.logger.info("resume plan '%s', skip %d up-to-date inputs",
+                                 PLAN.fingerprint, N_ALL - len(INPUT_PATHS))
+        pipeline.logger.info("%d inputs for pipeline (schedule by %s)",
+                             len(INPUT_PATHS), SCHEDULE)
 
         # perform sequential part of pipeline with parallel processing
-        with concurrent.futures.ProcessPoolExecutor(max_workers=EXECUTORS) as executor:
-            RESULTS = list(executor.map(_execute_pipeline, INPUT_NUMBERED))
-            pipeline.logger.info("having %d workflow results", len(RESULTS))
-            estimations = [r for r in RESULTS if r is not None and r[1] > MARK_MISSING_ESTM]
-            if estimations:
-                pipeline.store_estimations(estimations)
+        with _new_executor(PLAN, EXECUTORS) as executor:
+            SUMMARY = _process_inputs(executor, PLAN, INPUT_PATHS,
+                                      SUBMIT_WINDOW, SCHEDULE)
+            pipeline.logger.info("having %d workflow results", SUMMARY.n_outcomes)
+            if SUMMARY.estimations:
+                pipeline.logger.info("WTE (Mean) of all inputs: '%.1f'",
+                                     SUMMARY.mean)
             else:
                 pipeline.logger.warning("no ocr qa data available")
     except OSError as exc:
         pipeline.logger.error("%s", str(exc))
         pipeline.mark_fail()
         raise OSError from exc
-
-    if isinstance(pipeline.data_path, str):
-        pipeline.mark_done()
-    else:
-        # un-lock directories with recursive processing
-        pipeline.unlock_paths()
+    finally:
+        PLAN.drop_scratch()
+
+    # directories are done as soon as their last input is finished,
+    # so only those without pending inputs are left, if resumed
+    pipeline.unlock_paths()
+    # data_path itself, too, if there were no inputs at all
+    pipeline.mark_done()
+    pipeline.release_leases()
     DELTA_TS = (time.time()) - START_TS
     MSG_RT = f'{DELTA_TS:.2f} sec ({math.floor(DELTA_TS/60)}min {math.floor(DELTA_TS % 60)}sec)'
     END_TS = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
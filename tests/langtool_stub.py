@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Local stand-in for language tool service
+
+Answers like the speller rule of language tool with a match for
+each word token which looks suspicious, that is it contains other
+characters than letters or mixed case, or is missing in the
+optional lexicon. Offsets count UTF-16 code units like the
+actual Java service does.
+"""
+
+import http.server
+import json
+import re
+import threading
+import time
+import urllib.parse
+
+WORD_TOKEN = re.compile(r'\w+')
+
+
+def is_typo(word, lexicon=None):
+    """Word flagged by stub speller"""
+
+    if lexicon is not None:
+        return word.lower() not in lexicon
+    return not word.isalpha() or not (word[1:].islower() or word.isupper())
+
+
+def check(text, lexicon=None):
+    """Matches of text as language tool returns them"""
+
+    matches = []
+    for token in WORD_TOKEN.finditer(text):
+        if is_typo(token.group(), lexicon):
+            offset = len(text[:token.start()].encode('utf-16-le')) // 2
+            length = len(token.group().encode('utf-16-le')) // 2
+            matches.append({'offset': offset, 'length': length,
+                            'rule': {'id': 'GERMAN_SPELLER_RULE'}})
+    return matches
+
+
+class LangToolStub():
+    """Serve check requests on localhost in a thread of its own,
+    each delayed by latency seconds to resemble service overhead"""
+
+    def __init__(self, lexicon=None, latency=0.0):
+        self.lexicon = lexicon
+        self.latency = latency
+        self.n_requests = 0
+        self.n_chars = 0
+        self._server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        """Check endpoint of stub"""
+
+        return f"http://127.0.0.1:{self._server.server_port}/v2/check"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def _handler(self):
+        stub = self
+
+        class _Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # headers and body are sent apart, which would
+            # otherwise wait for delayed acknowledgement
+            disable_nagle_algorithm = True
+
+            def do_HEAD(self):  # pylint: disable=invalid-name
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                form = urllib.parse.parse_qs(body.decode('utf-8'))
+                text = form.get('text', [''])[0]
+                stub.n_requests += 1
+                stub.n_chars += len(text)
+                time.sleep(stub.latency)
+                answer = json.dumps({'matches': check(text, stub.lexicon)})
+                answer = answer.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(answer)))
+                self.end_headers()
+                self.wfile.write(answer)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return _Handler
@@ -0,0 +1,128 @@
+"""Specification for OCR Result Cache"""
+
+import os
+import pickle
+
+from lib.ocr_cache import (
+    OCRResultCache,
+    VerdictCache,
+    hash_file,
+)
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_cache_key_by_content_and_fingerprint(tmp_path):
+    """Same contents under different name share key"""
+
+    # arrange
+    cache = OCRResultCache(str(tmp_path / 'cache'))
+    img_a = _write(tmp_path / 'a.tif', b'II*\x00scan')
+    img_b = _write(tmp_path / 'b.tif', b'II*\x00scan')
+    img_c = _write(tmp_path / 'c.tif', b'II*\x00other')
+
+    # assert
+    assert hash_file(img_a) == hash_file(img_b)
+    assert cache.key(img_a, 'frk') == cache.key(img_b, 'frk')
+    assert cache.key(img_a, 'frk') != cache.key(img_a, 'deu')
+    assert cache.key(img_a, 'frk') != cache.key(img_c, 'frk')
+
+
+def test_cache_store_fetch(tmp_path):
+    """Fetched entry is an independent copy"""
+
+    # arrange
+    cache = OCRResultCache(str(tmp_path / 'cache'))
+    alto = _write(tmp_path / 'a.xml', b'<alto/>')
+    target = str(tmp_path / 'b.xml')
+
+    # act
+    missed = cache.fetch('ab12', target)
+    cache.store('ab12', alto)
+    hit = cache.fetch('ab12', target)
+    with open(target, 'wb') as t_file:
+        t_file.write(b'<alto>changed</alto>')
+
+    # assert
+    assert not missed
+    assert hit
+    assert cache.fetch('ab12', target)
+    with open(target, 'rb') as t_file:
+        assert t_file.read() == b'<alto/>'
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.tmp')]
+
+
+def test_cache_evict_least_recently_used(tmp_path):
+    """Entries with oldest access are dropped first"""
+
+    # arrange
+    cache = OCRResultCache(str(tmp_path / 'cache'), max_mb=2048 / 1024 / 1024)
+    alto = _write(tmp_path / 'a.xml', bytes(1000))
+    for i, key in enumerate(['aa01', 'bb02', 'cc03']):
+        cache.store(key, alto)
+        os.utime(cache._entry(key), (i + 1, i + 1))
+    # recent hit
+    assert cache.fetch('aa01', str(tmp_path / 'b.xml'))
+
+    # act
+    n_dropped = cache.evict()
+
+    # assert
+    assert n_dropped == 1
+    assert not os.path.exists(cache._entry('bb02'))
+    assert os.path.exists(cache._entry('aa01'))
+    assert os.path.exists(cache._entry('cc03'))
+
+
+def test_verdict_cache_least_recently_used():
+    """Verdicts used lately are kept, others are evicted"""
+
+    # arrange
+    cache = VerdictCache('de-DE|GERMAN_SPELLER_RULE', 2)
+    cache.store({'Haus': 0, 'Hauß': 1})
+
+    # act
+    assert cache.fetch(['Haus', 'Boot']) == {'Haus': 0}
+    cache.store({'Boot': 0})
+
+    # assert
+    assert len(cache) == 2
+    assert cache.fetch(['Haus', 'Hauß', 'Boot']) == {'Haus': 0, 'Boot': 0}
+
+
+def test_verdict_cache_shared_by_database(tmp_path):
+    """Verdicts of other workers are taken from database,
+    but only for same language and rules"""
+
+    # arrange
+    path_db = str(tmp_path / 'verdicts.sqlite')
+    worker_a = VerdictCache('de-DE|GERMAN_SPELLER_RULE', path_db=path_db)
+    worker_b = pickle.loads(pickle.dumps(worker_a))
+    other_rules = VerdictCache('de-DE|OTHER_RULE', path_db=path_db)
+
+    # act
+    worker_a.store({'Hauß': 1, 'Haus': 0})
+
+    # assert
+    assert len(worker_b) == 0
+    assert worker_b.fetch(['Haus', 'Hauß', 'Boot']) == {'Haus': 0, 'Hauß': 1}
+    assert len(worker_b) == 2
+    assert other_rules.fetch(['Haus']) == {}
+
+
+def test_verdict_cache_invalid_database(tmp_path, capsys):
+    """Unusable database leaves verdicts in memory only"""
+
+    # arrange
+    cache = VerdictCache('de-DE', path_db=str(tmp_path))
+
+    # act
+    cache.store({'Haus': 0})
+
+    # assert
+    assert cache.path_db is None
+    assert cache.fetch(['Haus']) == {'Haus': 0}
+    assert 'verdict cache' in capsys.readouterr().err
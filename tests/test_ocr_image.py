@@ -0,0 +1,62 @@
+"""Specification for Image Header Inspection"""
+
+import struct
+
+import pytest
+
+from lib.ocr_image import (
+    image_pixels,
+    image_size,
+)
+
+
+def _png(width, height):
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', len(ihdr)) + b'IHDR' + ihdr
+
+
+def _jpeg(width, height):
+    app0 = b'\xff\xe0' + struct.pack('>H', 16) + b'JFIF\x00' + bytes(9)
+    sof0 = b'\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 1) + bytes(3)
+    return b'\xff\xd8' + app0 + b'\xff' + sof0
+
+
+def _tiff(width, height, order='<'):
+    head = b'II*\x00' if order == '<' else b'MM\x00*'
+    entries = struct.pack(order + 'HHIHH', 256, 3, 1, width, 0)
+    entries += struct.pack(order + 'HHII', 257, 4, 1, height)
+    return head + struct.pack(order + 'IH', 8, 2) + entries + bytes(4)
+
+
+@pytest.mark.parametrize('file_name,data', [
+    ('scan.png', _png(2479, 3508)),
+    ('scan.jpg', _jpeg(2479, 3508)),
+    ('scan.tif', _tiff(2479, 3508)),
+    ('scan_mm.tif', _tiff(2479, 3508, '>')),
+])
+def test_image_size_from_header(tmp_path, file_name, data):
+    """Width and height from different image formats"""
+
+    # arrange
+    path = tmp_path / file_name
+    path.write_bytes(data)
+
+    # act
+    actual = image_size(path)
+
+    # assert
+    assert actual == (2479, 3508)
+    assert image_pixels(path) == 2479 * 3508
+
+
+def test_image_size_unknown(tmp_path):
+    """Unknown or truncated data yields no size"""
+
+    path_xml = tmp_path / 'scan.tif'
+    path_xml.write_text('<?xml version="1.0"?>')
+    path_cut = tmp_path / 'cut.png'
+    path_cut.write_bytes(_png(10, 10)[:12])
+
+    assert image_size(path_xml) is None
+    assert image_pixels(path_cut) is None
+    assert image_size(tmp_path / 'missing.jpg') is None
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""Specification for Directory Leases"""
+
+import json
+import logging
+import time
+
+from lib.ocr_lease import (
+    DirectoryLease,
+    LeaseKeeper,
+)
+
+
+def _expire(lease, seconds=3600):
+    record = lease.read()
+    record['heartbeat'] -= seconds
+    with open(lease.path, 'w', encoding='UTF-8') as l_file:
+        l_file.write(json.dumps(record))
+
+
+def test_lease_exclusive(tmp_path):
+    """Only one of several contenders gets the lease"""
+
+    # arrange
+    lease_a = DirectoryLease(str(tmp_path))
+    lease_b = DirectoryLease(str(tmp_path))
+
+    # act
+    acquired = [lease_a.acquire(), lease_b.acquire()]
+
+    # assert
+    assert acquired == [True, False]
+    assert lease_a.read()['token'] == lease_a.token
+    assert not lease_b.held
+
+
+def test_lease_take_over_stale(tmp_path):
+    """Expired lease of a crashed holder can be taken over"""
+
+    # arrange
+    crashed = DirectoryLease(str(tmp_path))
+    assert crashed.acquire()
+    _expire(crashed)
+    lease = DirectoryLease(str(tmp_path))
+
+    # act
+    acquired = lease.acquire()
+
+    # assert
+    assert acquired
+    assert lease.read()['token'] == lease.token
+    assert not crashed.refresh()
+    assert not crashed.held
+    assert [p.name for p in tmp_path.iterdir()] == ['ocr_pipeline_lease']
+
+
+def test_lease_refresh_heartbeat(tmp_path):
+    """Refreshed lease isn't stale anymore"""
+
+    # arrange
+    lease = DirectoryLease(str(tmp_path), ttl=60)
+    assert lease.acquire()
+    _expire(lease, 120)
+    assert lease.is_stale()
+
+    # act
+    refreshed = lease.refresh()
+
+    # assert
+    assert refreshed
+    assert not lease.is_stale()
+
+
+def test_lease_release(tmp_path):
+    """Released lease can be acquired by others, but releasing
+    a lease already taken over keeps the new holder's one"""
+
+    # arrange
+    lease_a = DirectoryLease(str(tmp_path))
+    lease_b = DirectoryLease(str(tmp_path))
+    lease_c = DirectoryLease(str(tmp_path))
+    assert lease_a.acquire()
+
+    # act
+    lease_a.release()
+    assert lease_b.acquire()
+    _expire(lease_b)
+    assert lease_c.acquire()
+    lease_b.release()
+
+    # assert
+    assert lease_c.read()['token'] == lease_c.token
+
+
+def test_lease_keeper(tmp_path):
+    """Keeper refreshes heartbeat in background"""
+
+    # arrange
+    lease = DirectoryLease(str(tmp_path), ttl=60)
+    assert lease.acquire()
+    _expire(lease, 120)
+    keeper = LeaseKeeper([lease], 0.01)
+
+    # act
+    keeper.start()
+    time.sleep(0.1)
+    keeper.stop()
+    keeper.join()
+
+    # assert
+    assert not lease.is_stale()
+
+
+def test_lease_refresh_lost(tmp_path):
+    """Lease taken over by others is reported lost on refresh"""
+
+    # arrange
+    lease_a = DirectoryLease(str(tmp_path))
+    lease_b = DirectoryLease(str(tmp_path))
+    assert lease_a.acquire()
+    _expire(lease_a)
+    assert lease_b.acquire()
+
+    # act
+    refreshed = lease_a.refresh()
+
+    # assert
+    assert not refreshed
+    assert lease_a.lost
+    assert not lease_b.lost
+    assert lease_b.read()['token'] == lease_b.token
+
+
+def test_lease_keeper_retries_failed_refresh(tmp_path, monkeypatch, capsys):
+    """Keeper goes on after refresh failed with an error"""
+
+    # arrange
+    lease = DirectoryLease(str(tmp_path), ttl=60)
+    assert lease.acquire()
+    _expire(lease, 120)
+    refresh = lease.refresh
+    n_calls = []
+
+    def _refresh_flaky():
+        n_calls.append(1)
+        if len(n_calls) == 1:
+            raise OSError("stale file handle")
+        return refresh()
+
+    monkeypatch.setattr(lease, 'refresh', _refresh_flaky)
+    keeper = LeaseKeeper([lease], 0.01)
+
+    # act
+    keeper.start()
+    time.sleep(0.1)
+    keeper.stop()
+    keeper.join()
+
+    # assert
+    assert len(n_calls) > 1
+    assert not lease.is_stale()
+    assert not lease.lost
+    assert "stale file handle" in capsys.readouterr().err
+
+
+def test_lease_keeper_logs_lost_lease(tmp_path, caplog):
+    """Lease lost to others is reported to logger of keeper"""
+
+    # arrange
+    lease_a = DirectoryLease(str(tmp_path))
+    lease_b = DirectoryLease(str(tmp_path))
+    assert lease_a.acquire()
+    _expire(lease_a)
+    assert lease_b.acquire()
+    caplog.set_level(logging.WARNING, logger='lease_test')
+    keeper = LeaseKeeper([lease_a], 0.01, logging.getLogger('lease_test'))
+
+    # act
+    keeper.start()
+    time.sleep(0.1)
+    keeper.stop()
+    keeper.join()
+
+    # assert
+    assert lease_a.lost
+    lost = [m for m in caplog.messages if 'lost to' in m]
+    assert len(lost) == 1
+    assert lease_b.token in lost[0]
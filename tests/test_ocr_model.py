@@ -8,6 +8,9 @@ import lxml.etree as ET
 
 from lib.ocr_model import (
     get_lines,
+    iter_lines,
+    parse_points,
+    LineStore,
 )
 
 RES_ROOT = os.path.abspath(os.path.join('tests', 'resources'))
@@ -69,3 +72,158 @@ def test_get_lines_page_empty_lines_but_word_exception():
     # assert
     assert "just words for line 'line_1617688885509_1198'" in str(
         exc.value)
+
+
+@pytest.mark.parametrize('ocr_res', ['1667522809_J_0073_0512.xml',
+                                     '288652.xml',
+                                     'OCR-RESULT_0001.xml',
+                                     'ram110.xml',
+                                     'Lubab_alAlbab.pdf_000003.xml'])
+def test_iter_lines_like_get_lines(ocr_res):
+    """Streamed lines equal lines of fully parsed tree"""
+
+    # arrange
+    res_path = os.path.join(RES_ROOT, ocr_res)
+    expected = get_lines(ET.parse(res_path), reorder=True)
+
+    # act
+    lines = list(iter_lines(res_path, reorder=True))
+
+    # assert
+    assert [(line.element_id, line.text) for line in lines] == [
+        (e.element_id, e.get_textline_content()) for e in expected]
+    for (line, line_expected) in zip(lines, expected):
+        xs = [int(point[0]) for point in line_expected.shape]
+        ys = [int(point[1]) for point in line_expected.shape]
+        assert line.bbox == (min(xs), min(ys), max(xs), max(ys))
+
+
+def test_iter_lines_from_file_object_minlen():
+    """Stream from file object with larger min_len"""
+
+    # arrange
+    res_alto = os.path.join(RES_ROOT, '1667522809_J_0073_0512.xml')
+
+    # act
+    with open(res_alto, 'rb') as alto_file:
+        lines = list(iter_lines(alto_file, min_len=32))
+
+    # assert
+    assert len(lines) == 225
+    assert lines[0].get_textline_content() == lines[0].text
+
+
+def test_iter_lines_page_empty_lines_but_word_exception():
+    """Streaming fails for words without line text, too"""
+
+    # arrange
+    ocr_res = os.path.join(RES_ROOT, '1123596.xml')
+
+    # act
+    with pytest.raises(RuntimeError) as exc:
+        list(iter_lines(ocr_res))
+
+    # assert
+    assert "just words for line 'line_1617688885509_1198'" in str(
+        exc.value)
+
+
+@pytest.mark.parametrize('ocr_res', ['1667522809_J_0073_0512.xml',
+                                     'OCR-RESULT_0001.xml'])
+def test_get_lines_compact(ocr_res):
+    """Compact store offers same contents as TextLine objects"""
+
+    # arrange
+    xml_data = ET.parse(os.path.join(RES_ROOT, ocr_res))
+    expected = get_lines(xml_data)
+
+    # act
+    store = get_lines(xml_data, compact=True)
+
+    # assert
+    assert isinstance(store, LineStore)
+    assert len(store) == len(expected)
+    assert store.bboxes.shape == (len(expected), 4)
+    assert [(line.element_id, line.get_textline_content()) for line in store] == [
+        (e.element_id, e.get_textline_content()) for e in expected]
+    assert store.texts() == [e.get_textline_content() for e in expected]
+    assert store[-1].bbox == expected[-1].bbox
+
+
+def test_line_store_views():
+    """Views read from buffers of their store"""
+
+    # arrange
+    store = LineStore(['l1', 'line_2'], ['Die', 'Polizei-Verwaltung.'],
+                      [(1, 2, 3, 4), (5, 6, 70, 80)])
+
+    # act
+    view = store[1]
+
+    # assert
+    assert view.element_id == 'line_2'
+    assert view.text == 'Polizei-Verwaltung.'
+    assert view.bbox == (5, 6, 70, 80)
+    assert store[0].get_textline_content() == 'Die'
+    with pytest.raises(IndexError):
+        store[2]
+    assert not list(LineStore([], [], []))
+
+
+def test_parse_points_at_once():
+    """All points of many elements in one array with offsets"""
+
+    # act
+    (points, offsets) = parse_points(['1,2 3,4', '10,20 30,40 50,60', ''])
+
+    # assert
+    assert points.tolist() == [[1, 2], [3, 4], [10, 20], [30, 40], [50, 60]]
+    assert offsets.tolist() == [0, 2, 5, 5]
+
+
+@pytest.mark.parametrize('points_attr', ['1,2 3', '1,2 3,x'])
+def test_parse_points_invalid(points_attr):
+    """Odd or non-numeric coordinates are not silently shifted"""
+
+    with pytest.raises(ValueError):
+        parse_points(['0,0 1,1', points_attr])
+
+
+PAGE_LINE = """<PcGts xmlns="http://schema.primaresearch.org/PAGE/gts/pagecontent/2019-07-15">
+<Page><TextRegion id="r1"><TextLine id="l1">
+<Coords points="0,0 300,0 300,20 0,20"/>
+<Word id="w3"><Coords points="{w3}"/><TextEquiv><Unicode>drei</Unicode></TextEquiv></Word>
+<Word id="w1"><Coords points="0,0 90,0 90,20 0,20"/><TextEquiv><Unicode>eins</Unicode></TextEquiv></Word>
+<Word id="w2"><Coords points="100,0 190,0 190,20 100,20"/><TextEquiv><Unicode>zwei</Unicode></TextEquiv></Word>
+<TextEquiv><Unicode>drei eins zwei</Unicode></TextEquiv>
+</TextLine></TextRegion></Page></PcGts>"""
+
+
+def test_get_lines_page_words_reading_order():
+    """Words ordered by their centers, line shape from line coords"""
+
+    # arrange
+    xml_data = ET.ElementTree(ET.fromstring(
+        PAGE_LINE.format(w3='200,0 290,0 290,20 200,20')))
+
+    # act
+    lines = get_lines(xml_data)
+
+    # assert
+    assert lines[0].get_textline_content() == 'eins zwei drei'
+    assert lines[0].shape.tolist() == [[0, 0], [300, 0], [300, 20], [0, 20]]
+    assert str(lines[0].shape.dtype) == 'uint32'
+
+
+def test_get_lines_page_word_invalid_coords():
+    """Word without coordinates is an error"""
+
+    # arrange
+    xml_data = ET.ElementTree(ET.fromstring(PAGE_LINE.format(w3='')))
+
+    # act
+    with pytest.raises(RuntimeError) as err:
+        get_lines(xml_data)
+
+    # assert
+    assert "Invalid Coords of Word 'w3' in 'l1'!" in err.value.args[0]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""Specification for Scandata Scanner"""
+
+import os
+
+from lib.ocr_scan import (
+    scan_dir,
+    scan_tree,
+)
+
+
+def _tree(tmp_path):
+    root = tmp_path / 'scans'
+    for (sub, names) in [('a', ['0002.jpg', '0001.jpg', 'ocr_open']),
+                         ('a/x', ['0001.tif']),
+                         ('b', ['notes.txt'])]:
+        (root / sub).mkdir(parents=True)
+        for name in names:
+            (root / sub / name).write_bytes(b'')
+    return root
+
+
+def test_scan_dir_collects_images_and_markers(tmp_path):
+    """Single directory inspected without descending"""
+
+    # arrange
+    root = _tree(tmp_path)
+
+    # act
+    (the_dir, sub_dirs) = scan_dir(str(root / 'a'), ['jpg', 'tif'])
+
+    # assert
+    assert the_dir.image_paths() == [str(root / 'a' / '0001.jpg'),
+                                     str(root / 'a' / '0002.jpg')]
+    assert 'ocr_open' in the_dir.names
+    assert sub_dirs == [str(root / 'a' / 'x')]
+
+
+def test_scan_tree_top_down(tmp_path):
+    """All directories are visited once in sorted order"""
+
+    # arrange
+    root = _tree(tmp_path)
+    os.symlink(root / 'a', root / 'c')
+
+    # act
+    scan_dirs = list(scan_tree(str(root), ['tif']))
+
+    # assert
+    assert [os.path.relpath(d.path, root) for d in scan_dirs] == \
+        ['.', 'a', os.path.join('a', 'x'), 'b']
+    assert [len(d.images) for d in scan_dirs] == [0, 0, 1, 0]
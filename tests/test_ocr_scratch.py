@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Specification for Staging on local Scratch Space"""
+
+import os
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
+
+from lib.ocr_scratch import (
+    clear,
+    prefetch,
+    release,
+    scratch_path,
+    stage_in,
+    stage_out,
+)
+
+
+def _inputs(tmp_path, n_inputs):
+    share = tmp_path / 'share'
+    share.mkdir()
+    paths = []
+    for i in range(1, n_inputs + 1):
+        path = share / f"{i:04d}.tif"
+        path.write_bytes(b'II*\x00' + bytes([i]))
+        paths.append(str(path))
+    return paths
+
+
+def test_stage_in_out_release(tmp_path):
+    """Result replaces target, scratch files get dropped"""
+
+    # arrange
+    (path_in,) = _inputs(tmp_path, 1)
+    scratch = str(tmp_path / 'scratch')
+    target = tmp_path / 'share' / '0001.xml'
+    target.write_text('<old/>')
+
+    # act
+    path_local = stage_in(scratch, 1, path_in)
+    path_result = os.path.join(os.path.dirname(path_local), '0001.xml')
+    with open(path_result, 'w', encoding='UTF-8') as result:
+        result.write('<alto/>')
+    stage_out(path_result, str(target))
+    release(scratch, 1)
+
+    # assert
+    assert path_local == scratch_path(scratch, 1, path_in)
+    assert path_local.startswith(scratch)
+    assert target.read_text() == '<alto/>'
+    assert sorted(os.listdir(tmp_path / 'share')) == ['0001.tif', '0001.xml']
+    assert not os.listdir(scratch)
+
+
+def test_stage_in_replaces_leftover(tmp_path):
+    """Leftover of another input with same number and name
+    is replaced, a prefetched copy is re-used"""
+
+    # arrange
+    (path_in,) = _inputs(tmp_path, 1)
+    other = tmp_path / 'other'
+    other.mkdir()
+    path_other = other / '0001.tif'
+    path_other.write_bytes(b'II*\x00other issue')
+    scratch = str(tmp_path / 'scratch')
+    stage_in(scratch, 1, str(path_other))
+
+    # act
+    path_local = stage_in(scratch, 1, path_in)
+    mtime = os.stat(path_local).st_mtime_ns
+    path_again = stage_in(scratch, 1, path_in)
+    with open(path_again, 'rb') as local_file:
+        content = local_file.read()
+    clear(scratch)
+
+    # assert
+    assert path_again == path_local
+    assert content == b'II*\x00\x01'
+    assert mtime == os.stat(path_in).st_mtime_ns
+    assert not os.path.exists(path_local)
+    assert os.path.isdir(scratch)
+
+
+def test_prefetch_ahead(tmp_path):
+    """Chunks are yielded in order once copied, while
+    at most depth inputs are copied ahead"""
+
+    # arrange
+    paths = _inputs(tmp_path, 6)
+    scratch = str(tmp_path / 'scratch')
+    chunks = [[(i, path)] for (i, path) in enumerate(paths, 1)]
+
+    # act
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        yielded = []
+        for chunk in prefetch(iter(chunks), scratch, 2, executor):
+            (number, path) = chunk[0]
+            assert os.path.exists(scratch_path(scratch, number, path))
+            assert max(int(d) for d in os.listdir(scratch)) <= number + 2
+            yielded.append(chunk)
+            release(scratch, number)
+
+    # assert
+    assert yielded == chunks
@@ -0,0 +1,80 @@
+"""Specification for Word List"""
+
+import os
+import pickle
+
+from lib.ocr_words import (
+    WordList,
+    compile_words,
+)
+
+
+def _word_list(path, words):
+    path.write_text('\n'.join(words) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def test_compile_words_once(tmp_path):
+    """Compiled word list is re-used until word list changes"""
+
+    # arrange
+    path_words = _word_list(tmp_path / 'words.txt',
+                            ['# comment', 'Straße', 'alt/AB', '', 'Haus'])
+    cache_dir = str(tmp_path)
+
+    # act
+    path_compiled = compile_words(path_words, cache_dir)
+    mtime = os.stat(path_compiled).st_mtime_ns
+    words = WordList(path_words, cache_dir)
+
+    # assert
+    assert words.path_compiled == path_compiled
+    assert os.stat(path_compiled).st_mtime_ns == mtime
+    assert len(words) == 3
+    assert WordList(path_compiled).contains(['alt']).tolist() == [True]
+
+
+def test_word_list_contains(tmp_path):
+    """Words wider than any known word are never truncated into hits"""
+
+    # arrange
+    words = WordList(_word_list(tmp_path / 'words.txt',
+                                ['Haus', 'Straße', 'alt']), str(tmp_path))
+
+    # act
+    found = words.contains(['Straße', 'Strasse', 'Hausboot', 'alt', 'zzz', ''])
+
+    # assert
+    assert found.tolist() == [True, False, False, True, False, False]
+
+
+def test_word_list_count_misses(tmp_path):
+    """Only tokens with letters count, which are known neither as
+    they are nor in usual case variants"""
+
+    # arrange
+    words = WordList(_word_list(tmp_path / 'words.txt',
+                                ['die', 'alte', 'Stadt']), str(tmp_path))
+    tokens = ['Die', 'alte', '„Stadt,', 'DIE', 'STADT', '1848', '—',
+              'Stadtx', 'Alte.', 'stadt']
+
+    # act
+    n_misses = words.count_misses(tokens)
+
+    # assert
+    assert n_misses == 2
+
+
+def test_word_list_pickled_without_mapping(tmp_path):
+    """Each worker maps compiled word list on it's own"""
+
+    # arrange
+    words = WordList(_word_list(tmp_path / 'words.txt', ['alt']), str(tmp_path))
+    assert words.contains(['alt']).all()
+
+    # act
+    clone = pickle.loads(pickle.dumps(words))
+
+    # assert
+    assert clone._words is None  # pylint: disable=protected-access
+    assert clone.contains(['alt']).all()
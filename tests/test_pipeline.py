@@ -1,19 +1,41 @@
 # -*- coding: utf-8 -*-
 """Tests OCR Pipeline API"""
 
+import glob
+import json
 import logging
 import os
 import pathlib
+import pickle
 import shutil
 import configparser
+import threading
+import time
+
+from concurrent.futures import (
+    ThreadPoolExecutor
+)
 
 import pytest
 
+import ocr_pipeline
 from ocr_pipeline import (
+    RunSummary,
     OCRPipeline,
-    profile
+    StagedExecutor,
+    _process_inputs,
+    StepPlan,
+    numbered_chunks,
+    profile,
+    stream_results
+)
+from lib.ocr_lease import (
+    DirectoryLease
 )
 from lib.ocr_step import (
+    StepI,
+    StepEstimateOCR,
+    StepPostRemoveFile,
     StepTesseract,
     StepPostReplaceChars,
     StepPostReplaceCharsRegex
@@ -153,6 +175,61 @@ def test_ocr_pipeline_mark_done(default_pipeline):
         assert last_entry.endswith('mark state ocr_pipeline_done')
 
 
+def test_ocr_pipeline_mark_done_empty_dir(tmp_path):
+    """Directory without any inputs is marked done, too,
+    but a directory done already keeps it's marker"""
+
+    # arrange
+    empty_dir = tmp_path / "scandata"
+    empty_dir.mkdir()
+    (empty_dir / "ocr_pipeline_open").write_text("opened\n")
+    pipeline = OCRPipeline(str(empty_dir), log_dir=str(tmp_path))
+    pipeline.input_sorted()
+
+    # act like main does
+    input_paths = pipeline.lock_paths()
+    pipeline.unlock_paths()
+    pipeline.mark_done()
+    marked = (empty_dir / "ocr_pipeline_done").read_text()
+    pipeline.mark_done()
+    pipeline.release_leases()
+
+    # assert
+    assert not input_paths
+    assert sorted(p.name for p in empty_dir.iterdir()) == ['ocr_pipeline_done']
+    assert marked.startswith("opened")
+    assert (empty_dir / "ocr_pipeline_done").read_text() == marked
+
+
+def test_ocr_pipeline_mark_done_leased_by_other(a_workspace):
+    """Directory leased by another worker keeps it's busy marker"""
+
+    # arrange
+    data_dir = a_workspace / "scandata"
+    log_dir = a_workspace / "log"
+    worker_a = OCRPipeline(str(data_dir), log_dir=str(log_dir))
+    worker_a.input_sorted()
+    assert worker_a.lock_paths()
+    worker_b = OCRPipeline(str(data_dir), log_dir=str(log_dir))
+    worker_b.input_sorted()
+
+    # act like main does
+    input_paths = worker_b.lock_paths()
+    worker_b.unlock_paths()
+    worker_b.mark_done()
+    worker_b.release_leases()
+
+    # assert
+    assert not input_paths
+    assert (data_dir / "ocr_pipeline_busy").exists()
+    assert not (data_dir / "ocr_pipeline_done").exists()
+    assert worker_a.leases[0].read()['token'] == worker_a.leases[0].token
+    worker_a.unlock_paths()
+    worker_a.mark_done()
+    worker_a.release_leases()
+    assert (data_dir / "ocr_pipeline_done").exists()
+
+
 def test_ocr_pipeline_get_images(default_pipeline):
     """check images are sorted"""
 
@@ -373,3 +450,634 @@ def test_pipeline_gather_images_from_dirs_with_marks(recursive_workspace):
 
     # re-check: now these paths won't be taken into account anymore
     assert not pipeline.input_sorted()
+
+
+def test_pipeline_step_plan_picklable(custom_config_pipeline):
+    """Step plan must survive transfer into worker processes"""
+
+    # arrange
+    plan = custom_config_pipeline.get_step_plan()
+
+    # act
+    restored = pickle.loads(pickle.dumps(plan))
+
+    # assert
+    assert len(restored) == 5
+    assert [type(s) for s in restored.steps] == [type(s) for s in plan.steps]
+    assert restored.steps[1].dict_chars == plan.steps[1].dict_chars
+
+
+def test_pipeline_step_plan_reset(custom_config_pipeline, a_workspace):
+    """Re-used steps must not carry state of previous page"""
+
+    # arrange
+    plan = custom_config_pipeline.get_step_plan()
+    step_tess = plan.steps[0]
+    step_replace = plan.steps[1]
+    step_tess.path_in = a_workspace / 'scandata' / RES_0001_TIF
+    step_replace._update_replacements('ic)')
+
+    # act
+    steps = plan.reset()
+    step_tess.path_in = a_workspace / 'scandata' / RES_0002_PNG
+
+    # assert
+    assert steps[1] is step_replace
+    assert not step_replace.statistics
+    assert step_tess.cmd.split()[1].endswith('scandata/0002.png')
+
+
+def test_pipeline_numbered_chunks():
+    """Inputs get numbered before grouped into chunks"""
+
+    # act
+    chunks = list(numbered_chunks(['a.tif', 'b.tif', 'c.tif'], 2))
+
+    # assert
+    assert chunks == [[(1, 'a.tif'), (2, 'b.tif')], [(3, 'c.tif')]]
+
+
+def test_pipeline_stream_results_bounded():
+    """Never more than window chunks pending"""
+
+    # arrange
+    lock = threading.Lock()
+    state = {'submitted': 0, 'max_pending': 0}
+
+    def _chunks():
+        for i in range(50):
+            with lock:
+                state['submitted'] += 1
+            yield i
+
+    def _square(i):
+        with lock:
+            done = i + 1
+            state['max_pending'] = max(state['max_pending'],
+                                       state['submitted'] - done)
+        return i * i
+
+    # act
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        results = list(stream_results(executor, _square, _chunks(), 4))
+
+    # assert
+    assert sorted(results) == [i * i for i in range(50)]
+    assert state['max_pending'] <= 4
+
+
+def test_pipeline_estimation_summary():
+    """Running aggregates equal aggregates of complete results"""
+
+    # arrange
+    estms = [('0001.tif', 21.476, 3143, 675, 506, 29, 24, 482),
+             ('0002.png', 38.799, 1482, 575, 193, 11, 34, 159),
+             None,
+             ('0003.jpg', -1),
+             ('0004.jpg', 89.519, 582, 230, 152, 2, 12, 140)]
+    summary = RunSummary()
+
+    # act
+    for estm in estms:
+        summary.add(estm)
+
+    # assert
+    (mean, bins) = StepEstimateOCR.analyze(summary.estimations)
+    assert summary.n_outcomes == 5
+    assert len(summary.estimations) == 3
+    assert summary.mean == mean
+    assert summary.bins == [len(b) for b in bins]
+
+
+def test_pipeline_summary_hit_rates():
+    """Hit rates of caches from pairs of step counters"""
+
+    # arrange
+    summary = RunSummary()
+
+    # act
+    summary.counters.update({'verdict_hit': 3, 'verdict_miss': 1,
+                             'cache_miss': 2})
+    summary.counters.update({'verdict_hit': 4})
+
+    # assert
+    assert summary.hit_rates() == {'verdict': 87.5}
+
+
+def test_pipeline_numbered_chunks_largest_first(tmp_path):
+    """Scheduled by size, inputs keep their numbers"""
+
+    # arrange
+    paths = []
+    for i, size in enumerate([10, 300, 20], start=1):
+        path = tmp_path / f"000{i}.tif"
+        path.write_bytes(bytes(size))
+        paths.append(str(path))
+
+    # act
+    chunks = list(numbered_chunks(paths, 2, schedule='size'))
+
+    # assert
+    assert chunks == [[(2, paths[1]), (3, paths[2])], [(1, paths[0])]]
+
+
+def test_pipeline_fingerprint(default_pipeline):
+    """Fingerprint changes with models but not with timeouts"""
+
+    # arrange
+    fp_start = default_pipeline.get_fingerprint()
+
+    # act
+    default_pipeline.cfg['step_01']['timeout'] = '600'
+    fp_timeout = default_pipeline.get_fingerprint()
+    default_pipeline.merge_args({'models': 'ara'})
+    fp_models = default_pipeline.get_fingerprint()
+
+    # assert
+    assert fp_start == fp_timeout
+    assert fp_start != fp_models
+    assert default_pipeline.get_step_plan().fingerprint == fp_models
+
+
+def test_pipeline_resume_pending_inputs(default_pipeline):
+    """Only inputs missing or with stale output are pending"""
+
+    # arrange
+    plan = default_pipeline.get_step_plan()
+    inputs = default_pipeline.input_sorted()
+    scan_dir = default_pipeline.data_path
+    for path_in in inputs:
+        shutil.copyfile(RES_00041_XML, plan.output_path(path_in))
+        default_pipeline.record_done(path_in, plan.fingerprint)
+    # 0002: output older than image
+    path_0002 = os.path.join(scan_dir, RES_0002_PNG)
+    os.utime(plan.output_path(path_0002), (1, 1))
+    # 0003: created from other configuration
+    default_pipeline.record_done(os.path.join(scan_dir, RES_0003_JPG), 'other')
+
+    # act
+    pending = default_pipeline.pending_inputs(inputs, plan)
+
+    # assert
+    assert pending == [path_0002, os.path.join(scan_dir, RES_0003_JPG)]
+
+
+def test_pipeline_lock_paths_skips_leased_dirs(recursive_workspace):
+    """Directories leased by other workers are left alone"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    scan_dir2 = recursive_workspace / "scans" / "scandata2"
+    for scan_dir in (scan_dir1, scan_dir2):
+        (scan_dir / "ocr_pipeline_open").write_text("")
+    other = DirectoryLease(str(scan_dir2))
+    assert other.acquire()
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    pipeline.input_sorted(recursive=True)
+
+    # act
+    input_paths = pipeline.lock_paths()
+    pipeline.release_leases()
+
+    # assert
+    assert len(input_paths) == 1
+    assert "scans/scandata1/0001.tif" in input_paths[0]
+    assert (scan_dir1 / "ocr_pipeline_busy").exists()
+    assert not (scan_dir1 / "ocr_pipeline_lease").exists()
+    assert (scan_dir2 / "ocr_pipeline_open").exists()
+    assert other.read()['token'] == other.token
+
+
+def test_pipeline_takes_over_stale_busy_dir(recursive_workspace):
+    """Busy directory of a crashed worker gets processed again"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    (scan_dir1 / "ocr_pipeline_open").write_text("")
+    log_dir = recursive_workspace / "log"
+    crashed = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    crashed.input_sorted(recursive=True)
+    crashed.lock_paths()
+    crashed.release_leases()
+    crashed_lease = DirectoryLease(str(scan_dir1))
+    assert crashed_lease.acquire()
+    record = crashed_lease.read()
+    record['heartbeat'] -= 3600
+    (scan_dir1 / "ocr_pipeline_lease").write_text(json.dumps(record))
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+
+    # act
+    input_paths = pipeline.input_sorted(recursive=True)
+    locked_paths = pipeline.lock_paths()
+
+    # assert
+    assert len(input_paths) == 1
+    assert locked_paths == input_paths
+    assert pipeline.leases[0].read()['token'] == pipeline.leases[0].token
+    pipeline.release_leases()
+
+
+def test_pipeline_claim_next_open_dir(recursive_workspace):
+    """Daemon claims open directories one after another"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    scan_dir2 = recursive_workspace / "scans" / "scandata2"
+    for scan_dir in (scan_dir1, scan_dir2):
+        (scan_dir / "ocr_pipeline_open").write_text("")
+    roots = [str(recursive_workspace / "scans")]
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(roots[0], log_dir=str(log_dir))
+
+    # act
+    first = pipeline.claim_next(roots)
+    first_dir = pipeline.data_path
+    pipeline.mark_done()
+    pipeline.release_leases()
+    second = pipeline.claim_next(roots)
+    second_dir = pipeline.data_path
+    pipeline.mark_done()
+    pipeline.release_leases()
+
+    # assert
+    assert first == [str(scan_dir1 / RES_0001_TIF)]
+    assert first_dir == str(scan_dir1)
+    assert second == [str(scan_dir2 / RES_0003_JPG)]
+    assert second_dir == str(scan_dir2)
+    assert (scan_dir2 / "ocr_pipeline_done").exists()
+    assert not pipeline.claim_next(roots)
+
+
+def test_pipeline_step_plan_stages(custom_config_pipeline):
+    """Consecutive steps of same stage are grouped, and
+    a step's stage can be changed by configuration"""
+
+    # arrange
+    steps = custom_config_pipeline.get_step_plan()
+
+    # act
+    custom_config_pipeline.cfg['step_04']['stage'] = 'post'
+    changed = custom_config_pipeline.get_step_plan()
+
+    # assert
+    assert steps.stages() == [('ocr', 0, 1), ('post', 1, 3),
+                              ('qa', 3, 4), ('post', 4, 5)]
+    assert changed.stages() == [('ocr', 0, 1), ('post', 1, 5)]
+    assert changed.fingerprint == steps.fingerprint
+
+
+class _StageRecorder(StepI):
+    """Note stage and process in input file"""
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def execute(self):
+        with open(self.path_in, 'a', encoding='UTF-8') as the_file:
+            the_file.write(f"{self.stage}:{os.getpid()}\n")
+
+
+def test_pipeline_staged_executor(default_pipeline, tmp_path, monkeypatch):
+    """Each stage runs on executor of its own, estimation
+    within parent process"""
+
+    # arrange
+    monkeypatch.setattr(ocr_pipeline, 'pipeline', default_pipeline,
+                        raising=False)
+    plan = StepPlan([_StageRecorder('ocr'), _StageRecorder('post'),
+                     _StageRecorder('post'), _StageRecorder('qa')])
+    input_paths = []
+    for i in range(6):
+        path = tmp_path / f"{i:04d}.txt"
+        path.write_text('')
+        input_paths.append(str(path))
+
+    # act
+    with StagedExecutor(plan, 2, 1, 2) as executor:
+        results = list(executor.stream(numbered_chunks(input_paths, 2),
+                                       len(input_paths), 2))
+
+    # assert
+    assert sorted(path for (chunk, _, _, _) in results
+                  for (_, path) in chunk) == input_paths
+    assert all(outcomes[0][1] == -1 for (_, outcomes, _, _) in results)
+    for path in input_paths:
+        records = [line.split(':') for line in
+                   pathlib.Path(path).read_text().splitlines()]
+        assert [stage for (stage, _) in records] == ['ocr', 'post', 'post', 'qa']
+        (ocr_pid, post_pid, _, qa_pid) = [int(pid) for (_, pid) in records]
+        assert len({ocr_pid, post_pid, os.getpid()}) == 3
+        assert qa_pid == os.getpid()
+
+
+class _BatchRecorder(_StageRecorder):
+    """Note size of batch each input was prepared with"""
+
+    batch_size = 4
+
+    def __init__(self, stage):
+        super().__init__(stage)
+        self.n_prepared = 0
+
+    def prepare_batch(self, paths):
+        # let pages pile up while first batch is processed
+        if not self.n_prepared:
+            time.sleep(0.5)
+        self.n_prepared += 1
+        for path in paths:
+            with open(path, 'a', encoding='UTF-8') as the_file:
+                the_file.write(f"batch:{len(paths)}\n")
+        return paths
+
+
+def test_pipeline_staged_executor_batches_qa(default_pipeline, tmp_path, monkeypatch):
+    """Pages waiting for estimation are prepared at once, if
+    leading step of stage is able to process batches"""
+
+    # arrange
+    monkeypatch.setattr(ocr_pipeline, 'pipeline', default_pipeline,
+                        raising=False)
+    plan = StepPlan([_StageRecorder('ocr'), _BatchRecorder('qa')])
+    input_paths = []
+    for i in range(8):
+        path = tmp_path / f"{i:04d}.txt"
+        path.write_text('')
+        input_paths.append(str(path))
+
+    # act
+    with StagedExecutor(plan, 2, 1, 1) as executor:
+        results = list(executor.stream(numbered_chunks(input_paths, 1),
+                                       len(input_paths), 8))
+
+    # assert
+    assert len(results) == len(input_paths)
+    batch_sizes = []
+    for path in input_paths:
+        records = [line.split(':') for line in
+                   pathlib.Path(path).read_text().splitlines()]
+        assert [tag for (tag, _) in records if tag != 'batch'] == ['ocr', 'qa']
+        batch_sizes += [int(n) for (tag, n) in records if tag == 'batch']
+    assert max(batch_sizes) > 1
+    assert max(batch_sizes) <= _BatchRecorder.batch_size
+
+
+def test_pipeline_step_plan_staging(tmp_path):
+    """Only final result of steps run on scratch space
+    is moved next to input"""
+
+    # arrange
+    share = tmp_path / 'share'
+    share.mkdir()
+    path_in = str(share / RES_0001_TIF)
+    shutil.copyfile(RES_00041_XML, path_in)
+    plan = StepPlan([StepPostRemoveFile({'file_suffix': 'tif'})])
+    plan.use_scratch(str(tmp_path / 'scratch'))
+
+    # act
+    path_local = plan.stage_in(1, path_in)
+    path_alto = os.path.splitext(path_local)[0] + '.xml'
+    shutil.copyfile(path_local, path_alto)
+    plan.steps[0].path_in = path_local
+    plan.steps[0].execute()
+    path_result = plan.stage_out(1, path_in, path_alto)
+    plan.release(1)
+
+    # assert
+    assert path_local != path_in
+    assert path_result == str(share / '0001.xml')
+    assert sorted(os.listdir(share)) == ['0001.tif', '0001.xml']
+    assert not os.listdir(tmp_path / 'scratch')
+    plan.drop_scratch()
+    assert not os.path.exists(tmp_path / 'scratch')
+
+
+def test_pipeline_paths_by_dir_unlock(recursive_workspace):
+    """Inputs are grouped by directory, which get
+    un-locked each at once"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    scan_dir2 = recursive_workspace / "scans" / "scandata2"
+    shutil.copyfile(RES_00041_XML, scan_dir1 / RES_0002_PNG)
+    for scan_dir in (scan_dir1, scan_dir2):
+        (scan_dir / "ocr_pipeline_open").write_text("")
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    pipeline.input_sorted(recursive=True)
+    pipeline.lock_paths()
+
+    # act
+    groups = pipeline.paths_by_dir()
+    pipeline.unlock_paths()
+    pipeline.release_leases()
+
+    # assert
+    assert groups == {
+        str(scan_dir1): [str(scan_dir1 / RES_0001_TIF),
+                         str(scan_dir1 / RES_0002_PNG)],
+        str(scan_dir2): [str(scan_dir2 / RES_0003_JPG)]}
+    for scan_dir in (scan_dir1, scan_dir2):
+        assert sorted(p.name for p in scan_dir.iterdir()
+                      if p.name.startswith('ocr_pipeline')) == ['ocr_pipeline_done']
+
+
+class _FakeEstimation(StepEstimateOCR):
+    """Estimate without language tool, but note which
+    directories are done meanwhile"""
+
+    def __init__(self, dirs_done):
+        super().__init__({})
+        self.dirs_done = dirs_done
+
+    def enabled(self):
+        return True
+
+    def execute(self):
+        self.dirs_done.append(sorted(
+            os.path.basename(os.path.dirname(p))
+            for p in glob.glob(os.path.join(os.path.dirname(
+                os.path.dirname(self.path_in)), '*', 'ocr_pipeline_done'))))
+        self.hit_ratio = 50.0
+        self.n_words = 10
+
+
+def test_pipeline_completes_each_dir(recursive_workspace, monkeypatch):
+    """Directory is marked done with estimations of its own
+    as soon as its last input is finished"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    scan_dir2 = recursive_workspace / "scans" / "scandata2"
+    for scan_dir in (scan_dir1, scan_dir2):
+        (scan_dir / "ocr_pipeline_open").write_text("")
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    dirs_done = []
+    plan = StepPlan([_FakeEstimation(dirs_done)])
+    monkeypatch.setattr(ocr_pipeline, 'pipeline', pipeline, raising=False)
+    monkeypatch.setattr(ocr_pipeline, 'STEP_PLAN', plan)
+    input_paths = pipeline.input_sorted(recursive=True)
+    pipeline.lock_paths()
+
+    # act
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        summary = _process_inputs(executor, plan, input_paths, 1)
+
+    # assert
+    assert summary.n_outcomes == 2
+    assert dirs_done == [[], ['scandata1']]
+    for scan_dir in (scan_dir1, scan_dir2):
+        assert (scan_dir / "ocr_pipeline_done").exists()
+        assert len(list(scan_dir.glob('*.wtr'))) == 1
+    assert not pipeline.leases
+
+
+class _BrokenEstimation(_FakeEstimation):
+    """Estimate, but lose resources with input of first directory"""
+
+    def execute(self):
+        if os.path.basename(self.path_in) == RES_0001_TIF:
+            raise OSError("connection lost")
+        super().execute()
+
+
+def test_pipeline_daemon_survives_severe_error(recursive_workspace, monkeypatch):
+    """Directory with severe worker error is marked failed
+    and the daemon goes on with the next one"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    scan_dir2 = recursive_workspace / "scans" / "scandata2"
+    for scan_dir in (scan_dir1, scan_dir2):
+        (scan_dir / "ocr_pipeline_open").write_text("")
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    plan = StepPlan([_BrokenEstimation([])])
+    stop_daemon = threading.Event()
+    claim_next = pipeline.claim_next
+
+    def _claim_once(roots):
+        input_paths = claim_next(roots)
+        if not input_paths:
+            stop_daemon.set()
+        return input_paths
+
+    monkeypatch.setattr(pipeline, 'claim_next', _claim_once)
+    monkeypatch.setattr(ocr_pipeline, 'pipeline', pipeline, raising=False)
+    monkeypatch.setattr(ocr_pipeline, 'STEP_PLAN', plan)
+    monkeypatch.setattr(ocr_pipeline, 'STOP_DAEMON', stop_daemon)
+    monkeypatch.setattr(ocr_pipeline, '_new_executor',
+                        lambda *_: ThreadPoolExecutor(max_workers=1))
+
+    # act
+    ocr_pipeline._run_daemon(  # pylint: disable=protected-access
+        [str(recursive_workspace / "scans")], plan, 1, 1, 'name')
+
+    # assert
+    assert (scan_dir1 / "ocr_pipeline_fail").exists()
+    assert not (scan_dir1 / "ocr_pipeline_busy").exists()
+    assert not (scan_dir1 / "ocr_pipeline_lease").exists()
+    assert (scan_dir2 / "ocr_pipeline_done").exists()
+    assert not pipeline.leases
+
+
+def test_pipeline_logs_staging_error(default_pipeline, monkeypatch, caplog):
+    """Severe error while staging an input is logged with
+    the input before the pipeline gets halted"""
+
+    # arrange
+    path_in = os.path.join(default_pipeline.data_path, RES_0001_TIF)
+    plan = StepPlan([_FakeEstimation([])])
+
+    def _stage_in(*_):
+        raise OSError("scratch unavailable")
+
+    monkeypatch.setattr(plan, 'stage_in', _stage_in)
+    monkeypatch.setattr(ocr_pipeline, 'pipeline', default_pipeline, raising=False)
+    monkeypatch.setattr(ocr_pipeline, 'STEP_PLAN', plan)
+    caplog.set_level(logging.INFO, logger="ocr_pipeline")
+
+    # act
+    with pytest.raises(ocr_pipeline.PipelineHalt):
+        ocr_pipeline._execute_pipeline((1, path_in), 1)  # pylint: disable=protected-access
+
+    # assert
+    assert f"[{path_in}] halt pipeline: scratch unavailable" in caplog.messages
+
+
+def test_pipeline_clears_scratch_after_halt(recursive_workspace, monkeypatch):
+    """Prefetched inputs of halted input list are dropped, since
+    numbering starts over with next one"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    (scan_dir1 / "ocr_pipeline_open").write_text("")
+    for name in ("0004.tif", "0005.tif", "0006.tif"):
+        shutil.copyfile(RES_00041_XML, scan_dir1 / name)
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    plan = StepPlan([_BrokenEstimation([])])
+    scratch_dir = recursive_workspace / "scratch"
+    scratch_dir.mkdir()
+    plan.use_scratch(str(scratch_dir))
+    monkeypatch.setattr(ocr_pipeline, 'pipeline', pipeline, raising=False)
+    monkeypatch.setattr(ocr_pipeline, 'STEP_PLAN', plan)
+    input_paths = pipeline.input_sorted(recursive=True)
+    pipeline.lock_paths()
+
+    # act
+    with pytest.raises(ocr_pipeline.PipelineHalt):
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            _process_inputs(executor, plan, input_paths, 1)
+    pipeline.release_leases()
+
+    # assert
+    assert scratch_dir.exists()
+    assert not list(scratch_dir.iterdir())
+
+
+def test_pipeline_leaves_dir_of_lost_lease(recursive_workspace):
+    """Directory taken over by another worker meanwhile is
+    neither completed nor unlocked nor failed twice"""
+
+    # arrange
+    scan_dir1 = recursive_workspace / "scans" / "scandata1"
+    (scan_dir1 / "ocr_pipeline_open").write_text("")
+    log_dir = recursive_workspace / "log"
+    pipeline = OCRPipeline(str(recursive_workspace), log_dir=str(log_dir))
+    pipeline.input_sorted(recursive=True)
+    pipeline.lock_paths()
+    record = pipeline.leases[0].read()
+    record['token'] = 'other'
+    (scan_dir1 / "ocr_pipeline_lease").write_text(json.dumps(record))
+    assert not pipeline.leases[0].refresh()
+    estms = [('0001.tif', 39.519, 582, 230, 152, 2, 12, 140)]
+
+    # act
+    pipeline.complete_dir(str(scan_dir1), estms)
+    pipeline.unlock_paths()
+    pipeline.mark_fail()
+    pipeline.release_leases()
+
+    # assert
+    assert (scan_dir1 / "ocr_pipeline_busy").exists()
+    assert not list(scan_dir1.glob('*.wtr'))
+    assert json.loads((scan_dir1 / "ocr_pipeline_lease").read_text())['token'] == 'other'
+
+
+def test_pipeline_estimations_of_dir_from_list(recursive_workspace):
+    """Estimations are stored per directory with list inputs, too"""
+
+    # arrange
+    scan_dir2 = recursive_workspace / "scans" / "scandata2"
+    dirs = str(recursive_workspace / "scans" / "scandata1") + ',' + str(scan_dir2)
+    pipeline = OCRPipeline(dirs, log_dir=str(recursive_workspace / "log"))
+    estms = [('0003.jpg', 39.519, 582, 230, 152, 2, 12, 140)]
+
+    # act
+    wtr_path = pipeline.store_estimations(estms, str(scan_dir2))
+
+    # assert
+    assert os.path.dirname(wtr_path) == str(scan_dir2)
+    assert os.path.basename(wtr_path).startswith('scandata2_')
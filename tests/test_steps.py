@@ -1,10 +1,14 @@
 # -*- coding: utf-8 -*-
 """Tests OCR API"""
 
+import copy
 import json
 import os
 import pathlib
+import pickle
 import shutil
+import stat
+import time
 
 from unittest import (
     mock
@@ -16,8 +20,17 @@ import requests
 
 import pytest
 
+from tests.langtool_stub import (
+    LangToolStub
+)
+
+from lib.ocr_words import (
+    TOKEN_EDGES
+)
+
 from lib.ocr_step import (
     NAMESPACES,
+    OCRDocument,
     StepIO,
     StepTesseract,
     StepPostMoveAlto,
@@ -27,8 +40,14 @@ from lib.ocr_step import (
     StepException,
     StepEstimateOCR,
     StepPostprocessALTO,
+    _format_xml_reparsed,
+    count_matches,
+    pack_texts,
     textlines2data,
+    format_xml,
     get_lines,
+    literal_pattern,
+    split_alto_pages,
 )
 
 PROJECT_ROOT_DIR = pathlib.Path(__file__).resolve().parents[1]
@@ -185,6 +204,287 @@ def test_step_tesseract_different_configurations(max_dir):
     assert tesseract_cmd == step.cmd
 
 
+@pytest.fixture(name='alto_batch')
+def _fixture_alto_batch(tmp_path):
+    """ALTO like tesseract creates it from list of 2 images"""
+
+    xml_root = ET.parse(os.path.join('tests', 'resources', '16331011.xml'))
+    first_page = xml_root.find('.//alto:Page', NAMESPACES)
+    second_page = copy.deepcopy(first_page)
+    second_page.attrib['PHYSICAL_IMG_NR'] = '1'
+    second_page.attrib['ID'] = 'page_1'
+    first_page.addnext(second_page)
+    path_batch = tmp_path / 'batch.xml'
+    xml_root.write(str(path_batch), encoding='UTF-8', xml_declaration=True)
+    return str(path_batch)
+
+
+def _fake_tesseract(tmp_path, script):
+    path_bin = tmp_path / 'fake_tesseract'
+    path_bin.write_text(f"#!/bin/sh\n{script}\n")
+    path_bin.chmod(path_bin.stat().st_mode | stat.S_IEXEC)
+    return str(path_bin)
+
+
+def test_split_alto_pages(alto_batch, max_dir):
+    """Each page of batch result ends up in it's own ALTO file"""
+
+    # arrange
+    paths_in = [os.path.join(max_dir, TIF_001), os.path.join(max_dir, TIF_002)]
+    paths_out = [os.path.join(max_dir, '001.xml'), os.path.join(max_dir, '002.xml')]
+
+    # act
+    split_alto_pages(alto_batch, paths_in, paths_out)
+
+    # assert
+    for path_in, path_out in zip(paths_in, paths_out):
+        xml_root = ET.parse(path_out)
+        pages = xml_root.findall('.//alto:Page', NAMESPACES)
+        assert len(pages) == 1
+        assert pages[0].attrib['ID'] == 'page_0'
+        assert xml_root.find('.//alto:fileName', NAMESPACES).text == path_in
+
+
+def test_split_alto_pages_mismatch(alto_batch, max_dir):
+    """Missing pages must not be mapped to wrong images"""
+
+    paths = [os.path.join(max_dir, TIF_001)]
+
+    with pytest.raises(StepException) as exc:
+        split_alto_pages(alto_batch, paths, paths)
+
+    assert "expect 1 pages" in str(exc.value)
+
+
+def test_step_tesseract_batch(alto_batch, max_dir, tmp_path):
+    """Batch mode calls tesseract once and skips single calls"""
+
+    # arrange
+    the_bin = _fake_tesseract(tmp_path, f'cp {alto_batch} "$2.xml"')
+    args = {'tesseract_bin': the_bin, '-l': 'deu', 'alto': None, 'batch_size': '2'}
+    paths = [os.path.join(max_dir, TIF_001), os.path.join(max_dir, TIF_002)]
+    step = StepTesseract(args)
+
+    # act
+    prepared = step.prepare_batch(paths)
+
+    # assert
+    assert prepared == paths
+    for path in paths:
+        step.path_in = path
+        step.execute()
+        assert os.path.exists(step.path_next)
+    assert not step._batch_done
+
+
+def test_step_tesseract_batch_failure(max_dir, tmp_path):
+    """Failed batch leaves all pages for single calls"""
+
+    # arrange
+    the_bin = _fake_tesseract(tmp_path, 'exit 1')
+    args = {'tesseract_bin': the_bin, '-l': 'deu', 'batch_size': '2'}
+    paths = [os.path.join(max_dir, TIF_001), os.path.join(max_dir, TIF_002)]
+    step = StepTesseract(args)
+
+    # act
+    with pytest.raises(StepException):
+        step.prepare_batch(paths)
+
+    # assert
+    assert not step._batch_done
+
+
+class _FakeTessAPI:
+    """Mimics tesserocr.PyTessBaseAPI"""
+
+    instances = []
+
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+        self.variables = {}
+        self.images = []
+        _FakeTessAPI.instances.append(self)
+
+    def SetVariable(self, name, val):  # pylint: disable=invalid-name
+        self.variables[name] = val
+
+    def SetImageFile(self, path):  # pylint: disable=invalid-name
+        self.images.append(path)
+
+    @staticmethod
+    def GetAltoText(_):  # pylint: disable=invalid-name
+        xml_root = ET.parse(os.path.join('tests', 'resources', '16331011.xml'))
+        page = xml_root.find('.//alto:Page', NAMESPACES)
+        page.tail = None
+        return ET.tostring(page, encoding='unicode').replace(
+            ' xmlns="http://www.loc.gov/standards/alto/ns-v3#"', '')
+
+    @staticmethod
+    def Version():  # pylint: disable=invalid-name
+        return '4.1.1'
+
+
+@mock.patch('lib.ocr_step.tesserocr')
+def test_step_tesseract_engine_api(mock_tesserocr, max_dir):
+    """In-process engine creates API once and same ALTO like cli"""
+
+    # arrange
+    _FakeTessAPI.instances = []
+    mock_tesserocr.PyTessBaseAPI = _FakeTessAPI
+    args = {'-l': 'frk+deu', 'extra': '--dpi 300 --psm 4', 'engine': 'api'}
+    step = StepTesseract(args)
+    paths = [os.path.join(max_dir, TIF_001), os.path.join(max_dir, TIF_002)]
+
+    # act
+    for path in paths:
+        step.path_in = path
+        step.execute()
+
+    # assert
+    assert len(_FakeTessAPI.instances) == 1
+    api = _FakeTessAPI.instances[0]
+    assert api.kwargs == {'lang': 'frk+deu', 'psm': 4}
+    assert api.variables == {'user_defined_dpi': '300'}
+    assert api.images == paths
+    xml_root = ET.parse(os.path.join(max_dir, '002.xml'))
+    assert xml_root.find('.//alto:fileName', NAMESPACES).text == paths[1]
+    assert xml_root.find('.//alto:softwareName', NAMESPACES).text == 'tesseract 4.1.1'
+    assert len(xml_root.findall('.//alto:String', NAMESPACES)) == 275
+    assert step.__getstate__()['_api'] is None
+
+
+@mock.patch('lib.ocr_step.tesserocr', None)
+def test_step_tesseract_engine_api_fallback(max_dir):
+    """Without tesserocr the cli remains"""
+
+    step = StepTesseract({'-l': 'deu', 'engine': 'api'})
+    step.path_in = os.path.join(max_dir, TIF_001)
+
+    assert step.engine == 'cli'
+    assert step.cmd.startswith('tesseract ')
+
+
+@mock.patch('lib.ocr_step.tesserocr')
+def test_step_tesseract_engine_api_unsupported_param(mock_tesserocr, max_dir, capsys):
+    """Params the in-process engine doesn't know fall back
+    to the cli once, rather than failing each page"""
+
+    # arrange
+    mock_tesserocr.PyTessBaseAPI = _FakeTessAPI
+    args = {'-l': 'deu', 'extra': '--dpi 300 --user-words words.txt',
+            'engine': 'api'}
+
+    # act
+    step = StepTesseract(args)
+    step.path_in = os.path.join(max_dir, TIF_001)
+
+    # assert
+    assert step.engine == 'cli'
+    assert '--user-words words.txt' in step.cmd
+    assert "param '--user-words' not supported" in capsys.readouterr().err
+
+
+def test_step_tesseract_args_without_shell(tmp_path):
+    """Paths with blanks stay single arguments"""
+
+    # arrange
+    scan_dir = tmp_path / 'scan data'
+    scan_dir.mkdir()
+    path_in = scan_dir / TIF_001
+    path_in.write_bytes(b'II*')
+    step = StepTesseract({'-l': 'deu', 'extra': '--dpi 300', 'timeout': '60'})
+
+    # act
+    step.path_in = path_in
+
+    # assert
+    assert step.args == ['tesseract', str(path_in), str(scan_dir / '001'),
+                         '--dpi', '300', '-l', 'deu', 'alto']
+    assert step.timeout == 60
+
+
+def test_step_tesseract_timeout(max_dir, tmp_path):
+    """Hanging call is killed and reported as StepException"""
+
+    # arrange
+    the_bin = _fake_tesseract(tmp_path, 'sleep 10')
+    step = StepTesseract({'tesseract_bin': the_bin, 'timeout': '0.2'})
+    step.path_in = os.path.join(max_dir, TIF_001)
+
+    # act
+    with pytest.raises(StepException) as exc:
+        step.execute()
+
+    # assert
+    assert 'killed after 0.2s timeout' in str(exc.value)
+
+
+def test_step_tesseract_limit_cpu(max_dir, tmp_path):
+    """Runaway call is killed by cpu limit"""
+
+    # arrange
+    the_bin = _fake_tesseract(tmp_path, 'while :; do :; done')
+    step = StepTesseract({'tesseract_bin': the_bin, 'limit_cpu': '1',
+                          'timeout': '30'})
+    step.path_in = os.path.join(max_dir, TIF_001)
+
+    # act
+    with pytest.raises(StepException) as exc:
+        step.execute()
+
+    # assert
+    assert 'failed with signal SIGXCPU' in str(exc.value)
+
+
+def test_step_tesseract_batch_limit_cpu(alto_batch, max_dir, tmp_path):
+    """Batch call may spend cpu limit of each of it's pages"""
+
+    # arrange
+    limits = tmp_path / 'limits'
+    the_bin = _fake_tesseract(tmp_path, f'ulimit -t > {limits}\n'
+                                        f'cp {alto_batch} "$2.xml"')
+    args = {'tesseract_bin': the_bin, '-l': 'deu', 'batch_size': '2',
+            'limit_cpu': '1800'}
+    paths = [os.path.join(max_dir, TIF_001), os.path.join(max_dir, TIF_002)]
+    step = StepTesseract(args)
+
+    # act
+    prepared = step.prepare_batch(paths)
+
+    # assert
+    assert prepared == paths
+    assert limits.read_text().strip() == '3600'
+    assert step.limit_cpu == 1800
+
+
+def test_step_tesseract_cache(alto_batch, max_dir, tmp_path):
+    """Identical image under other name is taken from cache"""
+
+    # arrange
+    calls = tmp_path / 'calls'
+    the_bin = _fake_tesseract(
+        tmp_path,
+        'if [ "$1" = "--version" ]; then echo "tesseract 5.3.0"; exit 0; fi\n'
+        f'echo "$1" >> {calls}\n'
+        f'cp {os.path.join("tests", "resources", "16331011.xml")} "$2.xml"')
+    args = {'tesseract_bin': the_bin, '-l': 'deu',
+            'cache_dir': str(tmp_path / 'cache')}
+    step = StepTesseract(args)
+
+    # act
+    for path in [TIF_001, TIF_002]:
+        step.path_in = os.path.join(max_dir, path)
+        step.execute()
+
+    # assert
+    assert calls.read_text().splitlines() == [os.path.join(max_dir, TIF_001)]
+    xml_root = ET.parse(os.path.join(max_dir, '002.xml'))
+    assert xml_root.find('.//alto:fileName', NAMESPACES).text == os.path.join(
+        max_dir, TIF_002)
+    assert step.counters == {'cache_miss': 1, 'cache_hit': 1}
+    assert step.engine_fingerprint.startswith('tesseract 5.3.0|cli|-l deu alto')
+
+
 def test_step_copy_alto_back(max_dir):
     """
     Move ALTO file back to where we started
@@ -216,20 +516,60 @@ def test_step_replace():
     step = StepPostReplaceChars(params)
     step.path_in = src
 
-    lines = ['<String ID="string_405" WC="0.96" CONTENT="geweſen"/>']
-    lines.append('<String ID="string_406" WC="0.95" CONTENT="iſt."/>')
-    lines.append('<String ID="string_407" WC="0.96" CONTENT="Beſtätigt"/>')
+    xml_root = ET.fromstring(
+        '<TextLine>'
+        '<String ID="string_405" WC="0.96" CONTENT="geweſen"/>'
+        '<String ID="string_406" WC="0.95" CONTENT="iſt."/>'
+        '<String ID="string_407" WC="0.96" CONTENT="Beſtätigt"/>'
+        '</TextLine>')
 
     # act
-    step._replace(lines)
+    changes = step._replace(xml_root)
 
     # assert
-    assert len(step.lines_new) == 3
-    assert 'iſt.' not in step.lines_new[1]
-    assert 'ist.' in step.lines_new[1]
+    assert len(changes) == 3
+    assert changes[1][0].get('ID') == 'string_406'
+    assert changes[1][1] == 'ist.'
+    assert step.statistics == ['ſ:3']
     assert step.must_backup()
 
 
+def test_step_replace_escaped_keys_content_only():
+    """Keys escaped like in raw XML match unescaped text of
+    String/@CONTENT only, longest key first"""
+
+    # arrange
+    step = StepPostReplaceChars(
+        {'dict_chars': {'ic)': 'ich', 's&lt;': 'sc', '&lt;': 'c'}})
+    xml_root = ET.fromstring(
+        '<TextLine ID="l&lt;1">'
+        '<String ID="s1" CONTENT="s&lt;hön&lt;"/>'
+        '<String ID="s2" CONTENT="Ric)ter"/>'
+        '<SP ID="&lt;"/>'
+        '</TextLine>')
+
+    # act
+    changes = step._replace(xml_root)
+
+    # assert
+    assert [(e.get('ID'), content) for (e, content) in changes] == [
+        ('s1', 'schönc'), ('s2', 'Richter')]
+    assert step.statistics == ['s&lt;:1', '&lt;:1', 'ic):1']
+
+
+def test_literal_pattern_longest_first():
+    """Longest literal wins at each position"""
+
+    # arrange
+    pattern = literal_pattern(['i', 'ic', 'ic)', 'ſ', '.*'])
+
+    # act
+    found = pattern.findall('iſt ic ic) i.*')
+
+    # assert
+    assert found == ['i', 'ſ', 'ic', 'ic)', 'i', '.*']
+
+
 @pytest.fixture(name='empty_ocr')
 def fixture_empty_ocr(tmpdir):
     """create tmp data empty ALTO XML"""
@@ -313,7 +653,7 @@ def test_regex_replacements(tmp_500_gray):
     """check regex replacements in total"""
 
     # arrange
-    params = {'pattern': r'([aeioubcglnt]3[:-]*")', 'old': '3', 'new': 's'}
+    params = {'pattern': r'([aeioubcglnt]3[:-]*)$', 'old': '3', 'new': 's'}
     step = StepPostReplaceCharsRegex(params)
 
     # act
@@ -328,19 +668,74 @@ def test_regex_replacements(tmp_500_gray):
         for line in lines:
             assert 'u3"' not in line, 'detected trailing "3" in ' + line
 
-    expected = ['a3"=>as":5',
-                'u3"=>us":1',
-                'l3"=>ls":2',
-                'e3"=>es":4',
-                't3"=>ts":4',
-                'c3"=>cs":1',
-                'b3"=>bs":1',
-                'i3"=>is":2',
-                'g3"=>gs":1',
-                'n3"=>ns":1']
+    expected = ['a3=>as:5',
+                'u3=>us:1',
+                'l3=>ls:2',
+                'e3=>es:4',
+                't3=>ts:4',
+                'c3=>cs:1',
+                'b3=>bs:1',
+                'i3=>is:2',
+                'g3=>gs:1',
+                'n3=>ns:1']
     assert expected == step.statistics
 
 
+def test_regex_rule_table():
+    """All rules of table apply to every match, one after another,
+    and count replacements per rule"""
+
+    # arrange
+    rules = json.dumps([[r'([aeioubcglnt]3[:-]*)$', '3', 's'],
+                        [r'\bv(?=n)', 'v', 'u'],
+                        ['ſ', 'ſ', 's']])
+    step = StepPostReplaceCharsRegex({'rules': rules})
+    xml_root = ET.fromstring(
+        '<TextLine>'
+        '<String ID="s1" CONTENT="vnd"/>'
+        '<String ID="s2" CONTENT="Geſetze3"/>'
+        '<String ID="s3" CONTENT="ſoſo"/>'
+        '<String ID="s4" CONTENT="3"/>'
+        '</TextLine>')
+
+    # act
+    changes = step._replace(xml_root)
+
+    # assert
+    assert [(e.get('ID'), content) for (e, content) in changes] == [
+        ('s1', 'und'), ('s2', 'Gesetzes'), ('s3', 'soso')]
+    assert step.statistics == ['e3=>es:1', 'v=>u:1', 'ſ=>s:3']
+    step.reset()
+    assert not step.statistics
+
+
+def test_regex_rule_optional_group():
+    """Matches without their optional group are left as they are"""
+
+    # arrange
+    rules = json.dumps([[r'(x)?3', 'x', 'y']])
+    step = StepPostReplaceCharsRegex({'rules': rules})
+    xml_root = ET.fromstring(
+        '<TextLine>'
+        '<String ID="s1" CONTENT="a3"/>'
+        '<String ID="s2" CONTENT="ax3"/>'
+        '</TextLine>')
+
+    # act
+    changes = step._replace(xml_root)
+
+    # assert
+    assert [(e.get('ID'), content) for (e, content) in changes] == [('s2', 'ay3')]
+    assert step.statistics == ['x=>y:1']
+
+
+def test_regex_without_rules():
+    """Step needs at least one rule"""
+
+    with pytest.raises(StepException):
+        StepPostReplaceCharsRegex({'type': 'StepPostReplaceCharsRegex'})
+
+
 def test_remove_failed():
     """Test remove failed since file is missing"""
 
@@ -438,7 +833,7 @@ def test_step_estimateocr_empty_alto(empty_ocr):
     assert step.statistics[0] == -1
 
 
-@mock.patch("requests.head")
+@mock.patch("requests.Session.head")
 def test_service_down(mock_head):
     """Determine Behavior when url not accessible"""
 
@@ -457,6 +852,281 @@ def test_service_down(mock_head):
     assert step.statistics[0] == -1
 
 
+@mock.patch("requests.Session.head")
+def test_service_health_cached(mock_head):
+    """Service probed once with timeouts, state kept across pages"""
+
+    # arrange
+    params = {'service_url': 'http://localhost:8010/v2/check',
+              'timeout_connect': '2', 'timeout_read': '30'}
+    step = StepEstimateOCR(params)
+
+    # act
+    results = [step.enabled() for _ in range(3)]
+    step.reset()
+
+    # assert
+    assert results == [True, True, True]
+    assert step.enabled()
+    assert mock_head.call_count == 1
+    assert mock_head.call_args.kwargs['timeout'] == (2.0, 30.0)
+
+
+@mock.patch("requests.Session.head")
+def test_service_down_probed_again_after_pause(mock_head):
+    """Circuit opened by failure is probed again after pause,
+    which doubles with each failure in a row"""
+
+    # arrange
+    params = {'service_url': 'http://localhost:8010/v2/check',
+              'health_ttl': '10'}
+    step = StepEstimateOCR(params)
+    mock_head.side_effect = requests.Timeout
+
+    # act
+    assert not step.enabled()
+    # pylint: disable=protected-access
+    first_pause = step._health_until - time.monotonic()
+    step._health_until = 0.0
+    assert not step.enabled()
+    second_pause = step._health_until - time.monotonic()
+    step._health_until = 0.0
+    mock_head.side_effect = None
+
+    # assert
+    assert mock_head.call_count == 2
+    assert first_pause == pytest.approx(10, abs=1)
+    assert second_pause == pytest.approx(20, abs=1)
+    assert step.enabled()
+    assert mock_head.call_count == 3
+
+
+@mock.patch("requests.Session.head")
+@mock.patch("requests.Session.post")
+def test_service_request_failure_opens_circuit(mock_post, mock_head):
+    """Failed request skips page only and spares probes of next pages"""
+
+    # arrange
+    test_data = os.path.join(PROJECT_ROOT_DIR,
+                             'tests', 'resources', '500_gray00003.xml')
+    step = StepEstimateOCR({'service_url': 'http://localhost:8010/v2/check'})
+    step.path_in = test_data
+    mock_post.side_effect = requests.ReadTimeout
+
+    # act
+    with pytest.raises(StepException):
+        step.execute()
+    step.reset()
+    step.execute()
+
+    # assert
+    assert mock_head.call_count == 1
+    assert mock_post.call_count == 1
+    assert step.statistics[0] == -1
+
+
+def test_service_session_not_pickled():
+    """Connections are opened anew by each worker"""
+
+    # arrange
+    step = StepEstimateOCR({})
+    # pylint: disable=protected-access
+    session = step._get_session()
+
+    # act
+    clone = pickle.loads(pickle.dumps(step))
+
+    # assert
+    assert clone._session is None
+    assert step._session is session
+    session.close()
+
+
+def test_pack_texts_budget():
+    """Texts with separators fit into budget, except those
+    exceeding it on their own"""
+
+    # act
+    batches = pack_texts(['a' * 4, 'b' * 4, 'c' * 12, 'd' * 2, 'e' * 3], 10)
+
+    # assert
+    assert batches == [[0, 1], [2], [3, 4]]
+
+
+def test_count_matches_utf16_offsets():
+    """Offsets of matches count UTF-16 code units"""
+
+    # arrange
+    texts = ['\U0001d504\U0001d504 ab', 'cd ef', 'gh']
+    matches = [{'offset': 5}, {'offset': 9}, {'offset': 12}, {'offset': 16}]
+
+    # act
+    counts = count_matches(matches, texts, '\n\n')
+
+    # assert
+    assert counts == [1, 2, 1]
+
+
+ESTIMATION_PAGES = ['500_gray00003.xml', '1667522809_J_0073_0512.xml',
+                    '16331001.xml', '16331011.xml', '288652.xml',
+                    'OCR-RESULT_0001.xml']
+
+
+@pytest.mark.parametrize('batch_chars', [100000, 20000])
+def test_step_estimateocr_batch_like_single(batch_chars):
+    """Pages checked with shared requests get the very same
+    statistics as pages checked one by one"""
+
+    # arrange
+    paths = [os.path.join(PROJECT_ROOT_DIR, 'tests', 'resources', page)
+             for page in ESTIMATION_PAGES]
+    with LangToolStub() as stub:
+        single = StepEstimateOCR({'service_url': stub.url})
+        batched = StepEstimateOCR({'service_url': stub.url, 'batch_size': '8',
+                                   'batch_chars': str(batch_chars)})
+        expected = []
+        for path in paths:
+            single.reset()
+            single.path_in = path
+            single.execute()
+            expected.append(single.statistics)
+        n_single = stub.n_requests
+
+        # act
+        prepared = batched.prepare_batch(paths)
+        results = []
+        for path in paths:
+            batched.reset()
+            batched.path_in = path
+            batched.execute()
+            results.append(batched.statistics)
+
+    # assert
+    assert prepared == paths
+    assert results == expected
+    assert all(stats[2] > 0 for stats in results)
+    assert 1 <= stub.n_requests - n_single < len(paths)
+
+
+def test_step_estimateocr_verdict_cache(tmp_path):
+    """Tokens with cached verdicts are not checked again, even
+    by other workers sharing database, without changing results"""
+
+    # arrange
+    paths = [os.path.join(PROJECT_ROOT_DIR, 'tests', 'resources', page)
+             for page in ESTIMATION_PAGES[:3]]
+    with LangToolStub() as stub:
+        params = {'service_url': stub.url,
+                  'verdict_cache_db': str(tmp_path / 'verdicts.sqlite')}
+        expected = []
+        for path in paths:
+            single = StepEstimateOCR({'service_url': stub.url})
+            single.path_in = path
+            single.execute()
+            expected.append(single.statistics)
+        cached = StepEstimateOCR(params)
+        other_worker = pickle.loads(pickle.dumps(cached))
+        n_chars = stub.n_chars
+
+        # act
+        results = []
+        for path in paths:
+            cached.reset()
+            cached.path_in = path
+            cached.execute()
+            results.append(cached.statistics)
+        n_chars_cached = stub.n_chars - n_chars
+        n_requests = stub.n_requests
+        other_worker.path_in = paths[0]
+        other_worker.execute()
+
+    # assert
+    assert results == expected
+    assert n_chars_cached < n_chars
+    assert stub.n_requests == n_requests
+    assert other_worker.statistics == expected[0]
+    assert other_worker.counters['verdict_miss'] == 0
+    assert cached.counters['verdict_hit'] > 0
+
+
+def test_step_estimateocr_verdict_cache_batch():
+    """Batched pages share requests for tokens without verdict"""
+
+    # arrange
+    paths = [os.path.join(PROJECT_ROOT_DIR, 'tests', 'resources', page)
+             for page in ESTIMATION_PAGES]
+    with LangToolStub() as stub:
+        single = StepEstimateOCR({'service_url': stub.url,
+                                  'verdict_cache_size': '100000'})
+        batched = StepEstimateOCR({'service_url': stub.url, 'batch_size': '8',
+                                   'verdict_cache_size': '100000'})
+        expected = []
+        for path in paths:
+            single.reset()
+            single.path_in = path
+            single.execute()
+            expected.append(single.statistics)
+        n_requests = stub.n_requests
+
+        # act
+        prepared = batched.prepare_batch(paths)
+        results = []
+        for path in paths:
+            batched.reset()
+            batched.path_in = path
+            batched.execute()
+            results.append(batched.statistics)
+
+    # assert
+    assert prepared == paths
+    assert results == expected
+    # each distinct token checked only once either way
+    assert batched.counters['verdict_miss'] == single.counters['verdict_miss']
+    assert stub.n_requests - n_requests < n_requests
+
+
+@mock.patch("requests.Session.head")
+def test_step_estimateocr_dictionary(mock_head, tmp_path):
+    """Words looked up offline in word list, each word missing
+    from list counts as error"""
+
+    # arrange
+    test_data = os.path.join(PROJECT_ROOT_DIR,
+                             'tests', 'resources', '500_gray00003.xml')
+    (word_string, *_) = textlines2data(get_lines(ET.parse(test_data)))
+    words = [TOKEN_EDGES.sub('', t) for t in word_string.split()]
+    # words with '/' are cut into Hunspell-like word and flags
+    unknown = [w for w in words if w.lower() == 'und' or '/' in w]
+    known = set(words) - set(unknown)
+    path_words = tmp_path / 'words.txt'
+    path_words.write_text('\n'.join(known), encoding='utf-8')
+    step = StepEstimateOCR({'backend': 'dictionary',
+                            'dictionary': str(path_words),
+                            'dictionary_cache': str(tmp_path)})
+    step.path_in = test_data
+
+    # act
+    step.execute()
+
+    # assert
+    assert not mock_head.called
+    assert step.n_words == len(words)
+    assert step.n_errs == len(unknown) > 0
+    assert step.statistics[0] == round((step.n_words - step.n_errs)
+                                       / step.n_words * 100, 3)
+
+
+@pytest.mark.parametrize('params', [{'backend': 'dictionary'},
+                                    {'backend': 'dictionary',
+                                     'dictionary': '/no/such/words.txt'},
+                                    {'backend': 'spellchecker'}])
+def test_step_estimateocr_invalid_backend(params):
+    """Backend must be known and dictionary readable"""
+
+    with pytest.raises(StepException):
+        StepEstimateOCR(params)
+
+
 def test_step_estimateocr_textline_conversions():
     """Test functional behavior for valid ALTO-output"""
 
@@ -472,7 +1142,7 @@ def test_step_estimateocr_textline_conversions():
     assert n_lines_out == 346
 
 # pylint: disable=unused-argument
-def _fixture_languagetool(*args):
+def _fixture_languagetool(*args, **kwargs):
     result = mock.Mock()
     result.status_code = 200
     response_path = os.path.join(PROJECT_ROOT_DIR, 'tests', 'resources',
@@ -483,7 +1153,7 @@ def _fixture_languagetool(*args):
 
 
 @mock.patch("lib.ocr_step.StepEstimateOCR.enabled")
-@mock.patch("requests.post")
+@mock.patch("requests.Session.post")
 def test_step_estimateocr_lines_and_tokens_err_ratio(mock_post, mock_enabled):
     """Test behavior of for valid ALTO-output"""
 
@@ -511,7 +1181,7 @@ def test_step_estimateocr_lines_and_tokens_err_ratio(mock_post, mock_enabled):
 
 
 @mock.patch("lib.ocr_step.StepEstimateOCR.enabled")
-@mock.patch("requests.post")
+@mock.patch("requests.Session.post")
 def test_step_estimateocr_lines_and_tokens_hit_ratio(mock_post, mock_enabled):
     """Test behavior of for valid ALTO-output"""
 
@@ -673,3 +1343,92 @@ def test_process_odem_page_id(pipeline_odem_xml):
     """
     page_id = pipeline_odem_xml.find('.//alto:Page', NAMESPACES).attrib['ID']
     assert page_id == 'urn+nbn+de+gbv+3+1-121915-p0159-6_ger'
+
+
+def _post_chain():
+    return [StepPostReplaceChars({'dict_chars': {'ſ': 's', 'ic)': 'ich'}}),
+            StepPostprocessALTO(),
+            StepPostReplaceCharsRegex({'pattern': r'(J[a-z]+)',
+                                       'old': 'a', 'new': 'ä'})]
+
+
+def test_step_document_shared_like_standalone(tmp_path):
+    """Steps sharing a document write the very same file
+    as steps reading and writing it one after another"""
+
+    # arrange
+    path_alone = tmp_path / 'alone' / '500_gray00003.xml'
+    path_shared = tmp_path / 'shared' / '500_gray00003.xml'
+    for path in (path_alone, path_shared):
+        path.parent.mkdir()
+        shutil.copyfile('./tests/resources/500_gray00003.xml', path)
+    document = OCRDocument(str(path_shared))
+
+    # act
+    for step in _post_chain():
+        step.path_in = str(path_alone)
+        step.execute()
+    for step in _post_chain():
+        step.path_in = str(path_shared)
+        step.document = document
+        step.execute()
+    unsaved = path_shared.read_bytes()
+    document.save()
+
+    # assert
+    original = pathlib.Path('./tests/resources/500_gray00003.xml').read_bytes()
+    assert unsaved == original
+    assert path_shared.read_bytes() == path_alone.read_bytes()
+    assert path_alone.read_bytes() != original
+
+
+def test_step_document_reset(tmp_path):
+    """Document of previous page is dropped with reset"""
+
+    # arrange
+    step = StepPostReplaceChars({'dict_chars': {'ſ': 's'}})
+    step.document = OCRDocument(str(tmp_path / 'prev.xml'))
+
+    # act
+    step.reset()
+
+    # assert
+    assert step.document is None
+
+
+@pytest.mark.parametrize('fixture', ['500_gray00003.xml',
+                                     '1667522809_J_0073_0512.xml',
+                                     '16331001.xml'])
+def test_format_xml_like_round_trip(fixture):
+    """Single pass yields same bytes as serialize, reparse
+    without blank text and serialize again"""
+
+    # arrange
+    xml_root = ET.parse(f'./tests/resources/{fixture}')
+    expected = _format_xml_reparsed(copy.deepcopy(xml_root).getroot())
+
+    # act
+    formatted = format_xml(xml_root)
+
+    # assert
+    assert formatted == expected
+    assert format_xml(xml_root) == expected
+
+
+@pytest.mark.parametrize('xml', [
+    '<a>\n <b> </b>\n <c>x<d/> <e/>\n</c> <f> <g/> </f><!--c--> <h/></a>',
+    '<a><b>x</b> <c/>tail <d/> </a>',
+    '<a> <?pi x?> <b></b><c>\t</c></a>',
+    '<a>\n <b xml:space="preserve">\n <c/> <d> <e/> </d></b></a>'])
+def test_format_xml_blank_text_like_round_trip(xml):
+    """Blank text is kept where libxml2 doesn't consider
+    it ignorable, like in mixed content"""
+
+    # arrange
+    expected = _format_xml_reparsed(ET.fromstring(xml))
+
+    # act
+    formatted = format_xml(ET.fromstring(xml))
+
+    # assert
+    assert formatted == expected